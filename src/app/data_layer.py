@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+SCORES_PATH = "artifacts/scores.csv"
+MAX_PICKER_OPTIONS = 200  # Upper bound on the options a session picker renders
+
+
+class ScoreData:
+    """
+    Read-only view of artifacts/scores.csv with everything the dashboard
+    needs precomputed once per file version:
+
+    - rows ranked by hybrid_score, so the rows above a threshold are a prefix of
+      the ranking and counting them is a binary search;
+    - histogram bins of hybrid_score;
+    - session ids sorted as strings, so picker searches are prefix range lookups.
+    """
+
+    def __init__(self, df, bins=30):
+        self.df = df.reset_index(drop=True)
+        scores = self.scores = self.df["hybrid_score"].to_numpy(dtype=float)
+        # Descending ranking; ties keep file order
+        self.ranked = np.argsort(-scores, kind="stable")
+        self.ranked_scores = scores[self.ranked]
+        self._ascending_scores = self.ranked_scores[::-1]
+        self.hist_counts, self.hist_edges = np.histogram(scores, bins=bins)
+
+        ids = self.df["session_id"].astype(str).to_numpy(dtype=str)
+        self.id_order = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.id_order]
+
+    def __len__(self):
+        return len(self.df)
+
+    def count_above(self, threshold):
+        """Number of sessions with hybrid_score >= threshold."""
+        return len(self._ascending_scores) - int(np.searchsorted(self._ascending_scores, threshold, side="left"))
+
+    def anomalies_page(self, threshold, page, page_size):
+        """One page of the sessions above threshold, highest score first."""
+        n = self.count_above(threshold)
+        start = min(page * page_size, n)
+        return self.df.iloc[self.ranked[start:min(start + page_size, n)]]
+
+    def row(self, position):
+        return self.df.iloc[position]
+
+    def search(self, prefix, threshold, anomalous, limit=MAX_PICKER_OPTIONS):
+        """
+        Row positions of up to `limit` sessions on one side of the threshold
+        whose id starts with `prefix`. Without a prefix, returns the most
+        extreme sessions of that side (highest scores for anomalous, lowest
+        for normal).
+        """
+        n_above = self.count_above(threshold)
+        if not prefix:
+            if anomalous:
+                return self.ranked[:min(limit, n_above)]
+            return self.ranked[n_above:][::-1][:limit]
+
+        lo = np.searchsorted(self.sorted_ids, prefix, side="left")
+        hi = np.searchsorted(self.sorted_ids, prefix + "\U0010ffff", side="left")
+        matches = []
+        # Walk the id range in blocks so a short prefix does not touch every row
+        block = max(limit, 1024)
+        for start in range(lo, hi, block):
+            positions = self.id_order[start:min(start + block, hi)]
+            above = self.scores[positions] >= threshold
+            matches.extend(positions[above if anomalous else ~above][:limit - len(matches)].tolist())
+            if len(matches) >= limit:
+                break
+        return np.asarray(matches, dtype=np.int64)
+
+
+@st.cache_resource(max_entries=1)
+def _load(path, mtime):
+    # mtime is part of the cache key, so a rewritten scores file invalidates the entry
+    return ScoreData(pd.read_csv(path))
+
+
+def load_scores(path=SCORES_PATH):
+    """Returns the cached ScoreData for path, reloading only when the file changed."""
+    return _load(path, os.path.getmtime(path))
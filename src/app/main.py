@@ -1,103 +1,184 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import os, json
+import os, sys
 import plotly.express as px
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ingest.session_store import SessionStore
+from ingest.session_index import SessionIndex
+from data_layer import load_scores, MAX_PICKER_OPTIONS
+# The model scripts import their siblings directly, so load them the same way
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+from explain import EXPLANATIONS_PATH, ExplanationCache, explain_session
+from calibration import MODEL_PATHS, artifact_digest
+
+SESSION_STORE_PATH = "logs/sessions.store"
+
+@st.cache_resource
+def get_session_index(log_path="logs/sessions.jsonl"):
+    # Kept across reruns; the index checks the log's size/mtime on every lookup
+    return SessionIndex(log_path)
+
+@st.cache_resource(max_entries=1)
+def get_session_store(path, version):
+    # One store per version of its meta.json (written last), so the id index
+    # that find() builds on first use is kept across reruns and clicks
+    store = SessionStore(path)
+    store.find(None)
+    return store
+
+def load_events(session_id):
+    """Returns a session's events, from the binary session store when one exists."""
+    if os.path.exists(SESSION_STORE_PATH):
+        version = os.path.getmtime(os.path.join(SESSION_STORE_PATH, "meta.json"))
+        store = get_session_store(SESSION_STORE_PATH, version)
+        i = store.find(session_id)
+        return pd.DataFrame(store.events(i)) if i is not None else pd.DataFrame()
+    record = get_session_index().lookup(session_id)
+    return pd.DataFrame(record["events"]) if record else pd.DataFrame()
+
+def session_picker(label, data, threshold, anomalous, key):
+    """Searchable session picker; returns the row position of the chosen session."""
+    query = st.text_input(f"Search {label.lower()} by ID prefix", key=f"{key}_search")
+    options = data.search(query.strip(), threshold, anomalous)
+    if len(options) == 0:
+        st.info("No matching sessions.")
+        return None
+    if len(options) == MAX_PICKER_OPTIONS:
+        st.caption(f"Showing the first {MAX_PICKER_OPTIONS} matches; refine the search to narrow it down.")
+    session_ids = data.df["session_id"]
+    return st.selectbox(label, options.tolist(), key=key,
+                        format_func=lambda pos: str(session_ids.iat[pos]))
+
+@st.cache_resource
+def score_histogram(counts, edges):
+    fig, ax = plt.subplots()
+    ax.stairs(counts, edges, fill=True, edgecolor="black")
+    ax.set_xlabel("Hybrid Score")
+    ax.set_ylabel("Count")
+    return fig
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+@st.cache_resource(max_entries=1)
+def get_explanation_cache(path, mtime):
+    # Reloaded only when explanations.csv changed, for example after a miss was appended
+    return ExplanationCache(path)
+
+@st.cache_resource(max_entries=1)
+def model_digest(path, mtime):
+    return artifact_digest(path)
+
+def show_explanation(session_data):
+    """Bar chart of the Isolation Forest's SHAP attributions for one session."""
+    model_path = MODEL_PATHS["iforest"]
+    try:
+        contributions, base_value = explain_session(
+            session_data["session_id"], session_data, model_path,
+            cache=get_explanation_cache(EXPLANATIONS_PATH, _mtime(EXPLANATIONS_PATH)),
+            model_version=model_digest(model_path, _mtime(model_path)))
+    except ImportError:
+        st.info("Install shap to see why this session was flagged.")
+        return
+    except Exception as exc:
+        st.warning(f"⚠️ Could not explain this session: {exc}")
+        return
+    contributions = contributions.sort_values()
+    fig = px.bar(x=contributions.values, y=contributions.index, orientation="h",
+                 labels={"x": "Contribution to anomaly score", "y": "Feature"},
+                 title="Why the Isolation Forest flagged this session")
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Positive values push the session towards anomalous (base value {base_value:.3f}). "
+               f"The LSTM part of the hybrid score ({session_data['lstm_score']:.3f}) is not covered.")
+
+def have_session_log():
+    return os.path.exists(SESSION_STORE_PATH) or os.path.exists("logs/sessions.jsonl")
+
 st.title("🔍 Web Anomaly Detection Dashboard")
 
 # Check if scores file exists
 if not os.path.exists("artifacts/scores.csv"):
     st.warning("⚠️ No scores found. Please run fuse.py to generate artifacts/scores.csv.")
 else:
-    df = pd.read_csv("artifacts/scores.csv")
+    # Loaded once per version of the file; see data_layer.ScoreData
+    data = load_scores("artifacts/scores.csv")
+    df = data.df
 
     st.subheader("Dataset Overview")
     st.dataframe(df.head())
 
     st.subheader("Hybrid Anomaly Score Distribution")
-    fig, ax = plt.subplots()
-    ax.hist(df["hybrid_score"], bins=30, edgecolor="black")
-    ax.set_xlabel("Hybrid Score")
-    ax.set_ylabel("Count")
-    st.pyplot(fig)
+    st.pyplot(score_histogram(data.hist_counts, data.hist_edges))
 
     st.subheader("Anomaly Threshold")
     threshold = st.slider("Set threshold", 0.0, 1.0, 0.7)
-    anomalies = df[df["hybrid_score"] >= threshold]
+    n_anomalies = data.count_above(threshold)
 
-    st.write(f"Detected {len(anomalies)} anomalies above threshold {threshold}")
-    st.dataframe(anomalies.sort_values("hybrid_score", ascending=False).head(20))
+    st.write(f"Detected {n_anomalies} anomalies above threshold {threshold}")
+    page_size = 20
+    n_pages = max(1, -(-n_anomalies // page_size))
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+    st.dataframe(data.anomalies_page(threshold, page - 1, page_size))
 
     st.subheader("Inspect Session")
-    if not anomalies.empty:
-        session_id = st.selectbox("Select Session ID", anomalies["session_id"].unique())
-        session_data = df[df["session_id"] == session_id].iloc[0]
-        st.json(session_data.to_dict())
-
-        # 🔎 Timeline visualization (using raw logs)
-        if os.path.exists("logs/sessions.jsonl"):
-            events = []
-            with open("logs/sessions.jsonl") as f:
-                for line in f:
-                    s = json.loads(line)
-                    if str(s["session_id"]) == str(session_id):
-                        events = s["events"]
-                        break
-
-            if events:
-                ev_df = pd.DataFrame(events)
-                fig2 = px.line(ev_df, x="t_rel_ms", y="page", markers=True,
-                               title=f"Session {session_id} Timeline",
-                               labels={"t_rel_ms":"Time (ms)", "page":"Visited Page"})
-                st.plotly_chart(fig2, use_container_width=True)
-            else:
-                st.info("No event data found for this session.")
+    if n_anomalies > 0:
+        position = session_picker("Select Session ID", data, threshold, anomalous=True, key="inspect")
+        if position is not None:
+            session_data = data.row(position)
+            session_id = session_data["session_id"]
+            st.json(session_data.to_dict())
+            show_explanation(session_data)
+
+            # 🔎 Timeline visualization (using raw logs)
+            if have_session_log():
+                ev_df = load_events(session_id)
+
+                if not ev_df.empty:
+                    fig2 = px.line(ev_df, x="t_rel_ms", y="page", markers=True,
+                                   title=f"Session {session_id} Timeline",
+                                   labels={"t_rel_ms":"Time (ms)", "page":"Visited Page"})
+                    st.plotly_chart(fig2, use_container_width=True)
+                else:
+                    st.info("No event data found for this session.")
     # 🔎 Side-by-Side Session Comparison
     st.subheader("Compare Normal vs Anomalous Session Timelines")
 
-    if os.path.exists("logs/sessions.jsonl"):
+    if have_session_log():
 
         # Split sessions into normal & anomalous based on threshold
-        normal_sessions = df[df["hybrid_score"] < threshold]["session_id"].unique()
-        anomalous_sessions = df[df["hybrid_score"] >= threshold]["session_id"].unique()
-
-        if len(normal_sessions) > 0 and len(anomalous_sessions) > 0:
+        if 0 < n_anomalies < len(data):
             col1, col2 = st.columns(2)
 
             with col1:
-                normal_choice = st.selectbox("Select Normal Session", normal_sessions, key="norm")
+                normal_pos = session_picker("Select Normal Session", data, threshold, anomalous=False, key="norm")
             with col2:
-                anom_choice = st.selectbox("Select Anomalous Session", anomalous_sessions, key="anom")
-
-            def load_events(session_id):
-                with open("logs/sessions.jsonl") as f:
-                    for line in f:
-                        s = json.loads(line)
-                        if str(s["session_id"]) == str(session_id):
-                            return pd.DataFrame(s["events"])
-                return pd.DataFrame()
-
-            norm_ev = load_events(normal_choice)
-            anom_ev = load_events(anom_choice)
-
-            if not norm_ev.empty and not anom_ev.empty:
-                col1, col2 = st.columns(2)
-
-                with col1:
-                    st.markdown(f"### Normal Session {normal_choice}")
-                    fig_norm = px.line(norm_ev, x="t_rel_ms", y="page", markers=True,
-                                       title="Navigation Timeline",
-                                       labels={"t_rel_ms":"Time (ms)", "page":"Page"})
-                    st.plotly_chart(fig_norm, use_container_width=True)
-
-                with col2:
-                    st.markdown(f"### Anomalous Session {anom_choice}")
-                    fig_anom = px.line(anom_ev, x="t_rel_ms", y="page", markers=True,
-                                       title="Navigation Timeline",
-                                       labels={"t_rel_ms":"Time (ms)", "page":"Page"})
-                    st.plotly_chart(fig_anom, use_container_width=True)
-            else:
-                st.info("Could not load events for selected sessions.")
+                anom_pos = session_picker("Select Anomalous Session", data, threshold, anomalous=True, key="anom")
+
+            if normal_pos is not None and anom_pos is not None:
+                normal_choice = df["session_id"].iat[normal_pos]
+                anom_choice = df["session_id"].iat[anom_pos]
+                norm_ev = load_events(normal_choice)
+                anom_ev = load_events(anom_choice)
+
+                if not norm_ev.empty and not anom_ev.empty:
+                    col1, col2 = st.columns(2)
+
+                    with col1:
+                        st.markdown(f"### Normal Session {normal_choice}")
+                        fig_norm = px.line(norm_ev, x="t_rel_ms", y="page", markers=True,
+                                           title="Navigation Timeline",
+                                           labels={"t_rel_ms":"Time (ms)", "page":"Page"})
+                        st.plotly_chart(fig_norm, use_container_width=True)
+
+                    with col2:
+                        st.markdown(f"### Anomalous Session {anom_choice}")
+                        fig_anom = px.line(anom_ev, x="t_rel_ms", y="page", markers=True,
+                                           title="Navigation Timeline",
+                                           labels={"t_rel_ms":"Time (ms)", "page":"Page"})
+                        st.plotly_chart(fig_anom, use_container_width=True)
+                else:
+                    st.info("Could not load events for selected sessions.")
         else:
             st.warning("Not enough normal or anomalous sessions for comparison.")
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+# End-to-end benchmark of the pipeline stages at several log sizes. Every
+# size gets its own working directory with the logs/ data/ artifacts/
+# layout the scripts expect, and every stage runs as a child process so its
+# wall time and peak RSS (from os.wait4) are its own.
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_SIZES = [10000, 100000, 1000000, 10000000]
+RESULTS_PATH = "artifacts/bench/results.json"
+BASELINE_PATH = "artifacts/bench/baseline.json"
+
+# (stage, script under src/, arguments, inputs, artifacts it writes); {n} and
+# {lstm_epochs} are filled in per run. make_features and the LSTM read the
+# log in chunks, so every size measures the paths that scale to it.
+STAGES = [
+    ("simulate", "simulate/generate_traffic.py", ["--sessions", "{n}"], [], ["logs/sessions.jsonl"]),
+    ("build_sessions", "ingest/build_sessions.py", [], ["logs/sessions.jsonl"], ["data/raw_sessions.csv"]),
+    ("make_features", "features/make_features.py", ["--stream"], ["logs/sessions.jsonl"],
+     ["data/features.csv", "data/sequences.jsonl"]),
+    ("isolation_forest", "models/isolation_forest.py", [], ["data/features.csv"], ["artifacts/models/iforest.pkl"]),
+    ("lstm_autoencoder", "models/lstm_autoencoder.py", ["--stream", "--epochs", "{lstm_epochs}"],
+     ["data/sequences.jsonl"], ["artifacts/models/lstm_ae.keras", "artifacts/models/lstm_ae.npz"]),
+    ("fuse", "models/fuse.py", [],
+     ["data/features.csv", "data/sequences.jsonl", "artifacts/models/iforest.pkl", "artifacts/models/lstm_ae.keras"],
+     ["artifacts/scores.csv"]),
+    ("evaluate", "eval/evaluate.py", [], ["artifacts/scores.csv"], ["artifacts/reports"]),
+]
+
+
+def _size_on_disk(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def run_stage(script, args, workdir, log_path):
+    """
+    Runs one stage script in workdir and returns (returncode, seconds,
+    peak_rss_mb). wait4 reports the largest RSS of the child and of any
+    processes it started and waited for, such as pool workers.
+    """
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3", PYTHONUNBUFFERED="1")
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(SRC_DIR, script), *args], cwd=workdir,
+                                stdout=log, stderr=subprocess.STDOUT, env=env)
+        _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, seconds, usage.ru_maxrss / 1024  # ru_maxrss is in KiB on Linux
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "started": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def _save(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp, path)
+
+
+def missing_inputs(stages, run_dir):
+    """Inputs of the selected stages that no earlier selected stage writes and that are not in run_dir."""
+    written = set()
+    missing = []
+    for stage, _, _, inputs, outputs in STAGES:
+        if stage not in stages:
+            continue
+        missing += [p for p in inputs if p not in written and not os.path.exists(os.path.join(run_dir, p))]
+        written.update(outputs)
+    return sorted(set(missing))
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, stages=None, workdir="artifacts/bench/work", results_path=RESULTS_PATH,
+                  lstm_epochs=1, keep_workdirs=False):
+    """
+    Runs the selected stages (all by default, in pipeline order) at every
+    size and writes the results after each stage. A failing stage stops the
+    remaining stages of its size; its log stays in the working directory.
+    A subset of the stages needs the inputs an earlier run left in the
+    working directory of each size, and the directory is kept afterwards.
+    """
+    results = {"meta": _metadata(), "runs": []}
+    for n in sizes:
+        run_dir = os.path.abspath(os.path.join(workdir, str(n)))
+        if stages:
+            missing = missing_inputs(stages, run_dir)
+            if missing:
+                print(f"{n:>10,} skipped: {', '.join(missing)} not in {run_dir}; "
+                      f"run the earlier stages with --keep-workdirs first")
+                continue
+        for sub in ("logs", "data", "artifacts/models", "artifacts/reports"):
+            os.makedirs(os.path.join(run_dir, sub), exist_ok=True)
+        failed = False
+        for stage, script, args, _, outputs in STAGES:
+            if stages and stage not in stages:
+                continue
+            args = [a.format(n=n, lstm_epochs=lstm_epochs) for a in args]
+            returncode, seconds, peak_rss_mb = run_stage(script, args, run_dir, os.path.join(run_dir, f"{stage}.log"))
+            run = {"sessions": n, "stage": stage, "returncode": returncode, "seconds": round(seconds, 3),
+                   "sessions_per_sec": round(n / seconds, 1), "peak_rss_mb": round(peak_rss_mb, 1),
+                   "artifact_bytes": sum(_size_on_disk(os.path.join(run_dir, p)) for p in outputs)}
+            results["runs"].append(run)
+            _save(results, results_path)
+            status = "ok" if returncode == 0 else f"FAILED ({returncode}), see {stage}.log"
+            print(f"{n:>10,} {stage:<17} {seconds:>9.2f}s {run['sessions_per_sec']:>12,.0f} sessions/s "
+                  f"{peak_rss_mb:>8.0f} MB RSS {run['artifact_bytes'] / 1e6:>9.1f} MB out  {status}")
+            if returncode != 0:
+                failed = True
+                break
+        if not keep_workdirs and not stages and not failed:
+            shutil.rmtree(run_dir)
+    print(f"Saved -> {results_path}")
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, min_seconds=0.5):
+    """
+    Regressions of results against baseline, matched on (sessions, stage):
+    wall time or peak RSS more than tolerance above the baseline. Time
+    differences under min_seconds are ignored as noise.
+    """
+    base = {(r["sessions"], r["stage"]): r for r in baseline["runs"] if r["returncode"] == 0}
+    regressions = []
+    for run in results["runs"]:
+        ref = base.get((run["sessions"], run["stage"]))
+        if ref is None:
+            continue
+        if run["returncode"] != 0:
+            regressions.append((run, "failed", None, None))
+            continue
+        if run["seconds"] > ref["seconds"] * (1 + tolerance) and run["seconds"] - ref["seconds"] >= min_seconds:
+            regressions.append((run, "seconds", ref["seconds"], run["seconds"]))
+        if run["peak_rss_mb"] > ref["peak_rss_mb"] * (1 + tolerance):
+            regressions.append((run, "peak_rss_mb", ref["peak_rss_mb"], run["peak_rss_mb"]))
+    return regressions
+
+
+def main(sizes, stages=None, workdir="artifacts/bench/work", results_path=RESULTS_PATH, baseline_path=BASELINE_PATH,
+         save_baseline=False, tolerance=0.2, lstm_epochs=1, keep_workdirs=False):
+    results = run_benchmark(sizes, stages, workdir, results_path, lstm_epochs, keep_workdirs)
+    if save_baseline:
+        _save(results, baseline_path)
+        print(f"Saved -> {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; rerun with --save-baseline to record one.")
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, tolerance)
+    if not regressions:
+        print(f"No regressions against {baseline_path} (tolerance {tolerance:.0%})")
+        return 0
+    print(f"⚠️ {len(regressions)} regression(s) against {baseline_path}:")
+    for run, metric, before, after in regressions:
+        if metric == "failed":
+            print(f"   - {run['stage']} @ {run['sessions']:,}: failed (returncode {run['returncode']})")
+        else:
+            print(f"   - {run['stage']} @ {run['sessions']:,}: {metric} {before} -> {after} "
+                  f"(+{after / before - 1:.0%})")
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage at several synthetic log sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="sessions per synthetic log")
+    parser.add_argument("--stages", nargs="+", choices=[s[0] for s in STAGES],
+                        help="run only these stages on the inputs a run with --keep-workdirs left in the "
+                             "working directory, which is then kept")
+    parser.add_argument("--workdir", default="artifacts/bench/work", help="one subdirectory per size is used")
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown / RSS growth vs the baseline")
+    parser.add_argument("--lstm-epochs", type=int, default=1)
+    parser.add_argument("--keep-workdirs", action="store_true", help="keep the generated logs and artifacts")
+    args = parser.parse_args()
+    sys.exit(main(args.sizes, args.stages, args.workdir, args.results, args.baseline, args.save_baseline,
+                  args.tolerance, args.lstm_epochs, args.keep_workdirs))
@@ -1,11 +1,14 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+import numpy as np
+import argparse
+import heapq
 import os
 
 def main():
     # Create reports directory if it doesn't exist
     os.makedirs("artifacts/reports", exist_ok=True)
-    
+
     # Load scores
     df = pd.read_csv("artifacts/scores.csv")
 
@@ -31,5 +34,118 @@ def main():
     print("\nSaved ranked anomalies to artifacts/reports/ranked_anomalies.csv")
     print("Saved score distribution plot to artifacts/reports/score_distribution.png")
 
+class RunningStats:
+    """count/mean/std/min/max of numeric columns, merged chunk by chunk (Chan et al.'s parallel variance)."""
+
+    def __init__(self):
+        self.columns = None
+        self.count = self.mean = self.m2 = self.min = self.max = None
+
+    def update(self, chunk):
+        count = chunk.count().to_numpy(dtype=float)
+        # Columns without values in this chunk contribute nothing
+        mean = np.nan_to_num(chunk.mean().to_numpy(dtype=float))
+        m2 = np.nan_to_num((chunk.var(ddof=0) * chunk.count()).to_numpy(dtype=float))
+        if self.count is None:
+            self.columns = chunk.columns
+            self.count, self.mean, self.m2 = count, mean, m2
+            self.min, self.max = chunk.min().to_numpy(), chunk.max().to_numpy()
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        share = np.divide(count, total, out=np.zeros_like(total), where=total > 0)
+        self.mean = self.mean + delta * share
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * share
+        self.count = total
+        self.min = np.fmin(self.min, chunk.min().to_numpy())
+        self.max = np.fmax(self.max, chunk.max().to_numpy())
+
+    def summary(self):
+        # Sample standard deviation, as describe() reports it
+        std = np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+        return pd.DataFrame([self.count, self.mean, std, self.min, self.max], columns=self.columns,
+                            index=["count", "mean", "std", "min", "max"])
+
+def main_stream(top_n=1000, chunk_size=100000, bins=50):
+    """
+    The report of main() for score files of any size, in one pass over
+    chunk_size rows at a time: running summary statistics, a fixed-bin
+    histogram of hybrid_score over [0, 1] (scores outside are counted in the
+    edge bins) and a bounded min-heap of the top_n sessions. Only those
+    top_n are written to ranked_anomalies.csv; memory depends on chunk_size
+    and top_n, not on the file. The summary covers the columns that are
+    numeric in the first chunk, and sessions without a hybrid_score are
+    left out of the histogram and the ranking.
+    """
+    os.makedirs("artifacts/reports", exist_ok=True)
+    stats = RunningStats()
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    counts = np.zeros(bins, dtype=np.int64)
+    # (score, -row number, row): the smallest score is evicted first and, among
+    # equal scores, the later row, so ties rank in file order like a stable sort
+    heap = []
+    row_number = n_unscored = 0
+    columns = numeric = None
+
+    for chunk in pd.read_csv("artifacts/scores.csv", chunksize=chunk_size, dtype={"session_id": str}):
+        if columns is None:
+            # A chunk that is all NaN or mixed in a column would infer other dtypes, so the first one decides
+            columns = chunk.columns
+            numeric = chunk.select_dtypes("number").columns
+        stats.update(chunk.reindex(columns=numeric).apply(pd.to_numeric, errors="coerce"))
+        scores = pd.to_numeric(chunk["hybrid_score"], errors="coerce").to_numpy(dtype=float)
+        scored = ~np.isnan(scores)
+        n_unscored += int(len(scores) - scored.sum())
+        counts += np.bincount(np.clip(np.searchsorted(edges, scores[scored], side="right") - 1, 0, bins - 1),
+                              minlength=bins)
+
+        # Only scored rows that beat the current minimum of a full heap can enter it
+        candidates = np.flatnonzero(scored)
+        if len(heap) == top_n:
+            candidates = candidates[scores[candidates] > heap[0][0]]
+        rows = chunk.iloc[candidates].itertuples(index=False, name=None)
+        for i, row in zip(candidates.tolist(), rows):
+            item = (scores[i], -(row_number + i), row)
+            if len(heap) < top_n:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        row_number += len(chunk)
+
+    if columns is None:
+        print("artifacts/scores.csv has no sessions.")
+        return
+    ranked = pd.DataFrame([row for _, _, row in sorted(heap, reverse=True)], columns=columns)
+
+    print(f"\n=== Dataset Summary ({row_number} sessions) ===")
+    print(stats.summary())
+    if n_unscored:
+        print(f"⚠️ {n_unscored} sessions without a hybrid_score are not ranked")
+
+    print("\n=== Top 10 Anomalous Sessions ===")
+    print(ranked.head(10))
+
+    plt.figure()
+    plt.stairs(counts, edges, fill=True, edgecolor="black")
+    plt.title("Hybrid Anomaly Score Distribution")
+    plt.xlabel("Hybrid Score")
+    plt.ylabel("Count")
+    plt.savefig("artifacts/reports/score_distribution.png")
+    plt.close()
+
+    ranked.to_csv("artifacts/reports/ranked_anomalies.csv", index=False)
+    print(f"\nSaved top {len(ranked)} ranked anomalies to artifacts/reports/ranked_anomalies.csv")
+    print("Saved score distribution plot to artifacts/reports/score_distribution.png")
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Summarize artifacts/scores.csv and rank the anomalies")
+    parser.add_argument("--stream", action="store_true",
+                        help="one pass in chunks with bounded memory; ranks only the top sessions")
+    parser.add_argument("--top-n", type=int, default=1000, help="sessions kept in the ranking with --stream")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="rows read at a time with --stream")
+    parser.add_argument("--bins", type=int, default=50, help="histogram bins over [0, 1] with --stream")
+    args = parser.parse_args()
+    if args.stream:
+        main_stream(top_n=args.top_n, chunk_size=args.chunk_size, bins=args.bins)
+    else:
+        main()
@@ -0,0 +1,186 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+from fuse import IFOREST_WEIGHT
+
+# Tunes the fusion weights of the hybrid score on cached component scores.
+# For each weight the blended scores are sorted once; cumulative sums of the
+# labels in that order give the confusion counts at every threshold, so AUC
+# and the best F1 over all thresholds come out of one pass. Bootstrap
+# replicates reuse the same order: a resample only changes how often each
+# session counts, which is a weighted cumulative sum, not a new sort.
+REPORT_PATH = "artifacts/reports/weight_search.csv"
+
+
+class SortedBlend:
+    """Blended scores for one iforest weight, sorted high to low, with the end of every run of tied scores."""
+
+    def __init__(self, iforest_score, lstm_score, iforest_weight):
+        scores = iforest_weight * iforest_score + (1 - iforest_weight) * lstm_score
+        self.order = np.argsort(-scores)  # Tied scores form one curve point, so any sort order will do
+        self.scores = scores[self.order]
+        # A threshold admits all tied scores at once, so the curve only has a point after each run
+        self.last = np.append(np.flatnonzero(np.diff(self.scores)), len(scores) - 1)
+
+
+def curve_metrics(blend, labels, counts=None):
+    """
+    (auc, best_f1, threshold, precision, recall) of a blend, where labels
+    are in the blend's order. counts (also in that order) weights each
+    session, which is how bootstrap resamples are scored.
+    """
+    if counts is None:
+        tp = np.cumsum(labels)[blend.last]
+        fp = blend.last + 1 - tp
+    else:
+        tp = np.cumsum(counts * labels)[blend.last]
+        fp = np.cumsum(counts)[blend.last] - tp
+    n_pos, n_neg = tp[-1], fp[-1]
+    if n_pos == 0 or n_neg == 0:
+        return np.nan, np.nan, np.nan, np.nan, np.nan
+    # ROC AUC with the trapezoidal rule, which scores ties as half, like sklearn
+    tpr = np.concatenate([[0.0], tp / n_pos])
+    fpr = np.concatenate([[0.0], fp / n_neg])
+    auc = np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)
+    f1 = 2 * tp / (tp + fp + n_pos)
+    best = f1.argmax()
+    return auc, f1[best], blend.scores[blend.last[best]], tp[best] / (tp[best] + fp[best]), tp[best] / n_pos
+
+
+_blends = None
+_labels = None
+
+
+def _init_worker(iforest_score, lstm_score, labels, weights):
+    global _blends, _labels
+    _blends = [SortedBlend(iforest_score, lstm_score, w) for w in weights]
+    _labels = [labels[blend.order] for blend in _blends]
+
+
+def _bootstrap_chunk(task):
+    """AUC and best F1 of every weight on n_replicates resamples; the random stream is (seed, chunk)."""
+    seed, chunk, n_replicates = task
+    rng = np.random.default_rng([seed, chunk])
+    n = len(_labels[0])
+    results = np.empty((n_replicates, len(_blends), 2))
+    for r in range(n_replicates):
+        # How often each session is drawn in a resample of size n, with replacement
+        counts = np.bincount(rng.integers(0, n, size=n), minlength=n)
+        for i, (blend, labels) in enumerate(zip(_blends, _labels)):
+            results[r, i] = curve_metrics(blend, labels, counts[blend.order])[:2]
+    return results
+
+
+def bootstrap(iforest_score, lstm_score, labels, weights, n_replicates=200, n_workers=1, seed=0, ci=0.95):
+    """
+    Percentile confidence intervals of AUC and best F1 for every weight as
+    arrays (auc_lo, auc_hi, f1_lo, f1_hi). Replicates are split into one
+    chunk per worker; each worker sorts the blends once.
+    """
+    n_workers = max(1, min(n_workers, n_replicates))
+    sizes = [n_replicates // n_workers + (i < n_replicates % n_workers) for i in range(n_workers)]
+    tasks = [(seed, i, size) for i, size in enumerate(sizes)]
+    initargs = (iforest_score, lstm_score, labels, weights)
+    if n_workers == 1:
+        _init_worker(*initargs)
+        results = [_bootstrap_chunk(tasks[0])]
+    else:
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_bootstrap_chunk, tasks))
+    results = np.concatenate(results)
+    alpha = (1 - ci) / 2
+    lo, hi = np.nanquantile(results, [alpha, 1 - alpha], axis=0)
+    return lo[:, 0], hi[:, 0], lo[:, 1], hi[:, 1]
+
+
+def sweep(iforest_score, lstm_score, labels, weights):
+    """AUC and the best-F1 threshold of every iforest weight (the LSTM gets the rest) as a DataFrame."""
+    iforest_score = np.asarray(iforest_score, dtype=np.float64)
+    lstm_score = np.asarray(lstm_score, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    rows = []
+    for w in weights:
+        blend = SortedBlend(iforest_score, lstm_score, w)
+        auc, f1, threshold, precision, recall = curve_metrics(blend, labels[blend.order])
+        rows.append({"iforest_weight": w, "lstm_weight": 1 - w, "auc": auc, "best_f1": f1, "threshold": threshold,
+                     "precision": precision, "recall": recall})
+    return pd.DataFrame(rows)
+
+
+def check(n_rows=20000, seed=0):
+    """Compares the sweep with sklearn on random scores with many ties."""
+    from sklearn.metrics import f1_score, roc_auc_score
+
+    rng = np.random.default_rng(seed)
+    labels = (rng.random(n_rows) < 0.1).astype(int)
+    iforest_score = np.round(rng.random(n_rows) + 0.3 * labels, 2)
+    lstm_score = np.round(rng.random(n_rows) + 0.5 * labels, 2)
+    for row in sweep(iforest_score, lstm_score, labels, [0.0, 0.4, 1.0]).itertuples():
+        scores = row.iforest_weight * iforest_score + row.lstm_weight * lstm_score
+        auc = roc_auc_score(labels, scores)
+        f1 = f1_score(labels, scores >= row.threshold)
+        print(f"weight {row.iforest_weight:.1f}: AUC {row.auc:.6f} vs sklearn {auc:.6f}, "
+              f"F1 {row.best_f1:.6f} vs sklearn {f1:.6f}")
+
+
+def main(scores_path="artifacts/scores.csv", steps=21, n_replicates=200, n_workers=1, seed=0, ci_top=3):
+    """
+    Sweeps steps iforest weights over [0, 1] and writes the report. The
+    bootstrap CIs cover the ci_top weights with the best F1 and the weights
+    fuse.py uses now.
+    """
+    df = pd.read_csv(scores_path, usecols=["iforest_score", "lstm_score", "label"])
+    iforest_score = df["iforest_score"].to_numpy(dtype=np.float64)
+    lstm_score = df["lstm_score"].to_numpy(dtype=np.float64)
+    labels = df["label"].to_numpy(dtype=np.int64)
+    weights = np.round(np.linspace(0, 1, steps), 6)
+
+    start = time.perf_counter()
+    report = sweep(iforest_score, lstm_score, labels, weights)
+    print(f"Swept {len(weights)} weights x all thresholds on {len(df):,} sessions in "
+          f"{time.perf_counter() - start:.2f}s")
+    current = (report["iforest_weight"] - IFOREST_WEIGHT).abs().idxmin()
+    if n_replicates:
+        shortlist = sorted(set(report["best_f1"].nlargest(ci_top).index) | {current})
+        start = time.perf_counter()
+        intervals = bootstrap(iforest_score, lstm_score, labels, weights[shortlist], n_replicates, n_workers, seed)
+        for column, values in zip(["auc_lo", "auc_hi", "f1_lo", "f1_hi"], intervals):
+            report.loc[shortlist, column] = values
+        print(f"{n_replicates} bootstrap replicates of {len(shortlist)} weights on {n_workers} workers in "
+              f"{time.perf_counter() - start:.2f}s")
+
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    report.to_csv(REPORT_PATH, index=False)
+    print(report.sort_values("best_f1", ascending=False).head(5).to_string(index=False,
+                                                                            float_format=lambda x: f"{x:.3f}"))
+    best = report.loc[report["best_f1"].idxmax()]
+    current = report.loc[current]
+    print(f"Best: iforest {best['iforest_weight']:.2f} / lstm {best['lstm_weight']:.2f} at threshold "
+          f"{best['threshold']:.3f} (F1 {best['best_f1']:.3f}, AUC {best['auc']:.3f})")
+    print(f"Current fuse.py weights: iforest {current['iforest_weight']:.2f} / lstm {current['lstm_weight']:.2f} "
+          f"(F1 {current['best_f1']:.3f}, AUC {current['auc']:.3f})")
+    print(f"Saved -> {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep fusion weights and thresholds on the cached component scores")
+    parser.add_argument("--scores", default="artifacts/scores.csv", help="needs iforest_score, lstm_score and label")
+    parser.add_argument("--steps", type=int, default=21, help="iforest weights tried, evenly spaced over [0, 1]")
+    parser.add_argument("--bootstrap", type=int, default=200, help="bootstrap replicates for the CIs (0: none)")
+    parser.add_argument("--ci-top", type=int, default=3, help="weights with the best F1 that get bootstrap CIs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for the bootstrap")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="compare the sweep with sklearn and exit")
+    args = parser.parse_args()
+    if args.check:
+        check()
+    else:
+        main(args.scores, steps=args.steps, n_replicates=args.bootstrap, n_workers=args.workers, seed=args.seed,
+             ci_top=args.ci_top)
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import entropy
+
+FEATURE_COLS = [
+    "session_duration", "n_events", "click_rate",
+    "avg_dwell_time", "click_variance", "page_entropy"
+]
+
+# Reserved page name for pages that are not in a frozen page map
+UNKNOWN_PAGE = "<unknown>"
+
+
+def flatten_sessions(sessions, page_map, unknown_code=None):
+    """
+    Flattens a list of sessions into contiguous columnar arrays.
+
+    Returns (session_ids, timestamps, page_codes, offsets) where the events of
+    session i live in timestamps[offsets[i]:offsets[i + 1]]. Pages missing
+    from page_map are encoded as unknown_code when it is given.
+    """
+    session_ids = []
+    lengths = []
+    timestamps = []
+    page_codes = []
+    for s in sessions:
+        events = s["events"]
+        session_ids.append(s["session_id"])
+        lengths.append(len(events))
+        for e in events:
+            timestamps.append(e["t_rel_ms"])
+            if unknown_code is None:
+                page_codes.append(page_map[e["page"]])
+            else:
+                page_codes.append(page_map.get(e["page"], unknown_code))
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return (
+        session_ids,
+        np.asarray(timestamps, dtype=np.int64),
+        np.asarray(page_codes, dtype=np.int32),
+        offsets,
+    )
+
+
+def compute_features_batch(timestamps, page_codes, offsets, n_pages=None):
+    """
+    Computes the tabular features of calculate_features for all sessions at once.
+
+    Sessions are slices of the flat event arrays. The variance and the page
+    entropy are computed for all sessions of the same shape in one call, with
+    the same numpy/scipy reductions calculate_features uses, so the values are
+    identical to it and not just close. Returns a dict of arrays keyed by
+    FEATURE_COLS.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    timestamps = np.asarray(timestamps)
+    page_codes = np.asarray(page_codes)
+    n_sessions = len(offsets) - 1
+    lengths = np.diff(offsets)
+    has_events = lengths > 0
+    seg = np.repeat(np.arange(n_sessions), lengths)
+
+    # Total time of the session is the timestamp of its last event
+    session_duration = np.zeros(n_sessions, dtype=timestamps.dtype)
+    session_duration[has_events] = timestamps[offsets[1:][has_events] - 1]
+
+    # Dwell times: difference to the previous event, or to 0 for the first one
+    dwell_times = np.diff(timestamps, prepend=0)
+    starts = offsets[:-1][has_events]
+    dwell_times[starts] = timestamps[starts]
+
+    safe_lengths = np.maximum(lengths, 1)
+    # The dwell times telescope, so their sum is the session duration
+    avg_dwell_time = np.where(has_events, session_duration / safe_lengths, 0.0)
+
+    # np.var sums pairwise, so any other summation order can differ from
+    # calculate_features in the last bits; sessions of equal length go through
+    # np.var together, one row each, like page_entropy below
+    click_variance = np.zeros(n_sessions)
+    for n in np.unique(lengths[lengths > 1]):
+        rows = np.flatnonzero(lengths == n)
+        click_variance[rows] = np.var(dwell_times[offsets[rows, None] + np.arange(n)], axis=1)
+
+    seconds = session_duration / 1000
+    click_rate = np.divide(
+        lengths, seconds, out=np.zeros(n_sessions), where=session_duration > 0
+    )
+
+    # Page entropy from per-(session, page) visit counts. calculate_features
+    # passes the probabilities to scipy's entropy in first-visit order, so the
+    # pairs are put in that order and sessions with the same number of distinct
+    # pages go through entropy() together, one row each; summing in any other
+    # order changes the last bits of the result.
+    if n_pages is None:
+        n_pages = int(page_codes.max()) + 1 if len(page_codes) else 1
+    keys = seg.astype(np.int64) * n_pages + page_codes
+    pair_keys, first_visit, pair_counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(first_visit)
+    pair_seg = pair_keys[order] // n_pages
+    p = pair_counts[order] / lengths[pair_seg]
+    n_distinct = np.bincount(pair_seg, minlength=n_sessions)
+    pair_starts = np.cumsum(n_distinct) - n_distinct
+    page_entropy = np.zeros(n_sessions)
+    for k in np.unique(n_distinct[has_events]):
+        rows = np.flatnonzero(n_distinct == k)
+        page_entropy[rows] = entropy(p[pair_starts[rows, None] + np.arange(k)], base=2, axis=1)
+
+    return {
+        "session_duration": session_duration,
+        "n_events": lengths,
+        "click_rate": click_rate,
+        "avg_dwell_time": avg_dwell_time,
+        "click_variance": click_variance,
+        "page_entropy": page_entropy,
+    }
+
+
+def features_frame(session_ids, features):
+    """Builds the data/features.csv frame from compute_features_batch output."""
+    df = pd.DataFrame(features, columns=FEATURE_COLS)
+    df.insert(0, "session_id", session_ids)
+    return df
+
+
+def split_sequences(page_codes, offsets):
+    """Splits the flat page codes back into one encoded click sequence per session."""
+    return [s.tolist() for s in np.split(page_codes, offsets[1:-1])]
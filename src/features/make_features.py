@@ -3,7 +3,19 @@ import numpy as np
 import json
 from scipy.stats import entropy
 from collections import Counter
+from itertools import islice
+import argparse
 import os
+import sys
+
+from batch_features import (
+    FEATURE_COLS, UNKNOWN_PAGE, flatten_sessions, compute_features_batch, features_frame, split_sequences
+)
+from feature_accumulator import ACCUMULATOR_RTOL, SessionFeatureAccumulator
+from sharded_features import run_sharded
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ingest.session_store import SessionStore
 
 def calculate_features(session_events, page_map):
     """Calculates all features for a single session."""
@@ -49,10 +61,236 @@ def calculate_features(session_events, page_map):
     return features
 
 
-def main():
+def check_batch_engine(sessions_data, page_map, rtol=0):
+    """
+    Compares the batch engine against calculate_features, the reference
+    implementation, and returns the largest relative deviation per feature.
+    The default rtol=0 requires identical values, so both engines write the
+    same data/features.csv.
+    """
+    reference = pd.DataFrame([calculate_features(s["events"], page_map) for s in sessions_data])
+    session_ids, timestamps, page_codes, offsets = flatten_sessions(sessions_data, page_map)
+    batch = compute_features_batch(timestamps, page_codes, offsets, n_pages=len(page_map))
+
+    deviations = {}
+    for col in FEATURE_COLS:
+        expected = reference[col].to_numpy(dtype=float)
+        actual = np.asarray(batch[col], dtype=float)
+        if not np.allclose(actual, expected, rtol=rtol, atol=0):
+            raise AssertionError(f"Batch engine disagrees with calculate_features on '{col}'")
+        scale = np.maximum(np.abs(expected), np.finfo(float).tiny)
+        deviations[col] = float(np.max(np.abs(actual - expected) / scale)) if len(expected) else 0.0
+
+    for session, seq in zip(sessions_data, split_sequences(page_codes, offsets)):
+        if seq != [page_map[e["page"]] for e in session["events"]]:
+            raise AssertionError(f"Batch engine disagrees on the click sequence of {session['session_id']}")
+    return deviations
+
+
+def check_accumulator(sessions_data, page_map, rtol=ACCUMULATOR_RTOL):
+    """
+    Compares SessionFeatureAccumulator, fed one event at a time, against
+    calculate_features on finished sessions and returns the largest relative
+    deviation per feature. Integer features must match exactly.
+    """
+    deviations = dict.fromkeys(FEATURE_COLS, 0.0)
+    for s in sessions_data:
+        expected = calculate_features(s["events"], page_map)
+        actual = SessionFeatureAccumulator(page_map).update(s["events"]).features()
+        if actual["click_sequence"] != expected["click_sequence"]:
+            raise AssertionError(f"Accumulator disagrees on the click sequence of {s['session_id']}")
+        for col in FEATURE_COLS:
+            a, e = float(actual[col]), float(expected[col])
+            exact = col in ("session_duration", "n_events")
+            if (a != e) if exact else not np.isclose(a, e, rtol=rtol, atol=0):
+                raise AssertionError(f"Accumulator disagrees with calculate_features on '{col}' "
+                                     f"for {s['session_id']}: {a!r} != {e!r}")
+            deviations[col] = max(deviations[col], abs(a - e) / max(abs(e), np.finfo(float).tiny))
+    return deviations
+
+
+def iter_sessions(path="logs/sessions.jsonl"):
+    """Yields sessions from a JSONL log one at a time."""
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def iter_chunks(iterable, chunk_size):
+    """Groups an iterable into lists of at most chunk_size items."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_page_map(path):
+    """Loads an existing page map, or returns an empty one if there is none."""
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def stream_features(session_chunks, page_map, freeze_page_map=False):
+    """
+    Computes features chunk by chunk, yielding (features_df, session_ids, sequences).
+
+    page_map is updated in place: pages seen for the first time get the next
+    free code, so codes assigned in earlier chunks never change and one pass
+    over the log is enough. With freeze_page_map=True the map is left as is and
+    unseen pages are encoded with the reserved UNKNOWN_PAGE code instead.
+    """
+    unknown_code = None
+    if freeze_page_map:
+        unknown_code = page_map.setdefault(UNKNOWN_PAGE, len(page_map))
+
+    for chunk in session_chunks:
+        if not freeze_page_map:
+            for s in chunk:
+                for event in s["events"]:
+                    if event["page"] not in page_map:
+                        page_map[event["page"]] = len(page_map)
+
+        session_ids, timestamps, page_codes, offsets = flatten_sessions(chunk, page_map, unknown_code)
+        features = compute_features_batch(timestamps, page_codes, offsets, n_pages=len(page_map))
+        yield features_frame(session_ids, features), session_ids, split_sequences(page_codes, offsets)
+
+
+def main_streaming(chunk_size=50000, page_map_path="artifacts/models/page_map.json", freeze_page_map=False):
+    """
+    Streaming variant of main(): reads logs/sessions.jsonl in chunks and appends
+    to data/features.csv and data/sequences.jsonl as it goes, so memory is
+    bounded by the chunk size rather than the size of the log.
+
+    An existing page map at page_map_path is reused, which keeps page codes
+    stable across runs; the (possibly extended) map is saved back to it at
+    the end. Without one, pages get codes in the order they are first seen
+    and data/sequences.jsonl is recoded once at the end to the sorted codes
+    main() assigns, so both write the same files.
+    """
+    page_map = load_page_map(page_map_path)
+    new_map = not page_map and not freeze_page_map
+    os.makedirs(os.path.dirname(page_map_path) or ".", exist_ok=True)
+
+    chunks = iter_chunks(iter_sessions("logs/sessions.jsonl"), chunk_size)
+    n_sessions = 0
+    with open("data/features.csv", "w", newline="") as features_file, \
+            open("data/sequences.jsonl", "w") as sequences_file:
+        for i, (df_features, session_ids, sequences) in enumerate(
+                stream_features(chunks, page_map, freeze_page_map)):
+            df_features.to_csv(features_file, index=False, header=(i == 0))
+            for session_id, seq in zip(session_ids, sequences):
+                sequences_file.write(json.dumps({"session_id": session_id, "sequence": seq}) + "\n")
+            n_sessions += len(session_ids)
+
+        if n_sessions == 0:
+            pd.DataFrame(columns=['session_id'] + FEATURE_COLS).to_csv(features_file, index=False)
+
+    if new_map:
+        page_map = recode_sequences("data/sequences.jsonl", page_map)
+
+    print(f"Processed {n_sessions} sessions in chunks of {chunk_size}")
+    print("Saved -> data/features.csv")
+    print("Saved -> data/sequences.jsonl")
+
+    with open(page_map_path, "w") as f:
+        json.dump(page_map, f)
+    print(f"Saved -> {page_map_path}")
+
+
+def recode_sequences(sequences_path, page_map):
+    """
+    Rewrites the click sequences in sequences_path from the codes of
+    page_map to codes in sorted page order and returns the sorted map.
+    """
+    sorted_map = {page: i for i, page in enumerate(sorted(page_map))}
+    recode = np.empty(len(page_map), dtype=np.int64)
+    for page, code in page_map.items():
+        recode[code] = sorted_map[page]
+    if np.array_equal(recode, np.arange(len(recode))):
+        return sorted_map
+
+    tmp = sequences_path + ".tmp"
+    with open(sequences_path) as src, open(tmp, "w") as out:
+        for line in src:
+            record = json.loads(line)
+            record["sequence"] = recode[record["sequence"]].tolist() if record["sequence"] else []
+            out.write(json.dumps(record) + "\n")
+    os.replace(tmp, sequences_path)
+    return sorted_map
+
+
+def main_store(store_path, write_sequences=True, page_map_path="artifacts/models/page_map.json"):
+    """
+    Variant of main() that reads a binary session store (see
+    src/ingest/session_store.py). The memory-mapped event columns go straight
+    into the batch engine. The page codes are those of the existing page map
+    at page_map_path, extended in sorted order by pages it does not have, or
+    sorted page order when there is none; the store's codes are translated
+    to them, so the map is never rewritten with other codes.
+    """
+    store = SessionStore(store_path)
+    page_map = load_page_map(page_map_path)
+    known = dict(page_map)
+    for page in sorted(set(store.page_names) - set(page_map)):
+        page_map[page] = len(page_map)
+
+    pages = store.pages
+    recode = np.asarray([page_map[page] for page in store.page_names], dtype=store.pages.dtype)
+    if not np.array_equal(recode, np.arange(len(recode))):
+        print(f"⚠️ {store_path} codes pages differently from {page_map_path}; its sequences are recoded here, "
+              f"but models reading the store directly need it re-encoded with "
+              f"'session_store.py to-store --page-map {page_map_path}'.")
+        pages = recode[pages]
+
+    if page_map != known:
+        os.makedirs(os.path.dirname(page_map_path) or ".", exist_ok=True)
+        with open(page_map_path, "w") as f:
+            json.dump(page_map, f)
+        print(f"Saved -> {page_map_path}")
+
+    features = compute_features_batch(store.timestamps, pages, store.offsets, n_pages=len(page_map))
+    df_features = features_frame(store.session_ids, features)
+    df_features.to_csv("data/features.csv", index=False)
+    print("Saved -> data/features.csv")
+
+    if write_sequences:
+        with open("data/sequences.jsonl", "w") as f:
+            for session_id, seq in zip(store.session_ids, np.split(np.asarray(pages), np.asarray(store.offsets[1:-1]))):
+                f.write(json.dumps({"session_id": session_id, "sequence": seq.tolist()}) + "\n")
+        print("Saved -> data/sequences.jsonl")
+
+
+def main_parallel(n_workers):
+    """
+    Variant of main() that splits logs/sessions.jsonl into byte-range shards
+    and runs the batch engine on them in n_workers processes. The page map
+    and the row order are the same as main()'s.
+    """
+    os.makedirs("artifacts/models", exist_ok=True)
+    page_map, n_sessions = run_sharded("logs/sessions.jsonl", n_workers)
+    print(f"Processed {n_sessions} sessions with {n_workers} workers")
+    print("Saved -> data/features.csv")
+    print("Saved -> data/sequences.jsonl")
+
+    with open("artifacts/models/page_map.json", "w") as f:
+        json.dump(page_map, f)
+    print("Saved -> artifacts/models/page_map.json")
+
+
+def main(engine="batch", check=False):
     """
     Main function to read raw session logs, generate features,
     and save them into separate files for tabular and sequence models.
+
+    engine="batch" computes all sessions at once on flat columnar arrays;
+    engine="reference" runs calculate_features session by session;
+    engine="incremental" feeds each session's events through a
+    SessionFeatureAccumulator, as a live scorer would; its float features
+    match the other engines within ACCUMULATOR_RTOL, not bit for bit.
     """
     sessions_data = []
     with open("logs/sessions.jsonl") as f:
@@ -74,26 +312,46 @@ def main():
         json.dump(page_map, f)
     print("Saved -> artifacts/models/page_map.json")
 
-    # Calculate features for every session
-    all_features = []
-    for session in sessions_data:
-        session_id = session["session_id"]
-        events = session["events"]
-        
-        features = calculate_features(events, page_map)
-        features["session_id"] = session_id
-        all_features.append(features)
-
-    # Separate tabular features from the click sequences
-    tabular_features = []
-    sequences = {}
-    for f in all_features:
-        sequences[f["session_id"]] = f.pop("click_sequence")
-        tabular_features.append(f)
-        
-    # Create and save the tabular features to a CSV file
-    df_features = pd.DataFrame(tabular_features)
-    cols = ['session_id', 'session_duration', 'n_events', 'click_rate', 'avg_dwell_time', 'click_variance', 'page_entropy']
+    if check:
+        deviations = check_batch_engine(sessions_data, page_map)
+        print("Batch engine matches calculate_features (max relative deviation per feature):")
+        for col, dev in deviations.items():
+            print(f"   - {col}: {dev:.3e}")
+        deviations = check_accumulator(sessions_data, page_map)
+        print("Incremental accumulator matches calculate_features (max relative deviation per feature):")
+        for col, dev in deviations.items():
+            print(f"   - {col}: {dev:.3e}")
+
+    cols = ['session_id'] + FEATURE_COLS
+    if engine == "batch":
+        session_ids, timestamps, page_codes, offsets = flatten_sessions(sessions_data, page_map)
+        features = compute_features_batch(timestamps, page_codes, offsets, n_pages=len(page_map))
+        df_features = features_frame(session_ids, features)
+        sequences = dict(zip(session_ids, split_sequences(page_codes, offsets)))
+    else:
+        # Calculate features for every session
+        all_features = []
+        for session in sessions_data:
+            session_id = session["session_id"]
+            events = session["events"]
+
+            if engine == "incremental":
+                features = SessionFeatureAccumulator(page_map).update(events).features()
+            else:
+                features = calculate_features(events, page_map)
+            features["session_id"] = session_id
+            all_features.append(features)
+
+        # Separate tabular features from the click sequences
+        tabular_features = []
+        sequences = {}
+        for f in all_features:
+            sequences[f["session_id"]] = f.pop("click_sequence")
+            tabular_features.append(f)
+
+        df_features = pd.DataFrame(tabular_features)
+
+    # Save the tabular features to a CSV file
     df_features = df_features[cols]
     df_features.to_csv("data/features.csv", index=False)
     print("Saved -> data/features.csv")
@@ -106,4 +364,33 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build tabular features and click sequences from logs/sessions.jsonl")
+    parser.add_argument("--engine", choices=["batch", "reference", "incremental"], default="batch",
+                        help="batch: vectorized columnar engine; reference: per-session calculate_features; "
+                             "incremental: per-event feature accumulators (floats equal within 1e-9 relative)")
+    parser.add_argument("--check", action="store_true",
+                        help="verify the batch engine and the accumulators against calculate_features before writing")
+    parser.add_argument("--store",
+                        help="read sessions from a binary session store instead of logs/sessions.jsonl")
+    parser.add_argument("--no-sequences", action="store_true",
+                        help="with --store, skip data/sequences.jsonl (models can read the store directly)")
+    parser.add_argument("--stream", action="store_true",
+                        help="process the log in chunks with bounded memory (single pass)")
+    parser.add_argument("--chunk-size", type=int, default=50000,
+                        help="sessions per chunk in streaming mode")
+    parser.add_argument("--page-map", default="artifacts/models/page_map.json",
+                        help="existing page map to reuse in streaming and store mode")
+    parser.add_argument("--workers", type=int,
+                        help="split the log into shards and compute features in this many processes")
+    parser.add_argument("--freeze-page-map", action="store_true",
+                        help=f"do not extend the page map; encode unseen pages as '{UNKNOWN_PAGE}'")
+    args = parser.parse_args()
+    if args.store:
+        main_store(args.store, write_sequences=not args.no_sequences, page_map_path=args.page_map)
+    elif args.workers:
+        main_parallel(args.workers)
+    elif args.stream:
+        main_streaming(chunk_size=args.chunk_size, page_map_path=args.page_map,
+                       freeze_page_map=args.freeze_page_map)
+    else:
+        main(engine=args.engine, check=args.check)
@@ -0,0 +1,148 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_features import FEATURE_COLS, flatten_sessions, compute_features_batch, features_frame, split_sequences
+
+# Multi-process feature extraction over byte-range shards of a JSONL log.
+# Shard boundaries are moved forward to the next line start, so every line
+# belongs to exactly one shard. A first pass collects the pages of every
+# shard to build the shared page map; a second pass computes features and
+# sequences per shard into temporary files that are concatenated in shard
+# order, which keeps the log's row order whatever the number of workers.
+PAGE_PATTERN = re.compile(rb'"page":\s*("(?:[^"\\]|\\.)*")')
+SHARDS_PER_WORKER = 4  # More shards than workers evens out uneven shards
+
+_page_map = None
+
+
+def shard_ranges(path, n_shards):
+    """(start, end) byte ranges covering path, each starting at a line boundary."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, n_shards):
+            f.seek(max(size * i // n_shards, bounds[-1]))
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                f.readline()  # Finish the line the tentative boundary falls in
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _read_shard(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _shard_pages(task):
+    path, start, end = task
+    return {json.loads(raw) for raw in set(PAGE_PATTERN.findall(_read_shard(path, start, end)))}
+
+
+def _init_worker(page_map):
+    global _page_map
+    _page_map = page_map
+
+
+def _shard_features(task):
+    path, start, end, out_dir, index = task
+    sessions = [json.loads(line) for line in _read_shard(path, start, end).splitlines() if line.strip()]
+    session_ids, timestamps, page_codes, offsets = flatten_sessions(sessions, _page_map)
+    features = compute_features_batch(timestamps, page_codes, offsets, n_pages=len(_page_map))
+
+    features_path = os.path.join(out_dir, f"features_{index:05d}.csv")
+    features_frame(session_ids, features).to_csv(features_path, index=False, header=False)
+    sequences_path = os.path.join(out_dir, f"sequences_{index:05d}.jsonl")
+    with open(sequences_path, "w") as f:
+        for session_id, seq in zip(session_ids, split_sequences(page_codes, offsets)):
+            f.write(json.dumps({"session_id": session_id, "sequence": seq}) + "\n")
+    return features_path, sequences_path, len(sessions)
+
+
+def _concatenate(part_paths, out_path, header=None):
+    with open(out_path, "w") as out:
+        if header:
+            out.write(header)
+        for part in part_paths:
+            with open(part) as f:
+                shutil.copyfileobj(f, out)
+
+
+def run_sharded(log_path, n_workers, features_path="data/features.csv", sequences_path="data/sequences.jsonl"):
+    """
+    Writes features_path and sequences_path for log_path using n_workers
+    processes and returns (page_map, n_sessions). The page map is built the
+    way main() builds it (all pages, sorted), so the outputs match the
+    single-process batch engine row for row.
+    """
+    ranges = shard_ranges(log_path, max(1, n_workers * SHARDS_PER_WORKER))
+    with ProcessPoolExecutor(n_workers) as pool:
+        pages = set().union(*pool.map(_shard_pages, [(log_path, start, end) for start, end in ranges]))
+    page_map = {page: i for i, page in enumerate(sorted(pages))}
+
+    out_dir = os.path.dirname(features_path) or "."
+    os.makedirs(out_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=out_dir, prefix=".shards_") as tmp:
+        tasks = [(log_path, start, end, tmp, i) for i, (start, end) in enumerate(ranges)]
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(page_map,)) as pool:
+            parts = list(pool.map(_shard_features, tasks))
+        _concatenate([p[0] for p in parts], features_path, header=",".join(["session_id"] + FEATURE_COLS) + "\n")
+        _concatenate([p[1] for p in parts], sequences_path)
+    return page_map, sum(p[2] for p in parts)
+
+
+def make_synthetic_log(source_path, out_path, n_sessions):
+    """A log of n_sessions made by repeating the sessions of source_path under new ids."""
+    with open(source_path) as f:
+        sessions = [json.loads(line) for line in f]
+    with open(out_path, "w") as out:
+        for i, s in enumerate(itertools.islice(itertools.cycle(sessions), n_sessions)):
+            session_id = s["session_id"]
+            copy = f"{session_id}_{i}" if isinstance(session_id, str) else i
+            out.write(json.dumps({"session_id": copy, "events": s["events"]}) + "\n")
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def benchmark(n_sessions=1000000, worker_counts=(1, 2, 4, 8), source_path="logs/sessions.jsonl"):
+    """Scaling report: sessions/sec per worker count on a synthetic log, checking the outputs agree."""
+    print(f"Scaling report on {n_sessions:,} synthetic sessions ({os.cpu_count()} cores available)")
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "sessions.jsonl")
+        make_synthetic_log(source_path, log_path, n_sessions)
+        reference = None
+        baseline = None
+        for n_workers in worker_counts:
+            features_path = os.path.join(tmp, f"features_{n_workers}.csv")
+            sequences_path = os.path.join(tmp, f"sequences_{n_workers}.jsonl")
+            start = time.perf_counter()
+            run_sharded(log_path, n_workers, features_path, sequences_path)
+            rate = n_sessions / (time.perf_counter() - start)
+            baseline = baseline or rate
+            digests = (_digest(features_path), _digest(sequences_path))
+            reference = reference or digests
+            print(f"{n_workers:>3} workers: {rate:>10,.0f} sessions/s  speedup {rate / baseline:.2f}x  "
+                  f"({'same output' if digests == reference else 'OUTPUT DIFFERS'})")
+            os.remove(features_path)
+            os.remove(sequences_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling report for sharded feature extraction")
+    parser.add_argument("--sessions", type=int, default=1000000, help="size of the synthetic log")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    benchmark(n_sessions=args.sessions, worker_counts=args.workers)
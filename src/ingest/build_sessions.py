@@ -1,12 +1,32 @@
-import json, pandas as pd
-
-sessions = []
-with open("logs/sessions.jsonl") as f:
-    for line in f:
-        s = json.loads(line)
-        duration = s["events"][-1]["t_rel_ms"] if s["events"] else 0
-        sessions.append({"session_id": s["session_id"], "duration": duration, "n_events": len(s["events"])})
-
-df = pd.DataFrame(sessions)
-df.to_csv("data/raw_sessions.csv", index=False)
-print("Saved -> data/raw_sessions.csv")
+import json, argparse, pandas as pd
+import numpy as np
+
+from session_store import SessionStore
+
+def main(store_path=None):
+    """Summarizes each session's duration and event count into data/raw_sessions.csv."""
+    if store_path:
+        # Read the columns straight from the memory-mapped store
+        store = SessionStore(store_path)
+        lengths = store.lengths
+        duration = np.zeros(len(store), dtype=np.int64)
+        ends = np.asarray(store.offsets[1:])[lengths > 0] - 1
+        duration[lengths > 0] = store.timestamps[ends]
+        df = pd.DataFrame({"session_id": store.session_ids, "duration": duration, "n_events": lengths})
+    else:
+        sessions = []
+        with open("logs/sessions.jsonl") as f:
+            for line in f:
+                s = json.loads(line)
+                duration = s["events"][-1]["t_rel_ms"] if s["events"] else 0
+                sessions.append({"session_id": s["session_id"], "duration": duration, "n_events": len(s["events"])})
+        df = pd.DataFrame(sessions)
+
+    df.to_csv("data/raw_sessions.csv", index=False)
+    print("Saved -> data/raw_sessions.csv")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build data/raw_sessions.csv from the session log")
+    parser.add_argument("--store", help="read sessions from a binary session store instead of logs/sessions.jsonl")
+    args = parser.parse_args()
+    main(store_path=args.store)
@@ -1,6 +1,37 @@
 import pandas as pd
 import numpy as np
+import argparse
+import glob
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from quantile_sketch import KLLSketch
+
+# Quantiles the heuristic rules compare against
+RULE_QUANTILES = {
+    "click_rate": 0.95,
+    "session_duration": 0.10,
+    "n_events": 0.80,
+    "page_entropy": 0.05,
+}
+
+def apply_rules(df, thresholds):
+    """Heuristic anomaly labels (1 = anomaly) of the rows of df, given the rule thresholds."""
+    # Rule 1: Very high click rate (potential bot activity)
+    label = df['click_rate'] > thresholds['click_rate']
+    # Rule 2: Short session with many events (potential scraper)
+    label |= (df['session_duration'] < thresholds['session_duration']) & (df['n_events'] > thresholds['n_events'])
+    # Rule 3: Very low page entropy (repetitive, non-human behavior)
+    label |= df['page_entropy'] < thresholds['page_entropy']
+    return label.astype(int)
+
+def _report(output_path, n_anomalies, total_sessions):
+    anomaly_percentage = (n_anomalies / total_sessions) * 100 if total_sessions else 0.0
+    print(f"✅ Successfully created '{output_path}'.")
+    print(f"   - Total sessions processed: {total_sessions}")
+    print(f"   - Identified {n_anomalies} anomalies ({anomaly_percentage:.2f}%) based on rules.")
 
 def create_synthetic_labels(features_path="data/features.csv", output_path="labels.csv"):
     """
@@ -15,34 +46,112 @@ def create_synthetic_labels(features_path="data/features.csv", output_path="labe
     df = pd.read_csv(features_path)
     print(f"✅ Found features file with {len(df)} sessions.")
 
-    # Initialize all labels to 0 (normal)
-    df['label'] = 0
-
     # --- Define Heuristic Rules for Anomalies ---
-    # Rule 1: Very high click rate (potential bot activity)
-    high_click_rate_threshold = df['click_rate'].quantile(0.95)
-    df.loc[df['click_rate'] > high_click_rate_threshold, 'label'] = 1
+    thresholds = {column: df[column].quantile(q) for column, q in RULE_QUANTILES.items()}
+    df['label'] = apply_rules(df, thresholds)
 
-    # Rule 2: Short session with many events (potential scraper)
-    low_duration_threshold = df['session_duration'].quantile(0.10)
-    high_events_threshold = df['n_events'].quantile(0.80)
-    df.loc[(df['session_duration'] < low_duration_threshold) & (df['n_events'] > high_events_threshold), 'label'] = 1
-    
-    # Rule 3: Very low page entropy (repetitive, non-human behavior)
-    low_entropy_threshold = df['page_entropy'].quantile(0.05)
-    df.loc[df['page_entropy'] < low_entropy_threshold, 'label'] = 1
-    
     # --- Save the labels to a CSV file in the root directory ---
     output_df = df[['session_id', 'label']]
     output_df.to_csv(output_path, index=False)
+    _report(output_path, output_df['label'].sum(), len(output_df))
 
-    n_anomalies = output_df['label'].sum()
-    total_sessions = len(output_df)
-    anomaly_percentage = (n_anomalies / total_sessions) * 100
+def sketch_shard(task):
+    """Pass 1 over one feature file: a quantile sketch per rule column."""
+    path, error, chunk_size, seed = task
+    sketches = {column: KLLSketch.for_error(error, seed=seed) for column in RULE_QUANTILES}
+    for chunk in pd.read_csv(path, usecols=list(RULE_QUANTILES), chunksize=chunk_size):
+        for column, sketch in sketches.items():
+            sketch.update(chunk[column].to_numpy(dtype=np.float64))
+    return sketches
 
-    print(f"✅ Successfully created '{output_path}'.")
-    print(f"   - Total sessions processed: {total_sessions}")
-    print(f"   - Identified {n_anomalies} anomalies ({anomaly_percentage:.2f}%) based on rules.")
+def label_shard(task):
+    """Pass 2 over one feature file: writes its labels (no header) and returns (sessions, anomalies)."""
+    path, out_path, thresholds, chunk_size = task
+    n_sessions = n_anomalies = 0
+    with open(out_path, "w") as out:
+        for chunk in pd.read_csv(path, usecols=["session_id"] + list(RULE_QUANTILES), chunksize=chunk_size,
+                                 dtype={"session_id": str}):
+            chunk["label"] = apply_rules(chunk, thresholds)
+            chunk[["session_id", "label"]].to_csv(out, header=False, index=False)
+            n_sessions += len(chunk)
+            n_anomalies += int(chunk["label"].sum())
+    return n_sessions, n_anomalies
+
+def sketch_thresholds(features_paths, error=0.01, chunk_size=100000, n_workers=1, seed=0):
+    """
+    Rule thresholds from one streaming pass over the feature files, each
+    sketched on its own (in parallel with n_workers) and merged. Every
+    threshold is within about error in rank of the exact quantile.
+    """
+    tasks = [(path, error, chunk_size, [seed, i]) for i, path in enumerate(features_paths)]
+    with ProcessPoolExecutor(min(n_workers, len(tasks))) as pool:
+        shards = list(pool.map(sketch_shard, tasks))
+    merged = shards[0]
+    for sketches in shards[1:]:
+        for column, sketch in sketches.items():
+            merged[column].merge(sketch)
+    return {column: float(merged[column].quantile(q)) for column, q in RULE_QUANTILES.items()}
+
+def create_labels_streaming(features_paths, output_path="labels.csv", error=0.01, chunk_size=100000, n_workers=1,
+                            seed=0):
+    """
+    create_synthetic_labels for feature files of any size, split over any
+    number of partitions: pass 1 sketches the rule quantiles, pass 2 labels
+    every partition chunk by chunk into a temporary part, and the parts are
+    concatenated in the order of features_paths.
+    """
+    missing = [path for path in features_paths if not os.path.exists(path)]
+    if missing or not features_paths:
+        print(f"❌ Error: Features file not found at '{missing[0] if missing else features_paths}'")
+        print("Please run 'python src/features/make_features.py' first.")
+        return
+
+    thresholds = sketch_thresholds(features_paths, error, chunk_size, n_workers, seed)
+    print(f"✅ Sketched rule thresholds over {len(features_paths)} feature file(s) (rank error ~{error}):")
+    for column, value in thresholds.items():
+        print(f"   - {column} q{RULE_QUANTILES[column]:.2f}: {value:.4f}")
+
+    out_dir = os.path.dirname(output_path) or "."
+    with tempfile.TemporaryDirectory(dir=out_dir, prefix=".labels_") as tmp:
+        tasks = [(path, os.path.join(tmp, f"part-{i:05d}.csv"), thresholds, chunk_size)
+                 for i, path in enumerate(features_paths)]
+        with ProcessPoolExecutor(min(n_workers, len(tasks))) as pool:
+            counts = list(pool.map(label_shard, tasks))
+        with open(output_path, "w") as out:
+            out.write("session_id,label\n")
+            for _, part_path, _, _ in tasks:
+                with open(part_path) as part:
+                    shutil.copyfileobj(part, out)
+    _report(output_path, sum(c[1] for c in counts), sum(c[0] for c in counts))
+
+def check(features_path="data/features.csv", error=0.01):
+    """Compares the sketched thresholds and labels with the exact ones on one feature file."""
+    df = pd.read_csv(features_path)
+    exact = {column: df[column].quantile(q) for column, q in RULE_QUANTILES.items()}
+    sketched = sketch_thresholds([features_path], error)
+    for column, q in RULE_QUANTILES.items():
+        rank = (df[column] <= sketched[column]).mean()
+        print(f"{column:<17} q{q:.2f}: exact {exact[column]:.4f}, sketch {sketched[column]:.4f} (rank {rank:.4f})")
+    agreement = (apply_rules(df, exact) == apply_rules(df, sketched)).mean()
+    print(f"Labels agree on {agreement:.2%} of {len(df)} sessions")
 
 if __name__ == "__main__":
-    create_synthetic_labels()
+    parser = argparse.ArgumentParser(description="Create heuristic labels.csv from the session features")
+    parser.add_argument("--features", nargs="+", default=["data/features.csv"],
+                        help="feature CSV(s); with --stream, partitions of one table (globs are expanded)")
+    parser.add_argument("--output", default="labels.csv")
+    parser.add_argument("--stream", action="store_true",
+                        help="two streaming passes with quantile sketches instead of loading the features")
+    parser.add_argument("--error", type=float, default=0.01, help="rank error of the sketched quantiles")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="rows read at a time with --stream")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes over the partitions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="compare sketched and exact thresholds and exit")
+    args = parser.parse_args()
+    paths = [match for pattern in args.features for match in sorted(glob.glob(pattern)) or [pattern]]
+    if args.check:
+        check(paths[0], args.error)
+    elif args.stream:
+        create_labels_streaming(paths, args.output, args.error, args.chunk_size, args.workers, args.seed)
+    else:
+        create_synthetic_labels(paths[0], args.output)
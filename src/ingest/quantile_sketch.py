@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+
+
+class KLLSketch:
+    """
+    Mergeable approximate quantiles (the KLL sketch of Karnin, Lang and
+    Liberty) in memory independent of the number of values.
+
+    Level h holds values that each stand for 2^h inputs. A level over its
+    capacity is sorted and every other value, from a random offset, is
+    promoted to the next level; the top levels get capacity k and lower
+    ones geometrically less. The normalized rank error of a quantile stays
+    within about 3 / k (see for_error) whatever the input order, and a
+    sketch merged from shards keeps the same guarantee.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def for_error(cls, error, seed=None):
+        """A sketch whose quantiles are within about error in rank."""
+        return cls(k=max(8, math.ceil(3 / error)), seed=seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth))
+
+    def update(self, values):
+        """Adds a batch of values (NaNs are skipped)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Adds everything other has seen; other is left unchanged."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, values in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], values])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                level = np.sort(level)
+                # An odd value out stays behind so the promoted pairs are whole
+                keep, level = level[:len(level) % 2], level[len(level) % 2:]
+                promoted = level[self.rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def quantile(self, q):
+        """Approximate q-quantile(s) of the values seen so far; NaN when empty."""
+        values = np.concatenate(self.levels)
+        if len(values) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values, ranks = values[order], np.cumsum(weights[order])
+        positions = np.searchsorted(ranks, np.asarray(q) * ranks[-1], side="left")
+        return values[np.minimum(positions, len(values) - 1)]
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
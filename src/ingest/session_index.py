@@ -0,0 +1,167 @@
+import numpy as np
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+# --- Layout ---
+# The index of <log> lives next to it in two files:
+#   <log>.idx.npy   structured array of (key_hash, offset), sorted by key_hash
+#   <log>.idx.json  size / mtime of the log it was built from, plus a checksum
+#                   of the bytes just before `size` so appends can be detected
+# Keys are str(session_id), matching how the dashboard compares ids.
+INDEX_VERSION = 1
+INDEX_DTYPE = np.dtype([("key_hash", "<u8"), ("offset", "<i8")])
+TAIL_CHECK_BYTES = 256
+
+# Fast path for the usual `{"session_id": <id>, ...` line prefix
+SESSION_ID_RE = re.compile(rb'^\{\s*"session_id"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+)\s*[,}]')
+
+
+def key_hash(session_id):
+    """Stable 64-bit hash of str(session_id)."""
+    digest = hashlib.blake2b(str(session_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _line_session_id(line):
+    match = SESSION_ID_RE.match(line)
+    if match:
+        token = match.group(1)
+        return json.loads(token) if token.startswith(b'"') else int(token)
+    return json.loads(line)["session_id"]
+
+
+def _scan(log_path, start=0):
+    """Yields (key_hash, byte_offset) for every record from byte `start` on."""
+    with open(log_path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if line.strip():
+                yield key_hash(_line_session_id(line)), offset
+            offset += len(line)
+
+
+def _tail_checksum(log_path, size):
+    start = max(0, size - TAIL_CHECK_BYTES)
+    with open(log_path, "rb") as f:
+        f.seek(start)
+        return hashlib.blake2b(f.read(size - start), digest_size=16).hexdigest()
+
+
+class SessionIndex:
+    """
+    Persistent session_id -> byte offset index over a JSONL session log.
+
+    lookup() stats the log and rebuilds the index if the log changed since it
+    was built; when the log only grew, only the appended records are indexed.
+    A lookup is then a binary search over the memory-mapped index plus one
+    seek and one json.loads, independent of the size of the log.
+    """
+
+    def __init__(self, log_path="logs/sessions.jsonl"):
+        self.log_path = log_path
+        self.index_path = log_path + ".idx.npy"
+        self.meta_path = log_path + ".idx.json"
+        self._entries = None
+        self._stat = None
+
+    # --- Building ---
+    def _load_meta(self):
+        if not (os.path.exists(self.meta_path) and os.path.exists(self.index_path)):
+            return None
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        return meta if meta.get("version") == INDEX_VERSION else None
+
+    def _write(self, entries, stat):
+        entries = np.sort(entries, order=["key_hash", "offset"])
+        tmp = self.index_path + ".tmp.npy"
+        np.save(tmp, entries)
+        os.replace(tmp, self.index_path)
+
+        meta = {"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "n_sessions": len(entries), "tail_checksum": _tail_checksum(self.log_path, stat.st_size)}
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def build(self, start=0, existing=None):
+        """(Re)builds the index from byte `start`, merging with `existing` entries."""
+        stat = os.stat(self.log_path)
+        scanned = np.fromiter(_scan(self.log_path, start), dtype=INDEX_DTYPE)
+        entries = scanned if existing is None else np.concatenate([existing, scanned])
+        self._write(entries, stat)
+        self._entries = None
+        return len(scanned)
+
+    def refresh(self):
+        """Makes sure the on-disk index matches the log. Returns True if it was rebuilt."""
+        stat = os.stat(self.log_path)
+        if self._stat is not None and (stat.st_size, stat.st_mtime_ns) == self._stat:
+            return False
+
+        rebuilt = False
+        meta = self._load_meta()
+        if meta is None:
+            self.build()
+            rebuilt = True
+        elif (stat.st_size, stat.st_mtime_ns) != (meta["size"], meta["mtime_ns"]):
+            appended = (stat.st_size > meta["size"]
+                        and _tail_checksum(self.log_path, meta["size"]) == meta["tail_checksum"])
+            if appended:
+                self.build(start=meta["size"], existing=np.load(self.index_path))
+            else:
+                self.build()
+            rebuilt = True
+
+        self._entries = np.load(self.index_path, mmap_mode="r")
+        self._stat = (stat.st_size, stat.st_mtime_ns)
+        return rebuilt
+
+    # --- Lookup ---
+    def offsets(self, session_id):
+        """Byte offsets of every record whose key hash matches session_id."""
+        self.refresh()
+        h = np.uint64(key_hash(session_id))
+        keys = self._entries["key_hash"]
+        lo = np.searchsorted(keys, h, side="left")
+        hi = np.searchsorted(keys, h, side="right")
+        return self._entries["offset"][lo:hi].tolist()
+
+    def lookup(self, session_id):
+        """Returns the session record for session_id, or None if it is not in the log."""
+        with open(self.log_path, "rb") as f:
+            for offset in self.offsets(session_id):
+                f.seek(offset)
+                record = json.loads(f.readline())
+                # Hash collisions are possible, so confirm the id
+                if str(record["session_id"]) == str(session_id):
+                    return record
+        return None
+
+    def __len__(self):
+        self.refresh()
+        return len(self._entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the byte-offset index of a session log")
+    parser.add_argument("log", nargs="?", default="logs/sessions.jsonl")
+    parser.add_argument("--lookup", help="print the record of this session id")
+    args = parser.parse_args()
+
+    index = SessionIndex(args.log)
+    start = time.perf_counter()
+    rebuilt = index.refresh()
+    print(f"{'Built' if rebuilt else 'Up-to-date'} index of {len(index)} sessions "
+          f"in {time.perf_counter() - start:.3f}s -> {index.index_path}")
+    if args.lookup is not None:
+        start = time.perf_counter()
+        record = index.lookup(args.lookup)
+        print(json.dumps(record))
+        print(f"Lookup took {(time.perf_counter() - start) * 1000:.2f} ms")
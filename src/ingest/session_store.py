@@ -0,0 +1,331 @@
+import numpy as np
+import argparse
+import json
+import os
+import shutil
+
+# --- Layout ---
+# A session store is a directory of flat .npy columns that can all be
+# memory-mapped, plus a small meta.json holding the page vocabulary:
+#   timestamps.npy          int32   t_rel_ms of every event, session after session
+#   pages.npy               uint16  page code of every event (codes index meta["pages"])
+#   offsets.npy             int64   events of session i are [offsets[i], offsets[i + 1])
+#   session_ids.npy         uint8   utf-8 bytes of all session ids, concatenated
+#   session_id_offsets.npy  int64   bytes of session id i are [off[i], off[i + 1])
+#   session_id_is_int.npy   uint8   1 where the JSONL session id was an integer
+STORE_VERSION = 1
+PAGE_MAP_PATH = "artifacts/models/page_map.json"
+TIMESTAMP_DTYPE = np.dtype("<i4")
+PAGE_DTYPE = np.dtype("<u2")
+OFFSET_DTYPE = np.dtype("<i8")
+
+
+class _ColumnWriter:
+    """Appends values of a fixed dtype to a raw file and turns it into a .npy at the end."""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._raw = open(path + ".part", "wb")
+
+    def append(self, values):
+        arr = np.asarray(values)
+        if arr.size and arr.dtype != self.dtype:
+            info = np.iinfo(self.dtype)
+            if arr.min() < info.min or arr.max() > info.max:
+                raise ValueError(f"Values out of range for {self.dtype} in {os.path.basename(self.path)}")
+        arr = np.ascontiguousarray(arr, dtype=self.dtype)
+        self._raw.write(arr.tobytes())
+        self.length += arr.size
+
+    def close(self):
+        self._raw.close()
+        header = {"descr": np.lib.format.dtype_to_descr(self.dtype),
+                  "fortran_order": False, "shape": (self.length,)}
+        with open(self.path, "wb") as out, open(self.path + ".part", "rb") as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 1 << 20)
+        os.remove(self.path + ".part")
+
+
+class SessionStore:
+    """
+    Read access to an on-disk session store.
+
+    The event columns are memory-mapped by default, so opening a store is
+    constant time and slicing a session does not copy or parse anything.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported session store version in {path}: {self.meta.get('version')}")
+        self.timestamps = np.load(os.path.join(path, "timestamps.npy"), mmap_mode=mode)
+        self.pages = np.load(os.path.join(path, "pages.npy"), mmap_mode=mode)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode=mode)
+        self._id_bytes = np.load(os.path.join(path, "session_ids.npy"), mmap_mode=mode)
+        self._id_offsets = np.load(os.path.join(path, "session_id_offsets.npy"), mmap_mode=mode)
+        self._id_is_int = np.load(os.path.join(path, "session_id_is_int.npy"), mmap_mode=mode)
+        self.page_names = self.meta["pages"]
+        self.page_map = {page: i for i, page in enumerate(self.page_names)}
+        self._session_ids = None
+        self._index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def session_id(self, i):
+        raw = self._id_bytes[self._id_offsets[i]:self._id_offsets[i + 1]].tobytes().decode("utf-8")
+        return int(raw) if self._id_is_int[i] else raw
+
+    @property
+    def session_ids(self):
+        """All session ids, decoded on first access."""
+        if self._session_ids is None:
+            blob = self._id_bytes.tobytes().decode("utf-8")
+            bounds = self._id_offsets.tolist()
+            # Offsets are byte offsets; only re-slice by characters when ids are pure ASCII
+            if len(blob) != len(self._id_bytes):
+                self._session_ids = [self.session_id(i) for i in range(len(self))]
+            else:
+                is_int = self._id_is_int.tolist()
+                self._session_ids = [
+                    int(blob[a:b]) if flag else blob[a:b]
+                    for a, b, flag in zip(bounds[:-1], bounds[1:], is_int)
+                ]
+        return self._session_ids
+
+    def find(self, session_id):
+        """Returns the position of a session id, or None. Matches on str(session_id) like the dashboard."""
+        if self._index is None:
+            self._index = {str(sid): i for i, sid in enumerate(self.session_ids)}
+        return self._index.get(str(session_id))
+
+    def sequence(self, i):
+        """Encoded click sequence of session i (a zero-copy view)."""
+        return self.pages[self.offsets[i]:self.offsets[i + 1]]
+
+    def sequences(self):
+        """Views of every encoded click sequence, in store order."""
+        return np.split(self.pages, np.asarray(self.offsets[1:-1]))
+
+    def events(self, i):
+        """Events of session i in the logs/sessions.jsonl record shape."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        names = self.page_names
+        return [{"page": names[p], "t_rel_ms": t}
+                for p, t in zip(self.pages[start:end].tolist(), self.timestamps[start:end].tolist())]
+
+    def iter_sessions(self):
+        for i, session_id in enumerate(self.session_ids):
+            yield {"session_id": session_id, "events": self.events(i)}
+
+
+def write_store(sessions, path, page_map=None):
+    """
+    Writes an iterable of sessions (JSONL record shape) to a session store.
+
+    page_map fixes the page codes (for example artifacts/models/page_map.json);
+    pages not in it get the next free code. Without one, pages are coded in
+    sorted order, as make_features.py codes them. Sessions are consumed one
+    at a time, so the input can be a generator over a log of any size.
+    """
+    os.makedirs(path, exist_ok=True)
+    sort_codes = not page_map
+    page_map = dict(page_map or {})
+    columns = {
+        "timestamps": _ColumnWriter(os.path.join(path, "timestamps.npy"), TIMESTAMP_DTYPE),
+        "pages": _ColumnWriter(os.path.join(path, "pages.npy"), PAGE_DTYPE),
+        "offsets": _ColumnWriter(os.path.join(path, "offsets.npy"), OFFSET_DTYPE),
+        "ids": _ColumnWriter(os.path.join(path, "session_ids.npy"), np.uint8),
+        "id_offsets": _ColumnWriter(os.path.join(path, "session_id_offsets.npy"), OFFSET_DTYPE),
+        "id_is_int": _ColumnWriter(os.path.join(path, "session_id_is_int.npy"), np.uint8),
+    }
+    columns["offsets"].append([0])
+    columns["id_offsets"].append([0])
+
+    n_events = 0
+    n_id_bytes = 0
+    buffers = {name: [] for name in columns}
+
+    def flush():
+        for name, values in buffers.items():
+            if values:
+                columns[name].append(values)
+                values.clear()
+
+    for s in sessions:
+        for event in s["events"]:
+            code = page_map.get(event["page"])
+            if code is None:
+                code = page_map[event["page"]] = len(page_map)
+            buffers["pages"].append(code)
+            buffers["timestamps"].append(event["t_rel_ms"])
+        n_events += len(s["events"])
+        buffers["offsets"].append(n_events)
+
+        session_id = s["session_id"]
+        raw = str(session_id).encode("utf-8")
+        buffers["ids"].extend(raw)
+        n_id_bytes += len(raw)
+        buffers["id_offsets"].append(n_id_bytes)
+        buffers["id_is_int"].append(1 if isinstance(session_id, int) else 0)
+
+        if len(buffers["timestamps"]) >= 1 << 20:
+            flush()
+    flush()
+
+    for column in columns.values():
+        column.close()
+    if sort_codes:
+        page_map = _sort_page_codes(path, page_map)
+
+    pages = [None] * len(page_map)
+    for page, code in page_map.items():
+        pages[code] = page
+    _write_meta(path, pages, columns["offsets"].length - 1, n_events)
+    return page_map
+
+
+def _sort_page_codes(path, page_map):
+    """Recodes pages.npy in place from page_map's codes to sorted page order; returns the sorted map."""
+    sorted_map = {page: i for i, page in enumerate(sorted(page_map))}
+    recode = np.empty(len(page_map), dtype=PAGE_DTYPE)
+    for page, code in page_map.items():
+        recode[code] = sorted_map[page]
+    if np.array_equal(recode, np.arange(len(recode))):
+        return sorted_map
+    pages = np.load(os.path.join(path, "pages.npy"), mmap_mode="r+")
+    for start in range(0, len(pages), 1 << 22):
+        pages[start:start + (1 << 22)] = recode[pages[start:start + (1 << 22)]]
+    pages.flush()
+    del pages
+    return sorted_map
+
+
+def _write_meta(path, page_names, n_sessions, n_events):
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"version": STORE_VERSION, "pages": list(page_names),
+                   "n_sessions": int(n_sessions), "n_events": int(n_events)}, f)
+
+
+def write_store_arrays(path, session_ids, timestamps, pages, offsets, page_names):
+    """
+    Writes a session store from columns already in memory, for producers
+    that generate sessions as arrays (see src/simulate/generate_traffic.py)
+    rather than as JSONL records. pages are codes into page_names.
+    """
+    os.makedirs(path, exist_ok=True)
+    raw_ids = [str(session_id).encode("utf-8") for session_id in session_ids]
+    id_offsets = np.zeros(len(raw_ids) + 1, dtype=OFFSET_DTYPE)
+    np.cumsum([len(raw) for raw in raw_ids], out=id_offsets[1:])
+    columns = [
+        ("timestamps.npy", TIMESTAMP_DTYPE, timestamps),
+        ("pages.npy", PAGE_DTYPE, pages),
+        ("offsets.npy", OFFSET_DTYPE, offsets),
+        ("session_ids.npy", np.uint8, np.frombuffer(b"".join(raw_ids), dtype=np.uint8)),
+        ("session_id_offsets.npy", OFFSET_DTYPE, id_offsets),
+        ("session_id_is_int.npy", np.uint8, [isinstance(session_id, int) for session_id in session_ids]),
+    ]
+    for name, dtype, values in columns:
+        writer = _ColumnWriter(os.path.join(path, name), dtype)
+        writer.append(values)
+        writer.close()
+    _write_meta(path, page_names, len(offsets) - 1, offsets[-1])
+
+
+def concat_stores(part_paths, path):
+    """
+    Concatenates session stores that share a page vocabulary into one
+    store, part after part. Columns are streamed from the memory-mapped
+    parts, so memory does not grow with the total size.
+    """
+    os.makedirs(path, exist_ok=True)
+    writers = {
+        "timestamps": _ColumnWriter(os.path.join(path, "timestamps.npy"), TIMESTAMP_DTYPE),
+        "pages": _ColumnWriter(os.path.join(path, "pages.npy"), PAGE_DTYPE),
+        "offsets": _ColumnWriter(os.path.join(path, "offsets.npy"), OFFSET_DTYPE),
+        "ids": _ColumnWriter(os.path.join(path, "session_ids.npy"), np.uint8),
+        "id_offsets": _ColumnWriter(os.path.join(path, "session_id_offsets.npy"), OFFSET_DTYPE),
+        "id_is_int": _ColumnWriter(os.path.join(path, "session_id_is_int.npy"), np.uint8),
+    }
+    writers["offsets"].append([0])
+    writers["id_offsets"].append([0])
+
+    page_names = None
+    n_events = 0
+    n_id_bytes = 0
+    for part_path in part_paths:
+        part = SessionStore(part_path)
+        if page_names is None:
+            page_names = part.page_names
+        elif part.page_names != page_names:
+            raise ValueError(f"{part_path} has a different page vocabulary; re-encode it before concatenating")
+        writers["timestamps"].append(part.timestamps)
+        writers["pages"].append(part.pages)
+        writers["offsets"].append(np.asarray(part.offsets[1:]) + n_events)
+        writers["ids"].append(part._id_bytes)
+        writers["id_offsets"].append(np.asarray(part._id_offsets[1:]) + n_id_bytes)
+        writers["id_is_int"].append(part._id_is_int)
+        n_events += int(part.offsets[-1])
+        n_id_bytes += int(part._id_offsets[-1])
+
+    for writer in writers.values():
+        writer.close()
+    _write_meta(path, page_names or [], writers["offsets"].length - 1, n_events)
+
+
+def jsonl_to_store(jsonl_path, store_path, page_map=None):
+    """Converts a logs/sessions.jsonl style file into a session store."""
+    def read():
+        with open(jsonl_path) as f:
+            for line in f:
+                yield json.loads(line)
+    return write_store(read(), store_path, page_map)
+
+
+def store_to_jsonl(store_path, jsonl_path):
+    """Converts a session store back into the logs/sessions.jsonl format."""
+    store = SessionStore(store_path)
+    with open(jsonl_path, "w") as f:
+        for s in store.iter_sessions():
+            f.write(json.dumps(s) + "\n")
+
+
+def _size_on_disk(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert sessions between JSONL and the binary session store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_store = sub.add_parser("to-store", help="JSONL -> session store")
+    to_store.add_argument("src", nargs="?", default="logs/sessions.jsonl")
+    to_store.add_argument("dst", nargs="?", default="logs/sessions.store")
+    to_store.add_argument("--page-map", default=PAGE_MAP_PATH,
+                          help="page map to fix page codes, used when it exists (default: %(default)s); "
+                               "without one pages are coded in sorted order")
+    to_jsonl = sub.add_parser("to-jsonl", help="session store -> JSONL")
+    to_jsonl.add_argument("src", nargs="?", default="logs/sessions.store")
+    to_jsonl.add_argument("dst", nargs="?", default="logs/sessions.jsonl")
+    args = parser.parse_args()
+
+    if args.command == "to-store":
+        page_map = None
+        if args.page_map and os.path.exists(args.page_map):
+            with open(args.page_map) as f:
+                page_map = json.load(f)
+        jsonl_to_store(args.src, args.dst, page_map)
+    else:
+        store_to_jsonl(args.src, args.dst)
+    print(f"Saved -> {args.dst} ({_size_on_disk(args.dst) / 1e6:.2f} MB, source {_size_on_disk(args.src) / 1e6:.2f} MB)")
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from session_store import write_store
+
+# Builds sessions from an interleaved stream of raw page events. Open
+# sessions live in an OrderedDict ordered by last activity, so the sessions
+# that timed out, or the least recently active one when memory runs short,
+# are always at the front and closing them is O(1).
+DEFAULT_TIMEOUT_MS = 30 * 60 * 1000
+
+
+class Sessionizer:
+    """
+    Groups (client, page, timestamp_ms) events into sessions.
+
+    A client's session closes once the stream has moved timeout_ms past its
+    last event. With more than max_open open sessions the least recently
+    active one is closed early, and a session reaching max_events is closed
+    and continued as a new one, so memory stays bounded by max_open x
+    max_events. Timestamps must be roughly ordered across clients (closing
+    follows the largest timestamp seen) and ordered within a client.
+
+    Closed sessions use the logs/sessions.jsonl record shape; the session id
+    is "<client>:<first timestamp>" and t_rel_ms counts from the first event.
+    """
+
+    def __init__(self, timeout_ms=DEFAULT_TIMEOUT_MS, max_open=100000, max_events=10000):
+        self.timeout_ms = timeout_ms
+        self.max_open = max_open
+        self.max_events = max_events
+        self._open = OrderedDict()  # client -> [first_ts, last_ts, pages, timestamps]
+        # No open session can time out before this; a lower bound that is
+        # only refreshed when the stream passes it
+        self._next_expiry = float("inf")
+        self.n_events = 0
+        self.n_sessions = 0
+        self.n_timed_out = 0
+        self.n_evicted = 0
+        self.n_split = 0
+
+    def __len__(self):
+        return len(self._open)
+
+    @property
+    def stats(self):
+        return {"events": self.n_events, "sessions": self.n_sessions, "timed_out": self.n_timed_out,
+                "evicted": self.n_evicted, "split": self.n_split}
+
+    def _close(self, client, session):
+        first_ts, _, pages, timestamps = session
+        self.n_sessions += 1
+        return {"session_id": f"{client}:{first_ts}",
+                "events": [{"page": page, "t_rel_ms": ts - first_ts} for page, ts in zip(pages, timestamps)]}
+
+    def add(self, client, page, ts):
+        """Adds one event; returns the sessions it caused to close (usually none)."""
+        self.n_events += 1
+        open_sessions = self._open
+        session = open_sessions.get(client)
+        if (session is not None and ts - session[1] <= self.timeout_ms
+                and len(session[2]) < self.max_events):
+            # The common case: the client's session continues
+            session[1] = ts
+            session[2].append(page)
+            session[3].append(ts)
+            open_sessions.move_to_end(client)
+            closed = []
+        else:
+            closed = []
+            if session is not None:
+                closed.append(self._close(client, open_sessions.pop(client)))
+                if ts - session[1] > self.timeout_ms:
+                    self.n_timed_out += 1
+                else:
+                    self.n_split += 1
+            open_sessions[client] = [ts, ts, [page], [ts]]
+            self._next_expiry = min(self._next_expiry, ts + self.timeout_ms)
+            if len(open_sessions) > self.max_open:
+                closed.append(self._close(*open_sessions.popitem(last=False)))
+                self.n_evicted += 1
+
+        if ts > self._next_expiry:
+            # The least recently active session is first; stop at the first one still active
+            cutoff = ts - self.timeout_ms
+            while open_sessions:
+                oldest = next(iter(open_sessions.values()))
+                if oldest[1] >= cutoff:
+                    self._next_expiry = oldest[1] + self.timeout_ms
+                    break
+                closed.append(self._close(*open_sessions.popitem(last=False)))
+                self.n_timed_out += 1
+            else:
+                self._next_expiry = float("inf")
+        return closed
+
+    def flush(self):
+        """Closes every open session (end of stream), least recently active first."""
+        closed = [self._close(client, session) for client, session in self._open.items()]
+        self._open.clear()
+        self._next_expiry = float("inf")
+        return closed
+
+    def run(self, events):
+        """Yields closed sessions for an iterable of (client, page, ts) events, then the rest at the end."""
+        add = self.add
+        for client, page, ts in events:
+            closed = add(client, page, ts)
+            if closed:
+                yield from closed
+        yield from self.flush()
+
+
+def read_events(path):
+    """
+    (client, page, ts) events from a file ("-" for stdin): JSON lines with
+    client/page/ts fields, or tab-separated client, page and ts columns.
+    """
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for line in f:
+            if line.startswith("{"):
+                event = json.loads(line)
+                yield str(event["client"]), event["page"], int(event["ts"])
+            elif line.strip():
+                client, page, ts = line.rstrip("\n").split("\t")
+                yield client, page, int(ts)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def write_jsonl(sessions, path):
+    dumps = json.dumps
+    with open(path, "w") as f:
+        for s in sessions:
+            f.write(dumps(s) + "\n")
+
+
+def synthetic_events(n_events, n_active=5000, events_per_client=8, pages=("home", "products", "cart", "checkout"),
+                     seed=0):
+    """
+    Interleaved events, one per millisecond, from a rotating pool of
+    n_active clients: a new client joins every events_per_client events and
+    each client makes about that many clicks before it goes quiet.
+    """
+    rng = np.random.default_rng(seed)
+    client_ids = rng.integers(0, n_active, size=n_events) + np.arange(n_events) // events_per_client
+    clients = [f"c{i}" for i in client_ids]
+    page_names = [pages[i] for i in rng.integers(0, len(pages), size=n_events)]
+    return list(zip(clients, page_names, range(n_events)))
+
+
+def benchmark(n_events=2000000, timeout_ms=30000, max_open=100000):
+    """Events/sec of the sessionizer alone and of a full TSV -> JSONL run on synthetic events."""
+    events = synthetic_events(n_events)
+    sessionizer = Sessionizer(timeout_ms=timeout_ms, max_open=max_open)
+    start = time.perf_counter()
+    n_sessions = sum(1 for _ in sessionizer.run(events))
+    seconds = time.perf_counter() - start
+    print(f"Sessionizer: {n_events / seconds:,.0f} events/s ({n_sessions:,} sessions, {sessionizer.stats})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        events_path = os.path.join(tmp, "events.tsv")
+        with open(events_path, "w") as f:
+            f.writelines(f"{client}\t{page}\t{ts}\n" for client, page, ts in events)
+        start = time.perf_counter()
+        write_jsonl(Sessionizer(timeout_ms, max_open).run(read_events(events_path)), os.path.join(tmp, "out.jsonl"))
+        seconds = time.perf_counter() - start
+    print(f"TSV -> JSONL: {n_events / seconds:,.0f} events/s")
+
+
+def main(input_path, output_path, store=False, timeout_ms=DEFAULT_TIMEOUT_MS, max_open=100000, max_events=10000):
+    sessionizer = Sessionizer(timeout_ms, max_open, max_events)
+    sessions = sessionizer.run(read_events(input_path))
+    start = time.perf_counter()
+    if store:
+        write_store(sessions, output_path)
+    else:
+        write_jsonl(sessions, output_path)
+    seconds = time.perf_counter() - start
+    stats = sessionizer.stats
+    print(f"Saved -> {output_path} ({stats['sessions']} sessions from {stats['events']} events, "
+          f"{stats['events'] / max(seconds, 1e-9):,.0f} events/s)")
+    if stats["evicted"]:
+        print(f"⚠️ {stats['evicted']} sessions were closed early to stay under --max-open {max_open}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build sessions from a raw stream of page events")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="events as JSON lines (client, page, ts) or TSV; '-' reads stdin")
+    parser.add_argument("--output", default="logs/sessions.jsonl")
+    parser.add_argument("--store", action="store_true", help="write a binary session store instead of JSONL")
+    parser.add_argument("--timeout-ms", type=int, default=DEFAULT_TIMEOUT_MS, help="inactivity timeout")
+    parser.add_argument("--max-open", type=int, default=100000,
+                        help="open sessions kept in memory; the least recently active is closed beyond this")
+    parser.add_argument("--max-events", type=int, default=10000,
+                        help="events per session before it is closed and continued as a new one")
+    parser.add_argument("--benchmark", action="store_true", help="measure throughput on synthetic events")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+    else:
+        main(args.input, args.output, store=args.store, timeout_ms=args.timeout_ms, max_open=args.max_open,
+             max_events=args.max_events)
@@ -0,0 +1,117 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+
+import numpy as np
+
+CALIBRATION_PATH = "artifacts/models/calibration.json"
+MODEL_PATHS = {
+    "iforest": "artifacts/models/iforest.pkl",
+    "lstm": "artifacts/models/lstm_ae.keras",
+    "markov": "artifacts/models/markov.npz",
+}
+
+
+def artifact_digest(path):
+    """Short content hash of a model artifact, used to tie statistics to a model version."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def fit_range(raw_scores, lower_q=0.0, upper_q=1.0):
+    """
+    Calibration statistics for one model's raw scores on its training data.
+
+    lower_q/upper_q pick the quantiles that map to 0 and 1; the defaults are
+    the plain min and max, and e.g. 0.001/0.999 make the range robust to a
+    few extreme training scores.
+    """
+    raw_scores = np.asarray(raw_scores, dtype=float)
+    lo, hi = np.quantile(raw_scores, [lower_q, upper_q])
+    return {"lo": float(lo), "hi": float(hi), "lower_q": lower_q, "upper_q": upper_q,
+            "n_samples": int(len(raw_scores))}
+
+
+def apply_range(raw_scores, stats):
+    """Maps raw scores to [0, 1] with frozen statistics; out-of-range scores are clipped."""
+    raw_scores = np.asarray(raw_scores, dtype=float)
+    lo, hi = stats["lo"], stats["hi"]
+    if hi <= lo:
+        return np.zeros_like(raw_scores)
+    return np.clip((raw_scores - lo) / (hi - lo), 0.0, 1.0)
+
+
+def load_calibration(path=CALIBRATION_PATH, check_versions=True):
+    """
+    Returns the saved calibration for each model as {model: stats}.
+
+    Entries whose model artifact changed since they were fitted are dropped
+    (with a warning) when check_versions is set, since they no longer
+    describe the model that will produce the scores.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        calibration = json.load(f)
+    if check_versions:
+        for model, stats in list(calibration.items()):
+            model_path = MODEL_PATHS.get(model)
+            if model_path and os.path.exists(model_path) and stats.get("model_digest") != artifact_digest(model_path):
+                print(f"⚠️ Calibration for '{model}' was fitted on a different {model_path}; ignoring it.")
+                del calibration[model]
+    return calibration
+
+
+def save_calibration(model, stats, path=CALIBRATION_PATH):
+    """
+    Stores the statistics of one model, keeping the other models' entries.
+    Training scripts may run concurrently (see run_pipeline.py), so the
+    read-modify-write happens under an exclusive lock.
+    """
+    model_path = MODEL_PATHS.get(model)
+    if model_path and os.path.exists(model_path):
+        stats = dict(stats, model_digest=artifact_digest(model_path))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        calibration = load_calibration(path, check_versions=False)
+        calibration[model] = stats
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(calibration, f, indent=2)
+        os.replace(tmp, path)
+    print(f"Saved -> {path} ({model}: lo={stats['lo']:.6g}, hi={stats['hi']:.6g})")
+
+
+def main(lower_q=0.0, upper_q=1.0):
+    """Calibrates the current models on data/features.csv and data/sequences.jsonl without retraining."""
+    import joblib
+    import pandas as pd
+    from fuse import FEATURE_COLS, load_sequences, load_lstm_model, iforest_raw_scores, lstm_raw_scores
+
+    df = pd.read_csv("data/features.csv")
+    iforest = joblib.load(MODEL_PATHS["iforest"])
+    save_calibration("iforest", fit_range(iforest_raw_scores(iforest, df[FEATURE_COLS]), lower_q, upper_q))
+
+    lstm_ae = load_lstm_model()
+    sequences, _ = load_sequences()
+    save_calibration("lstm", fit_range(lstm_raw_scores(lstm_ae, sequences), lower_q, upper_q))
+
+    if os.path.exists(MODEL_PATHS["markov"]):
+        from markov_prefilter import MarkovSequenceModel
+        markov = MarkovSequenceModel.load(MODEL_PATHS["markov"])
+        save_calibration("markov", fit_range(markov.raw_scores(sequences), lower_q, upper_q))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit score calibration for the current models")
+    parser.add_argument("--lower-q", type=float, default=0.0, help="training-score quantile mapped to 0")
+    parser.add_argument("--upper-q", type=float, default=1.0, help="training-score quantile mapped to 1")
+    args = parser.parse_args()
+    main(lower_q=args.lower_q, upper_q=args.upper_q)
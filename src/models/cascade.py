@@ -0,0 +1,118 @@
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from calibration import MODEL_PATHS, apply_range, load_calibration
+from fuse import (
+    FEATURE_COLS, hybrid_score, iforest_raw_scores, load_lstm_model, load_sequences, lstm_raw_scores, markov_scores,
+    min_max_scale, placeholder_label, prefilter_score
+)
+from markov_prefilter import MARKOV_PATH, MarkovSequenceModel
+
+# Picks the pre-filter cutoff of cascade scoring (fuse.py --prefilter-cutoff).
+# Every session is scored by all three models once, then each cutoff is
+# replayed: sessions below it keep their pre-filter score, the others get
+# the full hybrid score. Recall is measured against the sessions the full
+# hybrid score flags at the alert threshold, so a cutoff that loses none of
+# them changes no alert.
+REPORT_PATH = "artifacts/reports/cascade_report.csv"
+DEFAULT_THRESHOLD = 0.7  # Same default as the dashboard's threshold slider
+DEFAULT_CUTOFFS = [round(c, 2) for c in np.arange(0.0, DEFAULT_THRESHOLD + 0.001, 0.05)]
+
+
+def cascade_table(iforest_score, markov_score, lstm_score, labels, cutoffs, threshold=DEFAULT_THRESHOLD,
+                  seconds=None):
+    """
+    One row per cutoff: share of sessions escalated to the LSTM, LSTM calls
+    saved, recall lost against the full hybrid score at threshold, and
+    recall of the labelled bots. seconds={"iforest", "markov", "lstm"}
+    (total scoring time of each model) adds the expected speedup of scoring.
+    """
+    full = hybrid_score(iforest_score, lstm_score)
+    prefilter = prefilter_score(iforest_score, markov_score)
+    flagged_full = full >= threshold
+    n_bots = max(labels.sum(), 1)
+
+    rows = []
+    for cutoff in cutoffs:
+        escalated = prefilter >= cutoff
+        flagged = np.where(escalated, full, prefilter) >= threshold
+        row = {
+            "cutoff": cutoff,
+            "escalated": escalated.mean(),
+            "lstm_calls_saved": 1 - escalated.mean(),
+            "recall_vs_full": (flagged & flagged_full).sum() / flagged_full.sum() if flagged_full.any() else 1.0,
+            "extra_flags": int((flagged & ~flagged_full).sum()),  # Only above the threshold: the Markov score alone
+            "bot_recall": (flagged & (labels == 1)).sum() / n_bots,
+        }
+        row["recall_lost"] = 1 - row["recall_vs_full"]
+        if seconds:
+            cascade_seconds = seconds["iforest"] + seconds["markov"] + escalated.mean() * seconds["lstm"]
+            row["speedup"] = (seconds["iforest"] + seconds["lstm"]) / cascade_seconds
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main(threshold=DEFAULT_THRESHOLD, cutoffs=DEFAULT_CUTOFFS, max_recall_loss=0.01, store_path=None, backend="auto"):
+    """Scores every session with all three models and writes the cascade report for each cutoff."""
+    if not os.path.exists(MARKOV_PATH):
+        raise ValueError(f"The cascade report needs {MARKOV_PATH}; run markov_prefilter.py first")
+    sequences, session_ids = load_sequences(store_path)
+    session_ids = [str(sid) for sid in session_ids]
+    # Features in the order of the sequences
+    df = pd.read_csv("data/features.csv", dtype={"session_id": str}).set_index("session_id").loc[session_ids]
+    calibration = load_calibration()
+    seconds = {}
+
+    start = time.perf_counter()
+    if_raw = iforest_raw_scores(joblib.load(MODEL_PATHS["iforest"]), df[FEATURE_COLS])
+    seconds["iforest"] = time.perf_counter() - start
+    if "iforest" in calibration:
+        iforest_score = apply_range(if_raw, calibration["iforest"])
+    else:
+        iforest_score = min_max_scale(if_raw, if_raw.min(), if_raw.max())
+
+    start = time.perf_counter()
+    markov_score = markov_scores(MarkovSequenceModel.load(), sequences, calibration)
+    seconds["markov"] = time.perf_counter() - start
+
+    lstm_ae = load_lstm_model(backend)
+    start = time.perf_counter()
+    mse = lstm_raw_scores(lstm_ae, sequences)
+    seconds["lstm"] = time.perf_counter() - start
+    lstm_score = apply_range(mse, calibration["lstm"]) if "lstm" in calibration else min_max_scale(mse, mse.min(),
+                                                                                                   mse.max())
+
+    labels = np.array([placeholder_label(sid) for sid in session_ids])
+    report = cascade_table(iforest_score, markov_score, lstm_score, labels, cutoffs, threshold, seconds)
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    report.to_csv(REPORT_PATH, index=False)
+
+    print(f"Scoring {len(sequences)} sessions: Isolation Forest {seconds['iforest']:.2f}s, "
+          f"Markov {seconds['markov']:.3f}s, LSTM {seconds['lstm']:.2f}s")
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    ok = report[(report["recall_lost"] <= max_recall_loss) & (report["cutoff"] <= threshold)]
+    if ok.empty:
+        print(f"⚠️ No cutoff keeps the recall loss within {max_recall_loss:.1%}.")
+    else:
+        best = ok.loc[ok["lstm_calls_saved"].idxmax()]
+        print(f"Operating point: --prefilter-cutoff {best['cutoff']} saves {best['lstm_calls_saved']:.1%} of "
+              f"LSTM calls ({best['speedup']:.1f}x faster scoring) for {best['recall_lost']:.1%} recall lost")
+    print(f"Saved -> {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall lost and LSTM calls saved by cascade scoring per cutoff")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="alert threshold on hybrid_score")
+    parser.add_argument("--cutoffs", type=float, nargs="+", default=DEFAULT_CUTOFFS, help="pre-filter cutoffs to try")
+    parser.add_argument("--max-recall-loss", type=float, default=0.01,
+                        help="largest recall loss accepted when suggesting an operating point")
+    parser.add_argument("--store", help="read sequences from a binary session store instead of data/sequences.jsonl")
+    parser.add_argument("--backend", choices=["auto", "numpy", "keras"], default="auto", help="LSTM inference backend")
+    args = parser.parse_args()
+    main(threshold=args.threshold, cutoffs=args.cutoffs, max_recall_loss=args.max_recall_loss, store_path=args.store,
+         backend=args.backend)
@@ -0,0 +1,151 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from calibration import MODEL_PATHS, artifact_digest
+from fuse import FEATURE_COLS
+
+# TreeSHAP attributions of the Isolation Forest, computed only for sessions
+# above the hybrid threshold and cached per (session id, model version).
+# TreeExplainer explains the forest's mean path length, and shorter paths
+# are more anomalous, so stored attributions are negated: a positive value
+# pushed the session towards being flagged.
+EXPLANATIONS_PATH = "artifacts/shap/explanations.csv"
+DEFAULT_THRESHOLD = 0.7  # Same default as the dashboard's threshold slider
+EXPLANATION_COLS = ["session_id", "model_version", "base_value"] + FEATURE_COLS
+
+_explainer = None
+
+
+def make_explainer(model_path=MODEL_PATHS["iforest"]):
+    import shap  # Only this stage needs shap; scoring runs without it
+    return shap.TreeExplainer(joblib.load(model_path))
+
+
+def _init_worker(model_path):
+    global _explainer
+    _explainer = make_explainer(model_path)
+
+
+def _explain_chunk(X):
+    return -np.asarray(_explainer.shap_values(X)), -float(np.ravel(_explainer.expected_value)[0])
+
+
+def attributions(X, model_path=MODEL_PATHS["iforest"], n_workers=1, chunk_size=256):
+    """
+    Anomaly-score attributions (n_rows, n_features) of the rows of X and the
+    base value they add up from. Chunks of chunk_size rows are spread over
+    n_workers processes, each building its explainer once.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    chunks = [X[s:s + chunk_size] for s in range(0, len(X), chunk_size)]
+    if n_workers == 1 or len(chunks) <= 1:
+        _init_worker(model_path)
+        results = [_explain_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+            results = list(pool.map(_explain_chunk, chunks))
+    if not results:
+        return np.zeros((0, X.shape[1])), 0.0
+    return np.concatenate([values for values, _ in results]), results[0][1]
+
+
+class ExplanationCache:
+    """Attributions keyed by session id; each row records the model version it explains."""
+
+    def __init__(self, path=EXPLANATIONS_PATH):
+        self.path = path
+        if os.path.exists(path):
+            df = pd.read_csv(path, dtype={"session_id": str, "model_version": str})
+            self.df = df.drop_duplicates("session_id", keep="last").set_index("session_id")
+        else:
+            self.df = pd.DataFrame(columns=EXPLANATION_COLS).set_index("session_id")
+
+    def cached(self, session_ids, model_version):
+        """Boolean mask of the session ids explained for model_version."""
+        versions = self.df["model_version"].reindex(pd.Index(session_ids, dtype=str))
+        return (versions == model_version).to_numpy()
+
+    def get(self, session_id, model_version):
+        if session_id in self.df.index and self.df.at[session_id, "model_version"] == model_version:
+            return self.df.loc[session_id]
+        return None
+
+    def add(self, session_ids, model_version, values, base_value, prune=True):
+        """
+        Stores new rows. With prune, rows of other model versions are dropped
+        and the file is rewritten; without, the rows are appended to it (a
+        later row for a session id replaces the earlier one on load).
+        """
+        new = pd.DataFrame(values, columns=FEATURE_COLS, index=pd.Index(session_ids, dtype=str, name="session_id"))
+        new.insert(0, "base_value", base_value)
+        new.insert(0, "model_version", model_version)
+        df = pd.concat([self.df[~self.df.index.isin(new.index)], new])
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if prune or not os.path.exists(self.path):
+            if prune:
+                df = df[df["model_version"] == model_version]
+            # A temporary file of its own, so concurrent writers never share one
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(self.path), suffix=".tmp",
+                                             delete=False) as tmp:
+                df.reset_index()[EXPLANATION_COLS].to_csv(tmp, index=False)
+            os.replace(tmp.name, self.path)
+        else:
+            # One write call per batch of rows, so appends from different processes do not interleave
+            rows = new.reset_index()[EXPLANATION_COLS].to_csv(header=False, index=False)
+            with open(self.path, "a") as f:
+                f.write(rows)
+        self.df = df
+
+
+def explain_session(session_id, features, model_path=MODEL_PATHS["iforest"], cache=None, model_version=None):
+    """
+    Attributions of one session as a Series indexed by feature, plus its
+    base value. Served from the cache when the current model was already
+    explained for it; computed in-process and cached otherwise. Callers
+    that keep the cache and the model's digest around pass them in.
+    """
+    cache = cache or ExplanationCache()
+    session_id = str(session_id)
+    model_version = model_version or artifact_digest(model_path)
+    row = cache.get(session_id, model_version)
+    if row is None:
+        values, base_value = attributions(np.asarray([features[FEATURE_COLS]], dtype=np.float64), model_path)
+        cache.add([session_id], model_version, values, base_value, prune=False)
+        row = cache.get(session_id, model_version)
+    return row[FEATURE_COLS].astype(float), float(row["base_value"])
+
+
+def main(threshold=DEFAULT_THRESHOLD, n_workers=1, chunk_size=256):
+    """Explains every session in artifacts/scores.csv with hybrid_score >= threshold not yet cached."""
+    scores = pd.read_csv("artifacts/scores.csv", dtype={"session_id": str})
+    flagged = scores[scores["hybrid_score"] >= threshold]
+    model_version = artifact_digest(MODEL_PATHS["iforest"])
+
+    cache = ExplanationCache()
+    todo = flagged[~cache.cached(flagged["session_id"], model_version)]
+    print(f"{len(flagged)} of {len(scores)} sessions above {threshold}; {len(flagged) - len(todo)} already explained")
+    if todo.empty:
+        return
+
+    start = time.perf_counter()
+    values, base_value = attributions(todo[FEATURE_COLS], n_workers=n_workers, chunk_size=chunk_size)
+    seconds = time.perf_counter() - start
+    cache.add(todo["session_id"], model_version, values, base_value)
+    print(f"Explained {len(todo)} sessions in {seconds:.2f}s")
+    print(f"Saved -> {cache.path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TreeSHAP explanations for the sessions above the hybrid threshold")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="explainer processes")
+    parser.add_argument("--chunk-size", type=int, default=256, help="sessions per task sent to a worker")
+    args = parser.parse_args()
+    main(threshold=args.threshold, n_workers=args.workers, chunk_size=args.chunk_size)
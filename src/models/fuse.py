@@ -1,15 +1,35 @@
 import pandas as pd
 import joblib
 import numpy as np
-from tensorflow import keras
 import json
-from tensorflow.keras.preprocessing.sequence import pad_sequences
+import argparse
+import os
+import sys
+
+from calibration import load_calibration, apply_range, artifact_digest
+from iforest_parallel import parallel_raw_scores
+from lstm_numpy import KERAS_PATH, NPZ_PATH, NumpyLSTMAutoencoder, pad_post
+from markov_prefilter import MARKOV_PATH, MarkovSequenceModel
+from sequence_batching import load_batching_config, masked_reconstruction_errors
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ingest.session_store import SessionStore
 
 # --- Parameters ---
 MAX_SEQ_LENGTH = 15  # Must match the value in lstm_autoencoder.py
+FEATURE_COLS = [
+    "session_duration", "n_events", "click_rate",
+    "avg_dwell_time", "click_variance", "page_entropy"
+]
+IFOREST_WEIGHT = 0.4
+LSTM_WEIGHT = 0.6
 
-def load_sequences():
+def load_sequences(store_path=None):
     """Loads all sequences and their corresponding session IDs."""
+    if store_path:
+        # The store's page codes are the encoded sequences; no JSON to parse
+        store = SessionStore(store_path)
+        return store.sequences(), store.session_ids
     sequences = []
     session_ids = []
     with open("data/sequences.jsonl") as f:
@@ -19,59 +39,197 @@ def load_sequences():
             session_ids.append(data["session_id"])
     return sequences, session_ids
 
-def main():
+def iforest_raw_scores(iforest, tabular_X):
+    """Isolation Forest anomaly scores; higher is more anomalous."""
+    # The decision_function gives a score where lower is more anomalous. We invert it.
+    return -iforest.decision_function(tabular_X)
+
+def load_lstm_model(backend="auto", keras_path=KERAS_PATH, npz_path=NPZ_PATH):
+    """
+    Loads the LSTM autoencoder for scoring.
+
+    backend="numpy" uses the exported weights (see lstm_numpy.py) and never
+    imports TensorFlow; "keras" loads the saved keras model. "auto" picks the
+    NumPy export when it was made from the current keras model.
+    """
+    if backend == "auto":
+        fresh = (os.path.exists(npz_path)
+                 and NumpyLSTMAutoencoder.load(npz_path).source_digest == artifact_digest(keras_path))
+        backend = "numpy" if fresh else "keras"
+    if backend == "numpy":
+        return NumpyLSTMAutoencoder.load(npz_path)
+    from tensorflow import keras
+    import lstm_layers  # Registers the custom layers of the bucketed model
+    return keras.models.load_model(keras_path, compile=False)
+
+def lstm_raw_scores(lstm_ae, sequences, on_batch=False, batching=None):
+    """
+    Per-sequence reconstruction error (MSE) of the LSTM autoencoder.
+
+    batching defaults to the config saved with the model: a model trained on
+    length buckets is scored on masked buckets (padding is not scored), older
+    models on sequences padded to MAX_SEQ_LENGTH.
+    """
+    batching = batching or load_batching_config()
+    if batching["batching"] == "bucketed":
+        return masked_reconstruction_errors(lstm_ae, sequences, batching["buckets"], on_batch=on_batch)
+
+    X_padded = pad_post(sequences, batching.get("max_seq_length", MAX_SEQ_LENGTH))
+    X_padded = X_padded.reshape((X_padded.shape[0], X_padded.shape[1], 1))
+
+    # Get the model's reconstruction of the input sequences
+    X_pred = lstm_ae.predict_on_batch(X_padded) if on_batch else lstm_ae.predict(X_padded)
+
+    # Calculate reconstruction error (MSE) for each sequence
+    return np.mean(np.power(X_padded - np.asarray(X_pred), 2), axis=(1, 2))
+
+def min_max_scale(values, lo, hi):
+    """Scales values to [0, 1] given the range [lo, hi]; a degenerate range maps to 0."""
+    if hi > lo:
+        return (values - lo) / (hi - lo)
+    return np.zeros_like(values, dtype=float)
+
+def hybrid_score(iforest_score, lstm_score):
+    return IFOREST_WEIGHT * iforest_score + LSTM_WEIGHT * lstm_score
+
+def markov_scores(markov, sequences, calibration):
+    """Normalized Markov pre-filter scores, in the order of sequences."""
+    raw = markov.raw_scores(sequences)
+    if "markov" in calibration:
+        return apply_range(raw, calibration["markov"])
+    return min_max_scale(raw, raw.min(), raw.max()) if len(raw) else raw
+
+def prefilter_score(iforest_score, markov_score):
+    """
+    First stage of cascade scoring: the hybrid score with the Markov model
+    standing in for the LSTM. Only sessions at or above the cutoff are
+    escalated to the LSTM; the others keep this score as their hybrid score,
+    so with a cutoff at or below the alert threshold they are never flagged.
+    """
+    return hybrid_score(iforest_score, markov_score)
+
+def placeholder_label(session_id):
+    # (This is your placeholder logic for ground truth labels)
+    return 1 if "bot" in str(session_id).lower() else 0
+
+def main(store_path=None, append=False, backend="auto", n_jobs=1, prefilter_cutoff=None):
+    """
+    Scores sessions with both models and writes artifacts/scores.csv.
+
+    With a calibration file (see calibration.py) raw scores are normalized with
+    the ranges frozen at training time, so each session's score is independent
+    of the rest of the batch. Without one, they fall back to the min-max of the
+    batch being scored. append=True scores only the sessions not yet in
+    scores.csv and appends them, which requires a calibration. n_jobs != 1
+    scores the Isolation Forest in chunks over that many processes (-1: all
+    cores), with the same result.
+
+    With a prefilter_cutoff only sessions whose prefilter_score reaches it
+    are scored by the LSTM (cascade scoring, see cascade.py to pick the
+    cutoff); the rest get the Markov score as lstm_score. The escalated
+    column records which sessions went through the LSTM.
+    """
     # --- Load Data and Models ---
-    df = pd.read_csv("data/features.csv")
-    feature_cols = [
-        "session_duration", "n_events", "click_rate", 
-        "avg_dwell_time", "click_variance", "page_entropy"
-    ]
-    tabular_X = df[feature_cols].values
+    # Session ids are compared as strings: the logs mix integer and "bot_..." ids
+    df = pd.read_csv("data/features.csv", dtype={"session_id": str})
+    sequences, session_ids = load_sequences(store_path)
+    session_ids = [str(sid) for sid in session_ids]
+
+    calibration = load_calibration()
+    calibrated = "iforest" in calibration and "lstm" in calibration
+    if append:
+        if not calibrated:
+            raise ValueError("--append needs artifacts/models/calibration.json; run calibration.py first")
+        if os.path.exists("artifacts/scores.csv"):
+            scored = set(pd.read_csv("artifacts/scores.csv", usecols=["session_id"], dtype={"session_id": str})["session_id"])
+            df = df[~df["session_id"].isin(scored)].reset_index(drop=True)
+            keep = [i for i, sid in enumerate(session_ids) if sid not in scored]
+            sequences = [sequences[i] for i in keep]
+            session_ids = [session_ids[i] for i in keep]
+        if df.empty:
+            print("No new sessions to score.")
+            return
+    elif not calibrated:
+        print("⚠️ No calibration found; normalizing scores over this batch.")
 
-    iforest = joblib.load("artifacts/models/iforest.pkl")
-    lstm_ae = keras.models.load_model("artifacts/models/lstm_ae.keras", compile=False)
+    tabular_X = df[FEATURE_COLS].values
 
     # --- 1. Calculate Isolation Forest Scores ---
-    # The decision_function gives a score where lower is more anomalous. We invert it.
-    if_scores = -iforest.decision_function(tabular_X)
+    if n_jobs == 1:
+        iforest = joblib.load("artifacts/models/iforest.pkl")
+        if_scores = iforest_raw_scores(iforest, tabular_X)
+    else:
+        if_scores = parallel_raw_scores(tabular_X, n_workers=n_jobs)
     # Normalize scores to be between 0 and 1
-    df["iforest_score"] = (if_scores - if_scores.min()) / (if_scores.max() - if_scores.min())
+    if calibrated:
+        df["iforest_score"] = apply_range(if_scores, calibration["iforest"])
+    else:
+        df["iforest_score"] = min_max_scale(if_scores, if_scores.min(), if_scores.max())
 
     # --- 2. Calculate LSTM Autoencoder Scores ---
-    sequences, session_ids = load_sequences()
-    X_padded = pad_sequences(sequences, maxlen=MAX_SEQ_LENGTH, padding='post')
-    X_padded = X_padded.reshape((X_padded.shape[0], X_padded.shape[1], 1))
-    
-    # Get the model's reconstruction of the input sequences
-    X_pred = lstm_ae.predict(X_padded)
-    
-    # Calculate reconstruction error (MSE) for each sequence
-    mse = np.mean(np.power(X_padded - X_pred, 2), axis=(1, 2))
+    if prefilter_cutoff is None:
+        escalated = np.ones(len(sequences), dtype=bool)
+    else:
+        if not os.path.exists(MARKOV_PATH):
+            raise ValueError(f"--prefilter-cutoff needs {MARKOV_PATH}; run markov_prefilter.py first")
+        markov_score = markov_scores(MarkovSequenceModel.load(), sequences, calibration)
+        # The Isolation Forest scores follow features.csv; line them up with the sequences
+        if_by_session = pd.Series(df["iforest_score"].to_numpy(), index=df["session_id"])
+        prefilter = prefilter_score(if_by_session.reindex(session_ids).to_numpy(), markov_score)
+        escalated = prefilter >= prefilter_cutoff
+        print(f"Escalated {escalated.sum()} of {len(escalated)} sessions to the LSTM "
+              f"({1 - escalated.mean():.1%} of LSTM calls saved)")
+
+    mse = np.full(len(sequences), np.nan)
+    if escalated.any():
+        lstm_ae = load_lstm_model(backend)
+        mse[escalated] = lstm_raw_scores(lstm_ae, [seq for seq, e in zip(sequences, escalated) if e])
     
     # Create a DataFrame for LSTM scores to merge them correctly
     lstm_scores_df = pd.DataFrame({'session_id': session_ids, 'lstm_score_raw': mse})
     
     # Normalize the MSE scores to be between 0 and 1
-    min_mse = lstm_scores_df['lstm_score_raw'].min()
-    max_mse = lstm_scores_df['lstm_score_raw'].max()
-    # Handle case where all errors are the same to avoid division by zero
-    if max_mse > min_mse:
-        lstm_scores_df["lstm_score"] = (lstm_scores_df['lstm_score_raw'] - min_mse) / (max_mse - min_mse)
+    if calibrated:
+        lstm_scores_df["lstm_score"] = apply_range(lstm_scores_df['lstm_score_raw'], calibration["lstm"])
     else:
-        lstm_scores_df["lstm_score"] = 0.0
+        min_mse = lstm_scores_df['lstm_score_raw'].min()
+        max_mse = lstm_scores_df['lstm_score_raw'].max()
+        # Handle case where all errors are the same to avoid division by zero
+        lstm_scores_df["lstm_score"] = min_max_scale(lstm_scores_df['lstm_score_raw'], min_mse, max_mse)
+    if prefilter_cutoff is not None:
+        lstm_scores_df.loc[~escalated, "lstm_score"] = markov_score[~escalated]
+        lstm_scores_df["escalated"] = escalated.astype(int)
 
     # Merge LSTM scores into the main DataFrame using session_id
-    df = pd.merge(df, lstm_scores_df[['session_id', 'lstm_score']], on='session_id')
+    df = pd.merge(df, lstm_scores_df.drop(columns="lstm_score_raw"), on='session_id')
 
     # --- 3. Fuse Scores into a Hybrid Score ---
-    df["hybrid_score"] = 0.4 * df["iforest_score"] + 0.6 * df["lstm_score"]
+    df["hybrid_score"] = hybrid_score(df["iforest_score"], df["lstm_score"])
     
-    # (This is your placeholder logic for ground truth labels)
-    df["label"] = df["session_id"].apply(lambda x: 1 if "bot" in str(x).lower() else 0)
+    df["label"] = df["session_id"].apply(placeholder_label)
 
     # --- Save Final Scores ---
-    df.to_csv("artifacts/scores.csv", index=False)
-    print("Saved -> artifacts/scores.csv")
+    if append and os.path.exists("artifacts/scores.csv"):
+        columns = pd.read_csv("artifacts/scores.csv", nrows=0).columns
+        if "escalated" in columns and "escalated" not in df:
+            df["escalated"] = 1  # Scored without the pre-filter: every session went through the LSTM
+        df[columns].to_csv("artifacts/scores.csv", mode="a", header=False, index=False)
+        print(f"Appended {len(df)} sessions -> artifacts/scores.csv")
+    else:
+        df.to_csv("artifacts/scores.csv", index=False)
+        print("Saved -> artifacts/scores.csv")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Score sessions with both models and fuse the scores")
+    parser.add_argument("--store", help="read sequences from a binary session store instead of data/sequences.jsonl")
+    parser.add_argument("--append", action="store_true",
+                        help="score only sessions missing from artifacts/scores.csv and append them (needs calibration)")
+    parser.add_argument("--backend", choices=["auto", "numpy", "keras"], default="auto",
+                        help="LSTM inference backend; numpy runs without importing TensorFlow")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="processes for Isolation Forest scoring (-1: all cores)")
+    parser.add_argument("--prefilter-cutoff", type=float,
+                        help="cascade scoring: only sessions whose pre-filter score reaches this go through the LSTM")
+    args = parser.parse_args()
+    main(store_path=args.store, append=args.append, backend=args.backend, n_jobs=args.jobs,
+         prefilter_cutoff=args.prefilter_cutoff)
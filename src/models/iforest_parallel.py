@@ -0,0 +1,94 @@
+import argparse
+import os
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from calibration import MODEL_PATHS
+
+# Chunked Isolation Forest scoring over a process pool. Each worker loads the
+# model once, memory-mapping its arrays from the joblib file, and reads its
+# rows from a memory-mapped copy of the feature matrix, so neither the model
+# nor the data is pickled per task. decision_function scores every row on
+# its own, so concatenating the chunks gives exactly the serial scores.
+DEFAULT_CHUNK_SIZE = 50000
+
+_model = None
+_X = None
+
+
+def _init_worker(model_path, X_path):
+    global _model, _X
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    _model = joblib.load(model_path, mmap_mode="r")
+    _X = np.load(X_path, mmap_mode="r")
+
+
+def _score_chunk(bounds):
+    start, stop = bounds
+    return -_model.decision_function(np.asarray(_X[start:stop]))
+
+
+def parallel_raw_scores(X, model_path=MODEL_PATHS["iforest"], n_workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Isolation Forest raw scores (higher is more anomalous) of the rows of X,
+    identical to fuse.iforest_raw_scores. n_workers=None or -1 uses every
+    core; a single worker or a matrix of one chunk is scored in-process.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    if n_workers is None or n_workers < 0:
+        n_workers = os.cpu_count()
+    n_workers = min(n_workers, -(-len(X) // chunk_size))
+    if n_workers <= 1:
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return -joblib.load(model_path).decision_function(X)
+
+    bounds = [(s, min(s + chunk_size, len(X))) for s in range(0, len(X), chunk_size)]
+    with tempfile.TemporaryDirectory() as tmp:
+        X_path = os.path.join(tmp, "X.npy")
+        np.save(X_path, X)
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(model_path, X_path)) as pool:
+            return np.concatenate(list(pool.map(_score_chunk, bounds)))
+
+
+def benchmark(n_rows=1000000, worker_counts=None, model_path=MODEL_PATHS["iforest"], chunk_size=DEFAULT_CHUNK_SIZE,
+              seed=0):
+    """
+    Prints rows/sec per worker count (default: powers of two up to the core
+    count) and checks every run against the single-worker scores.
+    """
+    import pandas as pd
+    from fuse import FEATURE_COLS
+
+    features = pd.read_csv("data/features.csv")[FEATURE_COLS].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    X = features[rng.integers(0, len(features), size=n_rows)]
+
+    n_cores = os.cpu_count()
+    if worker_counts is None:
+        worker_counts = [n for n in (1, 2, 4, 8, 16, 32, 64) if n < n_cores] + [n_cores]
+    print(f"Scoring {n_rows:,} rows on {n_cores} cores")
+    serial = None
+    for n_workers in sorted(set(worker_counts) | {1}):
+        start = time.perf_counter()
+        scores = parallel_raw_scores(X, model_path, n_workers, chunk_size)
+        seconds = time.perf_counter() - start
+        if serial is None:
+            serial = scores
+        identical = np.array_equal(scores, serial)
+        print(f"{n_workers:>3} workers: {n_rows / seconds:>12,.0f} rows/s "
+              f"({'identical to' if identical else 'DIFFERS from'} serial)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parallel Isolation Forest scoring against core count")
+    parser.add_argument("--rows", type=int, default=1000000, help="rows to score (resampled from data/features.csv)")
+    parser.add_argument("--workers", type=int, nargs="+", help="worker counts to try (default: up to the core count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    benchmark(n_rows=args.rows, worker_counts=args.workers, chunk_size=args.chunk_size)
@@ -0,0 +1,186 @@
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import IsolationForest
+
+from calibration import MODEL_PATHS, fit_range, save_calibration
+from fuse import FEATURE_COLS
+
+# Sliding-window Isolation Forest. The published artifact is a plain
+# IsolationForest (artifacts/models/iforest.pkl), so fuse.py, serve.py and
+# the parallel scorer use it unchanged; this module keeps the window of
+# recent feature rows and the age of every tree next to it.
+STATE_PATH = "artifacts/models/iforest_window.joblib"
+
+# Fitted IsolationForest attributes that hold one entry per tree and are
+# spliced when trees are replaced. They are private to scikit-learn; this
+# layout holds from 1.3 (which added the last two) through 1.9.
+TREE_ATTRS = ("estimators_", "estimators_features_", "_seeds", "_average_path_length_per_tree",
+              "_decision_path_lengths")
+SKLEARN_VERSIONS = ((1, 3), (1, 9))
+
+
+class WindowedIsolationForest:
+    """
+    Isolation Forest over the most recent window_size feature rows that is
+    refreshed by replacing its oldest trees.
+
+    An Isolation Forest score is 2 ** -(mean path length over the trees /
+    c(max_samples)), so as long as every tree is grown on max_samples rows
+    the trees can be swapped one by one. An update replaces a share of the
+    trees equal to the share of the window that is new (at least one tree,
+    at most max_refresh), growing the replacements on the current window.
+    Training cost therefore follows the amount of new data, not the length
+    of the history.
+
+    max_samples is min(256, window_size), scikit-learn's "auto" for a full
+    window. While the window holds fewer rows the trees use all of them, and
+    the first update after the window has grown past the forest's
+    max_samples regrows every tree at the larger size once.
+    """
+
+    def __init__(self, window_size=50000, n_estimators=100, max_refresh=0.25, contamination=0.05,
+                 random_state=42):
+        self.window_size = window_size
+        self.n_estimators = n_estimators
+        self.max_refresh = max_refresh
+        self.contamination = contamination
+        self.rng = np.random.default_rng(random_state)
+        self.model = None
+        self.window = None
+        self.tree_version = None  # Update counter at which each tree was grown
+        self.version = 0
+
+    def _forest(self, n_estimators, max_samples="auto"):
+        return IsolationForest(n_estimators=n_estimators, max_samples=max_samples, contamination=self.contamination,
+                               random_state=int(self.rng.integers(2 ** 31 - 1)))
+
+    def _max_samples(self):
+        return min(256, self.window_size, len(self.window))
+
+    def fit(self, X):
+        """Fits all trees on the last window_size rows of X."""
+        self.window = np.asarray(X, dtype=np.float64)[-self.window_size:]
+        self.model = self._forest(self.n_estimators, self._max_samples())
+        self.model.fit(pd.DataFrame(self.window, columns=FEATURE_COLS))
+        self.tree_version = np.zeros(self.n_estimators, dtype=np.int64)
+        self.version = 0
+        return self
+
+    def partial_fit(self, X_new):
+        """Slides the window over X_new and regrows the oldest trees; returns the number replaced."""
+        X_new = np.asarray(X_new, dtype=np.float64)
+        if len(X_new) == 0:
+            return 0
+        self.window = np.concatenate([self.window, X_new])[-self.window_size:]
+        if self.model.max_samples_ < self._max_samples():
+            # Trees of different sizes cannot share one normalization, so all of them are regrown
+            version = self.version + 1
+            self.fit(self.window)
+            self.tree_version[:] = self.version = version
+            return self.n_estimators
+        self.version += 1
+
+        share = min(len(X_new) / len(self.window), self.max_refresh)
+        n_replace = max(1, int(round(share * self.n_estimators)))
+        # max_samples_ is pinned so the new trees are normalized like the old ones
+        fresh = self._forest(n_replace, self.model.max_samples_)
+        fresh.fit(pd.DataFrame(self.window, columns=FEATURE_COLS))
+        _check_tree_attrs(self.model, fresh)
+
+        oldest = np.argsort(self.tree_version, kind="stable")[:n_replace]
+        model = self.model
+        for attr in TREE_ATTRS:
+            spliced = _spliced(getattr(model, attr), getattr(fresh, attr), oldest)
+            setattr(model, attr, tuple(spliced) if isinstance(getattr(model, attr), tuple) else spliced)
+        self.tree_version[oldest] = self.version
+
+        # The contamination threshold follows the window, like a full refit would
+        window_scores = model.score_samples(pd.DataFrame(self.window, columns=FEATURE_COLS))
+        model.offset_ = np.percentile(window_scores, 100.0 * self.contamination)
+        return n_replace
+
+    def raw_scores(self, X):
+        """Raw scores (higher is more anomalous), as fuse.iforest_raw_scores computes them."""
+        return -self.model.decision_function(pd.DataFrame(X, columns=FEATURE_COLS))
+
+    def publish(self, model_path=MODEL_PATHS["iforest"], state_path=STATE_PATH):
+        """
+        Writes the model and its calibration. The model file is replaced
+        atomically, so a reader sees either the old or the new forest; the
+        window state is saved last so a failed publish is simply retried.
+        """
+        _atomic_dump(self.model, model_path)
+        print(f"Saved -> {model_path}")
+        save_calibration("iforest", fit_range(self.raw_scores(self.window)))
+        _atomic_dump(self, state_path)
+        print(f"Saved -> {state_path} (version {self.version}, {len(self.window)} rows in window)")
+
+    @classmethod
+    def load(cls, state_path=STATE_PATH):
+        return joblib.load(state_path)
+
+
+def _check_tree_attrs(*forests):
+    """Fails clearly when scikit-learn no longer stores the per-tree state TREE_ATTRS names."""
+    version = tuple(int(part) for part in sklearn.__version__.split(".")[:2] if part.isdigit())
+    missing = sorted({attr for forest in forests for attr in TREE_ATTRS
+                      if len(getattr(forest, attr, ())) != len(forest.estimators_)})
+    tested = " to ".join(".".join(map(str, v)) for v in SKLEARN_VERSIONS)
+    if missing:
+        raise RuntimeError(f"scikit-learn {sklearn.__version__} stores IsolationForest trees differently "
+                           f"({', '.join(missing)} not found per tree); partial updates need scikit-learn "
+                           f"{tested}. Run 'init' to refit instead.")
+    if not SKLEARN_VERSIONS[0] <= version <= SKLEARN_VERSIONS[1]:
+        print(f"⚠️ scikit-learn {sklearn.__version__} is outside the versions partial updates were checked "
+              f"with ({tested}).")
+
+
+def _spliced(current, fresh, positions):
+    items = list(current)
+    for position, item in zip(positions, fresh):
+        items[position] = item
+    return items if not isinstance(current, np.ndarray) else np.asarray(items, dtype=current.dtype)
+
+
+def _atomic_dump(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+
+def main(command, features_path, window_size=50000, max_refresh=0.25):
+    """init fits the window from features_path; update slides it over the rows of features_path."""
+    X = pd.read_csv(features_path)[FEATURE_COLS].to_numpy(dtype=np.float64)
+    start = time.perf_counter()
+    if command == "init":
+        windowed = WindowedIsolationForest(window_size=window_size, max_refresh=max_refresh).fit(X)
+        print(f"Fitted {windowed.n_estimators} trees on {len(windowed.window)} rows")
+    else:
+        windowed = WindowedIsolationForest.load()
+        n_replaced = windowed.partial_fit(X)
+        print(f"Replaced {n_replaced}/{windowed.n_estimators} trees with {len(X)} new rows")
+    print(f"Training took {time.perf_counter() - start:.2f}s")
+    windowed.publish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sliding-window Isolation Forest with partial tree refreshes")
+    parser.add_argument("command", choices=["init", "update"],
+                        help="init: fit on the features file; update: add its rows to the window")
+    parser.add_argument("features", nargs="?",
+                        help="feature CSV (data/features.csv layout): the rows to fit for init (default: "
+                             "data/features.csv), only the new rows for update (required)")
+    parser.add_argument("--window-size", type=int, default=50000, help="number of recent rows kept (init only)")
+    parser.add_argument("--max-refresh", type=float, default=0.25,
+                        help="largest share of the trees replaced by one update (init only)")
+    args = parser.parse_args()
+    if args.command == "update" and not args.features:
+        parser.error("update needs a feature CSV with only the new rows; the window already holds the old ones")
+    main(args.command, args.features or "data/features.csv", window_size=args.window_size, max_refresh=args.max_refresh)
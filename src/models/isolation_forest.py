@@ -1,9 +1,11 @@
+import argparse
+
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 import joblib
 
-# Load the newly generated features
-df = pd.read_csv("data/features.csv")
+from calibration import fit_range, save_calibration
+from iforest_parallel import parallel_raw_scores
 
 # Define the feature set for the model
 feature_cols = [
@@ -14,12 +16,50 @@ feature_cols = [
     "click_variance",
     "page_entropy"
 ]
-X = df[feature_cols]
 
-# Initialize and train the Isolation Forest model
-model = IsolationForest(contamination=0.05, random_state=42)
-model.fit(X)
 
-# Save the trained model
-joblib.dump(model, "artifacts/models/iforest.pkl")
-print("Saved -> artifacts/models/iforest.pkl")
+def main(n_jobs=1):
+    """
+    Trains the Isolation Forest on data/features.csv.
+
+    With n_jobs != 1 the trees are built in that many worker processes (-1
+    uses every core). The per-tree random seeds are drawn before the work
+    is split up, so the fitted forest is the same for any n_jobs.
+
+    The training rows are not sharded across the workers: every tree
+    already fits on its own max_samples (256) subsample of the full matrix,
+    and drawing those subsamples from per-worker shards would give a
+    different forest for each n_jobs, so parallel and serial scores would
+    no longer match.
+    """
+    # Load the newly generated features
+    df = pd.read_csv("data/features.csv")
+    X = df[feature_cols]
+
+    # Initialize and train the Isolation Forest model
+    model = IsolationForest(contamination=0.05, random_state=42)
+    if n_jobs == 1:
+        model.fit(X)
+    else:
+        # sklearn builds the trees in threads by default; small trees are
+        # dominated by Python overhead, so use processes instead
+        with joblib.parallel_backend("loky", n_jobs=n_jobs):
+            model.set_params(n_jobs=n_jobs).fit(X)
+        # The saved model scores serially unless asked otherwise
+        model.set_params(n_jobs=None)
+
+    # Save the trained model
+    joblib.dump(model, "artifacts/models/iforest.pkl")
+    print("Saved -> artifacts/models/iforest.pkl")
+
+    # Freeze the score range seen on the training data so fuse.py can score new
+    # sessions on their own (lower decision_function is more anomalous, so invert it)
+    raw = parallel_raw_scores(X.to_numpy(), n_workers=n_jobs) if n_jobs != 1 else -model.decision_function(X)
+    save_calibration("iforest", fit_range(raw))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Isolation Forest on the session features")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes for building trees (-1: all cores)")
+    args = parser.parse_args()
+    main(n_jobs=args.jobs)
@@ -1,33 +1,41 @@
 import numpy as np
 import json
+import argparse
+import os
+import sys
 from tensorflow import keras
 from tensorflow.keras import layers
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 
+from calibration import fit_range, save_calibration
+from lstm_numpy import export_weights
+from lstm_layers import RepeatToLength
+from sequence_batching import (
+    DEFAULT_BUCKETS, PAD_VALUE, bucket_batches, masked_reconstruction_errors, save_batching_config
+)
+from sequence_dataset import DEFAULT_SHUFFLE_BUFFER, sequence_dataset, reconstruction_errors
+
 # --- Parameters ---
 MAX_SEQ_LENGTH = 15  # Max length of a session sequence
 EMBEDDING_DIM = 8   # Dimension for page embeddings
+CHECKPOINT_DIR = "artifacts/checkpoints/lstm_ae"  # Backups of interrupted --stream runs
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ingest.session_store import SessionStore
 
-def load_data():
-    """Loads sequences from the jsonl file."""
+def load_data(store_path=None):
+    """Loads sequences from the jsonl file, or zero-copy from a session store."""
+    if store_path:
+        return SessionStore(store_path).sequences()
     sequences = []
     with open("data/sequences.jsonl") as f:
         for line in f:
             sequences.append(json.loads(line)["sequence"])
     return sequences
 
-def main():
-    """Trains the LSTM Autoencoder on the clickstream sequences."""
-    sequences = load_data()
-
-    # Pad sequences to ensure they all have the same length
-    X_padded = pad_sequences(sequences, maxlen=MAX_SEQ_LENGTH, padding='post')
-
-    # Reshape data for LSTM input: (samples, timesteps, features)
-    X_padded = X_padded.reshape((X_padded.shape[0], X_padded.shape[1], 1))
-
-    # --- Define the Autoencoder Model Architecture ---
-    model = keras.Sequential([
+def build_model():
+    """The fixed-shape autoencoder: every sequence is padded to MAX_SEQ_LENGTH."""
+    return keras.Sequential([
         # Encoder part
         layers.LSTM(32, activation="relu", input_shape=(MAX_SEQ_LENGTH, 1), return_sequences=True),
         layers.LSTM(16, activation="relu", return_sequences=False),
@@ -38,17 +46,124 @@ def main():
         layers.TimeDistributed(layers.Dense(1))
     ])
 
+def build_masked_model():
+    """
+    The same encoder/decoder stack for variable-length input: padded steps
+    are masked out of the LSTMs and the decoder repeats the encoding to the
+    length of each batch instead of a fixed MAX_SEQ_LENGTH.
+    """
+    inputs = keras.Input(shape=(None, 1))
+    masked = layers.Masking(mask_value=PAD_VALUE)(inputs)
+    # Encoder part
+    x = layers.LSTM(32, activation="relu", return_sequences=True)(masked)
+    encoded = layers.LSTM(16, activation="relu", return_sequences=False)(x)
+    x = RepeatToLength()([encoded, masked])
+    # Decoder part
+    x = layers.LSTM(16, activation="relu", return_sequences=True)(x)
+    x = layers.LSTM(32, activation="relu", return_sequences=True)(x)
+    # Dense acts on the last axis, which is what TimeDistributed(Dense(1)) does,
+    # without TimeDistributed's per-step loop over a variable time dimension
+    outputs = layers.Dense(1)(x)
+    return keras.Model(inputs, outputs)
+
+def train_bucketed(sequences, buckets=DEFAULT_BUCKETS, epochs=20, batch_size=16):
+    """Trains the masked model on length-bucketed batches; the loss only covers real steps."""
+    model = build_masked_model()
     model.compile(optimizer="adam", loss="mse")
     model.summary()
 
-    # --- Train the Model ---
-    # The model learns to reconstruct its own input.
-    # Anomalies will have a higher reconstruction error.
-    model.fit(X_padded, X_padded, epochs=20, batch_size=16, shuffle=True, verbose=2)
+    for epoch in range(epochs):
+        losses = []
+        for _, X, mask in bucket_batches(sequences, buckets, batch_size, shuffle=True, seed=epoch):
+            losses.append(model.train_on_batch(X, X, sample_weight=mask.astype(np.float32)))
+        print(f"Epoch {epoch + 1}/{epochs} - loss: {np.mean(losses):.4f}")
+    return model
+
+def train_streaming(data_pattern, bucketed=False, buckets=DEFAULT_BUCKETS, epochs=20, batch_size=256,
+                    shuffle_buffer=DEFAULT_SHUFFLE_BUFFER, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Trains from a tf.data pipeline over the sequence files instead of an
+    in-memory array. Progress is backed up to checkpoint_dir after every
+    epoch; an interrupted run started again with the same arguments resumes
+    from the last completed epoch.
+    """
+    model = build_masked_model() if bucketed else build_model()
+    model.compile(optimizer="adam", loss="mse")
+    model.summary()
+
+    dataset = sequence_dataset(data_pattern, batch_size, bucketed, MAX_SEQ_LENGTH, buckets,
+                               shuffle=True, shuffle_buffer=shuffle_buffer)
+    backup = keras.callbacks.BackupAndRestore(backup_dir=checkpoint_dir)
+    model.fit(dataset, epochs=epochs, callbacks=[backup], verbose=2)
+    return model
+
+def main(store_path=None, bucketed=False, buckets=DEFAULT_BUCKETS, epochs=20, batch_size=16,
+         stream=False, data_pattern="data/sequences.jsonl", shuffle_buffer=DEFAULT_SHUFFLE_BUFFER):
+    """Trains the LSTM Autoencoder on the clickstream sequences."""
+    if stream:
+        model = train_streaming(data_pattern, bucketed, buckets, epochs, batch_size, shuffle_buffer)
+    elif bucketed:
+        sequences = load_data(store_path)
+        model = train_bucketed(sequences, buckets, epochs, batch_size)
+    else:
+        sequences = load_data(store_path)
+        # Pad sequences to ensure they all have the same length
+        X_padded = pad_sequences(sequences, maxlen=MAX_SEQ_LENGTH, padding='post')
+
+        # Reshape data for LSTM input: (samples, timesteps, features)
+        X_padded = X_padded.reshape((X_padded.shape[0], X_padded.shape[1], 1))
+
+        # --- Define the Autoencoder Model Architecture ---
+        model = build_model()
+
+        model.compile(optimizer="adam", loss="mse")
+        model.summary()
+
+        # --- Train the Model ---
+        # The model learns to reconstruct its own input.
+        # Anomalies will have a higher reconstruction error.
+        model.fit(X_padded, X_padded, epochs=epochs, batch_size=batch_size, shuffle=True, verbose=2)
 
     # --- Save the Trained Model ---
     model.save("artifacts/models/lstm_ae.keras")
     print("\nSaved -> artifacts/models/lstm_ae.keras")
+    if bucketed:
+        save_batching_config({"batching": "bucketed", "buckets": list(buckets)})
+    else:
+        save_batching_config({"batching": "fixed", "max_seq_length": MAX_SEQ_LENGTH})
+
+    # Export the weights for TensorFlow-free scoring (lstm_numpy.py)
+    export_weights()
+
+    # Freeze the range of training reconstruction errors for fuse.py
+    if stream:
+        mse = reconstruction_errors(model, sequence_dataset(data_pattern, 4096, bucketed, MAX_SEQ_LENGTH, buckets,
+                                                            shuffle=False))
+    elif bucketed:
+        mse = masked_reconstruction_errors(model, sequences, buckets)
+    else:
+        mse = np.mean(np.power(X_padded - model.predict(X_padded), 2), axis=(1, 2))
+    save_calibration("lstm", fit_range(mse))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the LSTM autoencoder on the click sequences")
+    parser.add_argument("--store", help="read sequences from a binary session store instead of data/sequences.jsonl")
+    parser.add_argument("--bucketed", action="store_true",
+                        help="train on length-bucketed, masked batches instead of padding everything to MAX_SEQ_LENGTH")
+    parser.add_argument("--buckets", type=int, nargs="+", default=list(DEFAULT_BUCKETS),
+                        help="bucket boundaries (sequence lengths) for --bucketed; the largest is the max length")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=None, help="default: 16, or 256 with --stream")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream training data from disk through tf.data instead of loading it into memory")
+    parser.add_argument("--data", default="data/sequences.jsonl",
+                        help="sequence file(s) for --stream; a glob pattern reads several shards in parallel")
+    parser.add_argument("--shuffle-buffer", type=int, default=DEFAULT_SHUFFLE_BUFFER,
+                        help="number of sequences held in the --stream shuffle buffer")
+    args = parser.parse_args()
+    if args.stream and args.store:
+        parser.error("--stream reads sequence files; it cannot be combined with --store")
+    batch_size = args.batch_size or (256 if args.stream else 16)
+    main(store_path=args.store, bucketed=args.bucketed, buckets=tuple(sorted(args.buckets)),
+         epochs=args.epochs, batch_size=batch_size, stream=args.stream, data_pattern=args.data,
+         shuffle_buffer=args.shuffle_buffer)
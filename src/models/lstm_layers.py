@@ -0,0 +1,22 @@
+from tensorflow import keras
+
+
+@keras.utils.register_keras_serializable(package="lstm_ae")
+class RepeatToLength(keras.layers.Layer):
+    """
+    RepeatVector whose length follows a second (sequence) input, so one model
+    can decode batches of any length. It passes the sequence's mask on, which
+    keeps padded steps out of the decoder's state updates.
+    """
+
+    def call(self, inputs):
+        vector, sequence = inputs
+        timesteps = keras.ops.shape(sequence)[1]
+        return keras.ops.repeat(keras.ops.expand_dims(vector, 1), timesteps, axis=1)
+
+    def compute_mask(self, inputs, mask=None):
+        return None if mask is None else mask[1]
+
+    def compute_output_shape(self, input_shape):
+        vector_shape, sequence_shape = input_shape
+        return (vector_shape[0], sequence_shape[1], vector_shape[1])
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# NumPy-only inference for the LSTM autoencoder. Importing this module must
+# not import TensorFlow; only export_weights() and the parity check need it.
+KERAS_PATH = "artifacts/models/lstm_ae.keras"
+NPZ_PATH = "artifacts/models/lstm_ae.npz"
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 0.5 * (1 + np.tanh(0.5 * x)),  # Overflow-free form of 1 / (1 + exp(-x))
+    "hard_sigmoid": lambda x: np.clip(0.2 * x + 0.5, 0, 1),
+}
+
+
+def pad_post(sequences, maxlen, dtype=np.int32):
+    """
+    NumPy equivalent of keras pad_sequences(sequences, maxlen, padding='post'):
+    zero-pads at the end and, like keras, truncates long sequences from the front.
+    """
+    X = np.zeros((len(sequences), maxlen), dtype=dtype)
+    for i, seq in enumerate(sequences):
+        seq = np.asarray(seq)[-maxlen:]
+        X[i, :len(seq)] = seq
+    return X
+
+
+def export_weights(keras_path=KERAS_PATH, npz_path=NPZ_PATH):
+    """Dumps the layer stack and weights of the trained autoencoder to a flat .npz."""
+    from tensorflow import keras
+    from calibration import artifact_digest
+
+    model = keras.models.load_model(keras_path, compile=False)
+    spec = []
+    arrays = {}
+    for i, layer in enumerate(model.layers):
+        kind = type(layer).__name__
+        cfg = layer.get_config()
+        weights = layer.get_weights()
+        if kind == "LSTM":
+            spec.append({"type": "lstm", "units": cfg["units"], "activation": cfg["activation"],
+                         "recurrent_activation": cfg["recurrent_activation"],
+                         "return_sequences": cfg["return_sequences"]})
+            arrays[f"{i}_kernel"], arrays[f"{i}_recurrent_kernel"], arrays[f"{i}_bias"] = weights
+        elif kind == "RepeatVector":
+            spec.append({"type": "repeat", "n": cfg["n"]})
+        elif kind == "Masking":
+            spec.append({"type": "masking", "mask_value": cfg["mask_value"]})
+        elif kind == "RepeatToLength":
+            spec.append({"type": "repeat_to_length"})
+        elif kind in ("Dense", "TimeDistributed"):
+            inner = layer.layer.get_config() if kind == "TimeDistributed" else cfg
+            spec.append({"type": "dense", "activation": inner["activation"]})
+            arrays[f"{i}_kernel"], arrays[f"{i}_bias"] = weights
+        elif kind in ("InputLayer", "Dropout"):
+            spec.append({"type": "identity"})
+        else:
+            raise ValueError(f"Layer type {kind} is not supported by the NumPy forward pass")
+
+    np.savez(npz_path, spec=np.array(json.dumps(spec)), source_digest=np.array(artifact_digest(keras_path)),
+             **{k: v.astype(np.float32) for k, v in arrays.items()})
+    print(f"Saved -> {npz_path}")
+    return npz_path
+
+
+class NumpyLSTMAutoencoder:
+    """
+    Vectorized NumPy forward pass of the exported autoencoder.
+
+    Exposes predict/predict_on_batch like a keras model so fuse.py can use
+    either. The input projection of every LSTM layer is computed for all
+    timesteps in one matmul; only the recurrent part runs step by step.
+    Models with a Masking layer follow keras mask semantics: masked steps
+    leave the LSTM state unchanged.
+    """
+
+    def __init__(self, spec, arrays, source_digest=None):
+        self.spec = spec
+        self.arrays = arrays
+        self.source_digest = source_digest
+
+    @classmethod
+    def load(cls, npz_path=NPZ_PATH):
+        with np.load(npz_path) as data:
+            spec = json.loads(str(data["spec"]))
+            digest = str(data["source_digest"]) if "source_digest" in data else None
+            arrays = {k: data[k] for k in data.files if k not in ("spec", "source_digest")}
+        return cls(spec, arrays, digest)
+
+    def _lstm(self, i, layer, x, mask=None):
+        W = self.arrays[f"{i}_kernel"]
+        U = self.arrays[f"{i}_recurrent_kernel"]
+        b = self.arrays[f"{i}_bias"]
+        units = layer["units"]
+        act = ACTIVATIONS[layer["activation"]]
+        rec_act = ACTIVATIONS[layer["recurrent_activation"]]
+
+        batch, timesteps, _ = x.shape
+        # Input contribution of every timestep at once; gate order is i, f, c, o
+        xw = (x.reshape(-1, x.shape[-1]) @ W + b).reshape(batch, timesteps, 4 * units)
+        h = np.zeros((batch, units), dtype=np.float32)
+        c = np.zeros((batch, units), dtype=np.float32)
+        outputs = np.empty((batch, timesteps, units), dtype=np.float32) if layer["return_sequences"] else None
+        for t in range(timesteps):
+            z = xw[:, t] + h @ U
+            i_gate = rec_act(z[:, :units])
+            f_gate = rec_act(z[:, units:2 * units])
+            candidate = act(z[:, 2 * units:3 * units])
+            o_gate = rec_act(z[:, 3 * units:])
+            c_new = f_gate * c + i_gate * candidate
+            h_new = o_gate * act(c_new)
+            if mask is None:
+                h, c = h_new, c_new
+            else:
+                step = mask[:, t:t + 1]
+                h = np.where(step, h_new, h)
+                c = np.where(step, c_new, c)
+            if outputs is not None:
+                outputs[:, t] = h
+        return outputs if outputs is not None else h
+
+    def predict(self, X, batch_size=4096, verbose=0):
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) > batch_size:
+            return np.concatenate([self.predict_on_batch(X[s:s + batch_size]) for s in range(0, len(X), batch_size)])
+        return self.predict_on_batch(X)
+
+    def predict_on_batch(self, X):
+        x = np.asarray(X, dtype=np.float32)
+        mask = None
+        timesteps = x.shape[1]
+        for i, layer in enumerate(self.spec):
+            kind = layer["type"]
+            if kind == "masking":
+                mask = np.any(x != layer["mask_value"], axis=-1)
+            elif kind == "lstm":
+                x = self._lstm(i, layer, x, mask)
+            elif kind == "repeat":
+                x = np.repeat(x[:, None, :], layer["n"], axis=1)
+            elif kind == "repeat_to_length":
+                x = np.repeat(x[:, None, :], timesteps, axis=1)
+            elif kind == "dense":
+                x = ACTIVATIONS[layer["activation"]](x @ self.arrays[f"{i}_kernel"] + self.arrays[f"{i}_bias"])
+        return x
+
+
+def check_parity(keras_path=KERAS_PATH, npz_path=NPZ_PATH, atol=1e-4):
+    """
+    Compares the NumPy forward pass with keras predict on data/sequences.jsonl,
+    using the batching the model was trained with (fixed or bucketed).
+    """
+    from tensorflow import keras
+    import lstm_layers  # Registers the custom layers of the bucketed model
+    from fuse import load_sequences, lstm_raw_scores
+
+    sequences, _ = load_sequences()
+    keras_model = keras.models.load_model(keras_path, compile=False)
+    numpy_model = NumpyLSTMAutoencoder.load(npz_path)
+    mse_keras = lstm_raw_scores(keras_model, sequences)
+    mse_numpy = lstm_raw_scores(numpy_model, sequences)
+    max_err = float(np.max(np.abs(mse_numpy - mse_keras)))
+    print(f"Max abs difference in per-session MSE: {max_err:.2e} over {len(sequences)} sequences")
+    if max_err > atol:
+        raise AssertionError(f"NumPy forward pass differs from keras by {max_err:.2e} (> {atol})")
+    return max_err
+
+
+def _time_subprocess(code):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.getcwd(), env=dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3"))
+    return time.perf_counter() - start, out.stdout.strip()
+
+
+def benchmark(keras_path=KERAS_PATH, npz_path=NPZ_PATH, n_sessions=100000):
+    """Prints cold-start time, peak RSS and throughput of both inference paths."""
+    models_dir = os.path.dirname(os.path.abspath(__file__))
+    rss = "import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024)"
+    startup = {
+        "keras": f"from tensorflow import keras; keras.models.load_model({keras_path!r}, compile=False); {rss}",
+        "numpy": f"import sys; sys.path.insert(0, {models_dir!r}); from lstm_numpy import NumpyLSTMAutoencoder; "
+                 f"NumpyLSTMAutoencoder.load({npz_path!r}); {rss}",
+    }
+    for name, code in startup.items():
+        seconds, peak_mb = _time_subprocess(code)
+        print(f"{name:>6} startup: {seconds:.2f}s, peak RSS {peak_mb} MB")
+
+    from tensorflow import keras
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 4, size=(n_sessions, 15, 1)).astype(np.float32)
+    models = {"keras": keras.models.load_model(keras_path, compile=False),
+              "numpy": NumpyLSTMAutoencoder.load(npz_path)}
+    for name, model in models.items():
+        model.predict(X[:1024], verbose=0)
+        start = time.perf_counter()
+        model.predict(X, batch_size=4096, verbose=0)
+        seconds = time.perf_counter() - start
+        print(f"{name:>6} throughput: {n_sessions / seconds:,.0f} sessions/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the LSTM autoencoder for TensorFlow-free inference")
+    parser.add_argument("command", nargs="?", choices=["export", "check", "benchmark"], default="export")
+    parser.add_argument("--keras", default=KERAS_PATH)
+    parser.add_argument("--npz", default=NPZ_PATH)
+    args = parser.parse_args()
+    if args.command == "export":
+        export_weights(args.keras, args.npz)
+        check_parity(args.keras, args.npz)
+    elif args.command == "check":
+        check_parity(args.keras, args.npz)
+    else:
+        benchmark(args.keras, args.npz)
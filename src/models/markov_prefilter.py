@@ -0,0 +1,101 @@
+import argparse
+import json
+
+import numpy as np
+
+from calibration import MODEL_PATHS, fit_range, save_calibration
+
+# Cheap first-stage sequence model for cascade scoring (see fuse.py): a
+# first-order Markov chain over page codes. A session's score is its
+# negative log-likelihood per transition, including the transitions from the
+# start and to the end of the session, so unusual orders and unusual lengths
+# both raise it. Scoring is a handful of NumPy operations over all sessions
+# at once, orders of magnitude cheaper than the LSTM autoencoder.
+MARKOV_PATH = MODEL_PATHS["markov"]
+
+
+def _flatten(sequences):
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+    codes = np.concatenate([np.asarray(seq, dtype=np.int64) for seq in sequences] or [np.zeros(0, np.int64)])
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return codes, offsets
+
+
+class MarkovSequenceModel:
+    """
+    Page transition probabilities with add-alpha smoothing.
+
+    States 0..n_pages-1 are page codes. Row n_pages is the start of a
+    session and column n_pages its end, so log_probs[n_pages, p] is the
+    log-probability of starting on page p and log_probs[p, n_pages] that of
+    leaving after p. Codes not seen in training get a uniform probability.
+    """
+
+    def __init__(self, log_probs):
+        self.log_probs = log_probs
+
+    @property
+    def n_pages(self):
+        return self.log_probs.shape[0] - 1
+
+    @classmethod
+    def fit(cls, sequences, alpha=1.0):
+        codes, offsets = _flatten(sequences)
+        n_pages = int(codes.max()) + 1 if len(codes) else 0
+        prev, nxt = _transitions(codes, offsets, n_pages)
+        counts = np.full((n_pages + 1, n_pages + 1), alpha, dtype=np.float64)
+        np.add.at(counts, (prev, nxt), 1)
+        return cls(np.log(counts / counts.sum(axis=1, keepdims=True)))
+
+    @classmethod
+    def load(cls, path=MARKOV_PATH):
+        with np.load(path) as data:
+            return cls(data["log_probs"])
+
+    def save(self, path=MARKOV_PATH):
+        np.savez(path, log_probs=self.log_probs)
+
+    def raw_scores(self, sequences):
+        """Negative log-likelihood per transition of every sequence; higher is more anomalous."""
+        codes, offsets = _flatten(sequences)
+        n_pages = self.n_pages
+        prev, nxt = _transitions(np.where((codes >= 0) & (codes < n_pages), codes, -1), offsets, n_pages)
+        unknown = (prev < 0) | (nxt < 0)
+        log_p = self.log_probs[np.maximum(prev, 0), np.maximum(nxt, 0)]
+        log_p[unknown] = -np.log(n_pages + 1)
+
+        # Session i owns the len_i + 1 transitions starting at offsets[i] + i
+        n_sessions = len(offsets) - 1
+        total = np.concatenate([[0.0], np.cumsum(log_p)])
+        sums = total[offsets[1:] + np.arange(1, n_sessions + 1)] - total[offsets[:-1] + np.arange(n_sessions)]
+        return -sums / (np.diff(offsets) + 1)
+
+
+def _transitions(codes, offsets, n_pages):
+    """
+    (from, to) state pairs of every session in order: start -> first page,
+    page -> page, last page -> end. A session of n pages has n + 1 of them.
+    """
+    # With the start/end marker (n_pages) between sessions and at both ends,
+    # consecutive states are exactly these pairs: a session's end marker is
+    # the next one's start marker
+    states = np.append(np.insert(codes, offsets[:-1], n_pages), n_pages)
+    return states[:-1], states[1:]
+
+
+def main(alpha=1.0):
+    """Fits the Markov model on data/sequences.jsonl and freezes its score range."""
+    with open("data/sequences.jsonl") as f:
+        sequences = [json.loads(line)["sequence"] for line in f]
+    markov = MarkovSequenceModel.fit(sequences, alpha=alpha)
+    markov.save()
+    print(f"Saved -> {MARKOV_PATH}")
+    save_calibration("markov", fit_range(markov.raw_scores(sequences)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the Markov pre-filter used by cascade scoring")
+    parser.add_argument("--alpha", type=float, default=1.0, help="add-alpha smoothing of the transition counts")
+    args = parser.parse_args()
+    main(alpha=args.alpha)
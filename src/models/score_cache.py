@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from calibration import MODEL_PATHS, artifact_digest, load_calibration, apply_range
+from fuse import (
+    FEATURE_COLS, load_lstm_model, iforest_raw_scores, lstm_raw_scores, min_max_scale, hybrid_score, placeholder_label
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from features.batch_features import flatten_sessions, compute_features_batch, split_sequences
+
+CACHE_PATH = "artifacts/cache/score_cache.csv"
+CACHE_COLS = (["content_hash"] + FEATURE_COLS
+              + ["sequence", "iforest_version", "iforest_raw", "lstm_version", "lstm_raw"])
+
+
+def page_map_digest(page_map):
+    """Digest of a page map, independent of the order of its entries."""
+    canonical = json.dumps(page_map, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def session_hash(events, page_map_version=""):
+    """
+    Content hash of a session's events under a page map version; sessions
+    with identical events share cache entries. The cached click sequence is
+    encoded with that page map, so a different map never hits the entry.
+    """
+    canonical = page_map_version + json.dumps(events, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ScoreCache:
+    """
+    Per-session features and raw model scores, keyed by content hash (of
+    the events and of the page map their sequence is encoded with).
+
+    Raw scores are stored together with the digest of the model artifact
+    that produced them, so retraining one model only invalidates that
+    model's column. Calibration is applied when scores are written out, as
+    it is cheap and changes with every retraining anyway.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        if os.path.exists(path):
+            df = pd.read_csv(path, dtype={"content_hash": str, "sequence": str,
+                                          "iforest_version": str, "lstm_version": str},
+                             keep_default_na=False, na_values={"iforest_raw": [""], "lstm_raw": [""]})
+            self.df = df.drop_duplicates("content_hash", keep="last").set_index("content_hash")
+        else:
+            self.df = pd.DataFrame(columns=CACHE_COLS).set_index("content_hash")
+
+    def lookup(self, hashes):
+        """Cached rows for hashes, in order; hashes not in the cache get empty rows."""
+        return self.df.reindex(pd.Index(hashes, name="content_hash"))
+
+    def save(self, df):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        df.reset_index()[CACHE_COLS].to_csv(tmp, index=False)
+        os.replace(tmp, self.path)
+        self.df = df
+
+
+def _load_page_map(path="artifacts/models/page_map.json"):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def main(prune=True):
+    """
+    Incremental refresh of data/features.csv, data/sequences.jsonl and
+    artifacts/scores.csv from logs/sessions.jsonl.
+
+    Only sessions whose events are not in the cache get features computed,
+    and only rows whose cached score came from an older model artifact are
+    rescored by that model.
+    """
+    sessions = []
+    with open("logs/sessions.jsonl") as f:
+        for line in f:
+            sessions.append(json.loads(line))
+
+    # Existing page codes never change; new pages get the next free codes in sorted order, so a
+    # map built from scratch matches make_features.py. A new page or a rewritten page_map.json
+    # changes the map's digest and with it every key.
+    page_map = _load_page_map()
+    new_pages = {event["page"] for s in sessions for event in s["events"]} - set(page_map)
+    for page in sorted(new_pages):
+        page_map[page] = len(page_map)
+    page_map_version = page_map_digest(page_map)
+    hashes = [session_hash(s["events"], page_map_version) for s in sessions]
+
+    cache = ScoreCache()
+    # One row per distinct content, in first-seen order
+    first_seen = {}
+    for i, h in enumerate(hashes):
+        first_seen.setdefault(h, i)
+    table = cache.lookup(list(first_seen))
+
+    # --- 1. Features for new or changed sessions ---
+    new_rows = table["n_events"].isna().to_numpy()
+    new_sessions = [sessions[i] for i, is_new in zip(first_seen.values(), new_rows) if is_new]
+
+    if new_sessions:
+        _, timestamps, page_codes, offsets = flatten_sessions(new_sessions, page_map)
+        features = compute_features_batch(timestamps, page_codes, offsets, n_pages=len(page_map))
+        for col in FEATURE_COLS:
+            table.loc[new_rows, col] = features[col]
+        table.loc[new_rows, "sequence"] = [" ".join(map(str, seq)) for seq in split_sequences(page_codes, offsets)]
+    print(f"Features: {int(new_rows.sum())} computed, {int((~new_rows).sum())} from cache")
+
+    os.makedirs("artifacts/models", exist_ok=True)
+    with open("artifacts/models/page_map.json", "w") as f:
+        json.dump(page_map, f)
+
+    sequences = [[int(code) for code in seq.split()] for seq in table["sequence"].fillna("")]
+
+    # --- 2. Isolation Forest scores for rows scored by another model version ---
+    iforest_version = artifact_digest(MODEL_PATHS["iforest"])
+    stale = (table["iforest_version"] != iforest_version).to_numpy()
+    if stale.any():
+        iforest = joblib.load(MODEL_PATHS["iforest"])
+        table.loc[stale, "iforest_raw"] = iforest_raw_scores(iforest, table.loc[stale, FEATURE_COLS].astype(float))
+        table.loc[stale, "iforest_version"] = iforest_version
+    print(f"Isolation Forest: {int(stale.sum())} scored, {int((~stale).sum())} from cache")
+
+    # --- 3. LSTM scores, likewise ---
+    lstm_version = artifact_digest(MODEL_PATHS["lstm"])
+    stale = (table["lstm_version"] != lstm_version).to_numpy()
+    if stale.any():
+        lstm_ae = load_lstm_model()
+        stale_sequences = [seq for seq, is_stale in zip(sequences, stale) if is_stale]
+        table.loc[stale, "lstm_raw"] = lstm_raw_scores(lstm_ae, stale_sequences)
+        table.loc[stale, "lstm_version"] = lstm_version
+    print(f"LSTM autoencoder: {int(stale.sum())} scored, {int((~stale).sum())} from cache")
+
+    sequence_of = dict(zip(table.index, sequences))
+    if not prune:
+        table = pd.concat([cache.df[~cache.df.index.isin(table.index)], table])
+    cache.save(table)
+    print(f"Saved -> {cache.path}")
+
+    # --- 4. Write the per-session outputs in log order ---
+    rows = table.loc[hashes].reset_index(drop=True)
+    session_ids = [s["session_id"] for s in sessions]
+
+    df_features = rows[FEATURE_COLS].copy()
+    df_features["n_events"] = df_features["n_events"].astype(np.int64)
+    df_features["session_duration"] = df_features["session_duration"].astype(np.int64)
+    df_features.insert(0, "session_id", session_ids)
+    df_features.to_csv("data/features.csv", index=False)
+    print("Saved -> data/features.csv")
+
+    with open("data/sequences.jsonl", "w") as f:
+        for session_id, h in zip(session_ids, hashes):
+            f.write(json.dumps({"session_id": session_id,
+                                "sequence": sequence_of[h]}) + "\n")
+    print("Saved -> data/sequences.jsonl")
+
+    if_raw = rows["iforest_raw"].to_numpy(dtype=float)
+    lstm_raw = rows["lstm_raw"].to_numpy(dtype=float)
+    calibration = load_calibration()
+    scores = df_features
+    if "iforest" in calibration and "lstm" in calibration:
+        scores["iforest_score"] = apply_range(if_raw, calibration["iforest"])
+        scores["lstm_score"] = apply_range(lstm_raw, calibration["lstm"])
+    else:
+        print("⚠️ No calibration found; normalizing scores over this batch.")
+        scores["iforest_score"] = min_max_scale(if_raw, if_raw.min(), if_raw.max())
+        scores["lstm_score"] = min_max_scale(lstm_raw, lstm_raw.min(), lstm_raw.max())
+    scores["hybrid_score"] = hybrid_score(scores["iforest_score"], scores["lstm_score"])
+    scores["label"] = scores["session_id"].apply(placeholder_label)
+    scores.to_csv("artifacts/scores.csv", index=False)
+    print("Saved -> artifacts/scores.csv")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Incrementally refresh features and scores, reusing cached results for unchanged sessions")
+    parser.add_argument("--keep-stale", action="store_true",
+                        help="keep cache entries of sessions no longer in the log")
+    args = parser.parse_args()
+    main(prune=not args.keep_stale)
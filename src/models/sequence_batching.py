@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Length-bucketed, masked batching for the LSTM autoencoder. Sessions are
+# grouped by length and each batch is only padded up to its bucket boundary;
+# a mask marks the real steps so padding is neither learned nor scored.
+# Page codes are shifted by one so that 0 only ever means "padding".
+DEFAULT_BUCKETS = (4, 8, 16, 32, 64)
+PAD_VALUE = 0
+CONFIG_PATH = "artifacts/models/lstm_ae.json"
+
+
+def save_batching_config(config, path=CONFIG_PATH):
+    """Records how the saved model expects its input batches (written at training time)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(config, f)
+    print(f"Saved -> {path}")
+
+
+@lru_cache(maxsize=4)
+def _read_config(path, mtime):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_batching_config(path=CONFIG_PATH):
+    """The batching the current model was trained with; models without a config use fixed padding."""
+    if not os.path.exists(path):
+        return {"batching": "fixed"}
+    return _read_config(path, os.path.getmtime(path))
+
+
+def bucket_batches(sequences, buckets=DEFAULT_BUCKETS, batch_size=256, shuffle=False, seed=None):
+    """
+    Yields (indices, X, mask) batches where X has shape (n, bucket, 1).
+
+    Each session goes to the smallest bucket that fits it; sessions longer
+    than the largest bucket keep their most recent steps, like pad_sequences
+    does. With shuffle=True, sessions are shuffled within buckets and the
+    batches of all buckets are interleaved in random order.
+    """
+    buckets = np.asarray(sorted(buckets))
+    max_len = int(buckets[-1])
+    lengths = np.fromiter((min(len(s), max_len) for s in sequences), dtype=np.int64, count=len(sequences))
+    bucket_of = np.searchsorted(buckets, lengths, side="left")
+    rng = np.random.default_rng(seed)
+
+    batches = []
+    for b in range(len(buckets)):
+        members = np.flatnonzero(bucket_of == b)
+        if shuffle:
+            members = rng.permutation(members)
+        batches.extend((int(buckets[b]), members[s:s + batch_size]) for s in range(0, len(members), batch_size))
+    if shuffle:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+
+    for width, indices in batches:
+        X = np.full((len(indices), width), PAD_VALUE, dtype=np.float32)
+        for row, i in enumerate(indices):
+            n = lengths[i]
+            if n:
+                X[row, :n] = np.asarray(sequences[i][-n:]) + 1
+        mask = np.arange(width) < lengths[indices][:, None]
+        yield indices, X[..., None], mask
+
+
+def masked_mse(X, X_pred, mask):
+    """Per-session reconstruction error over the real (unmasked) steps only."""
+    sq_err = np.square(X - np.asarray(X_pred))[..., 0]
+    return (sq_err * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+
+
+def masked_reconstruction_errors(model, sequences, buckets=DEFAULT_BUCKETS, batch_size=1024, on_batch=False):
+    """Masked MSE of every sequence, scored bucket by bucket and returned in input order."""
+    errors = np.zeros(len(sequences), dtype=np.float64)
+    for indices, X, mask in bucket_batches(sequences, buckets, batch_size):
+        X_pred = model.predict_on_batch(X) if on_batch else model.predict(X, verbose=0)
+        errors[indices] = masked_mse(X, X_pred, mask)
+    return errors
+
+
+def benchmark(n_sessions=200000, max_len=64, buckets=DEFAULT_BUCKETS, seed=0):
+    """
+    Scores synthetic sessions with the current model both ways: padded to one
+    fixed shape, and bucketed. Needs a model trained with --bucketed.
+    """
+    from fuse import load_lstm_model
+
+    model = load_lstm_model()
+    rng = np.random.default_rng(seed)
+    # Mostly short sessions with a long tail, like real traffic
+    lengths = np.minimum(rng.geometric(1 / 8, size=n_sessions), max_len)
+    sequences = [rng.integers(0, 4, size=n) for n in lengths]
+
+    for name, bucket_set in [("fixed", (max_len,)), ("bucketed", tuple(b for b in buckets if b <= max_len))]:
+        steps = sum(X.shape[1] * len(X) for _, X, _ in bucket_batches(sequences, bucket_set, 4096))
+        start = time.perf_counter()
+        masked_reconstruction_errors(model, sequences, bucket_set, batch_size=4096)
+        seconds = time.perf_counter() - start
+        print(f"{name:>9}: {n_sessions / seconds:,.0f} sessions/s, "
+              f"{1 - lengths.sum() / steps:.0%} of computed steps are padding")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fixed-shape and length-bucketed LSTM scoring throughput")
+    parser.add_argument("--sessions", type=int, default=200000)
+    parser.add_argument("--max-len", type=int, default=64)
+    args = parser.parse_args()
+    benchmark(n_sessions=args.sessions, max_len=args.max_len)
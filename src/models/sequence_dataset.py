@@ -0,0 +1,87 @@
+import numpy as np
+import tensorflow as tf
+
+from sequence_batching import DEFAULT_BUCKETS, PAD_VALUE, masked_mse
+
+# tf.data input pipeline for training the LSTM autoencoder straight from
+# sequences.jsonl files. Lines are read, shuffled in a bounded buffer,
+# parsed in parallel and batched on the fly, so memory depends on the
+# shuffle buffer and batch size, not on the number of sessions.
+DEFAULT_SHUFFLE_BUFFER = 10000
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def parse_sequence(line):
+    """Page codes of one {"session_id": ..., "sequence": [...]} line as an int32 vector."""
+    inner = tf.strings.regex_replace(line, r'^.*"sequence":\s*\[([^\]]*)\].*$', r"\1")
+    # Splitting on whitespace (not ",") turns an empty sequence into an empty vector
+    tokens = tf.strings.split(tf.strings.regex_replace(inner, ",", " "))
+    return tf.strings.to_number(tokens, out_type=tf.int32)
+
+
+def _lines(pattern, shuffle):
+    files = tf.data.Dataset.list_files(pattern, shuffle=shuffle)
+    return files.interleave(tf.data.TextLineDataset, cycle_length=AUTOTUNE, num_parallel_calls=AUTOTUNE,
+                            deterministic=not shuffle)
+
+
+def sequence_dataset(pattern="data/sequences.jsonl", batch_size=256, bucketed=False, max_seq_length=15,
+                     buckets=DEFAULT_BUCKETS, shuffle=True, shuffle_buffer=DEFAULT_SHUFFLE_BUFFER, seed=None):
+    """
+    Batches of (X, X) for the fixed-shape model, or (X, X, mask) for the
+    bucketed one, read from every file matching pattern.
+
+    The fixed layout matches pad_sequences(maxlen=max_seq_length,
+    padding='post'). The bucketed layout matches sequence_batching: codes
+    are shifted by one, sessions are grouped by length and padded to the
+    longest in their batch, and empty sessions are skipped (they carry no
+    loss). With shuffle=False the fixed layout keeps file order.
+    """
+    ds = _lines(pattern, shuffle)
+    if shuffle:
+        ds = ds.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(parse_sequence, num_parallel_calls=AUTOTUNE, deterministic=not shuffle)
+
+    if bucketed:
+        buckets = sorted(buckets)
+        ds = ds.filter(lambda codes: tf.size(codes) > 0)
+        ds = ds.map(lambda codes: codes[-buckets[-1]:] + 1, num_parallel_calls=AUTOTUNE, deterministic=not shuffle)
+        # Boundaries are exclusive upper bounds, so length b still lands in bucket b
+        ds = ds.bucket_by_sequence_length(
+            lambda codes: tf.shape(codes)[0],
+            bucket_boundaries=[b + 1 for b in buckets[:-1]],
+            bucket_batch_sizes=[batch_size] * len(buckets),
+            padding_values=PAD_VALUE,
+        )
+        ds = ds.map(_with_mask, num_parallel_calls=AUTOTUNE)
+    else:
+        ds = ds.map(lambda codes: codes[-max_seq_length:], num_parallel_calls=AUTOTUNE, deterministic=not shuffle)
+        ds = ds.padded_batch(batch_size, padded_shapes=[max_seq_length], padding_values=0)
+        ds = ds.map(_as_autoencoder_pair, num_parallel_calls=AUTOTUNE)
+
+    options = tf.data.Options()
+    options.deterministic = not shuffle
+    return ds.with_options(options).prefetch(AUTOTUNE)
+
+
+def _as_autoencoder_pair(codes):
+    X = tf.cast(codes, tf.float32)[..., None]
+    return X, X
+
+
+def _with_mask(codes):
+    X = tf.cast(codes, tf.float32)[..., None]
+    return X, X, tf.cast(codes != PAD_VALUE, tf.float32)
+
+
+def reconstruction_errors(model, dataset):
+    """Per-session reconstruction error over a dataset from sequence_dataset(), in dataset order."""
+    errors = []
+    for batch in dataset:
+        X = batch[0].numpy()
+        X_pred = model.predict_on_batch(X)
+        if len(batch) == 3:
+            errors.append(masked_mse(X, X_pred, batch[2].numpy()))
+        else:
+            errors.append(np.mean(np.square(X - X_pred), axis=(1, 2)))
+    return np.concatenate(errors) if errors else np.zeros(0)
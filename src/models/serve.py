@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import joblib
+import numpy as np
+import pandas as pd
+from fuse import (
+    FEATURE_COLS, load_sequences, load_lstm_model, iforest_raw_scores, lstm_raw_scores, hybrid_score
+)
+from calibration import load_calibration, fit_range, apply_range
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from features.batch_features import UNKNOWN_PAGE, flatten_sessions, compute_features_batch
+
+
+class LatencyStats:
+    """Rolling window of request latencies and batch sizes."""
+
+    def __init__(self, window=10000):
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.n_requests = 0
+        self.n_sessions = 0
+        self._lock = threading.Lock()
+
+    def record_batch(self, n_sessions):
+        with self._lock:
+            self.batch_sizes.append(n_sessions)
+            self.n_sessions += n_sessions
+
+    def record_request(self, latency_ms):
+        with self._lock:
+            self.latencies_ms.append(latency_ms)
+            self.n_requests += 1
+
+    def summary(self):
+        with self._lock:
+            latencies = np.asarray(self.latencies_ms)
+            batches = np.asarray(self.batch_sizes)
+            n_requests, n_sessions = self.n_requests, self.n_sessions
+        summary = {"requests": n_requests, "sessions": n_sessions}
+        if len(latencies):
+            summary.update({
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "max_ms": float(latencies.max()),
+            })
+        if len(batches):
+            summary["mean_batch_size"] = float(batches.mean())
+        return summary
+
+
+class Scorer:
+    """Holds both models in memory and scores a batch of raw sessions."""
+
+    def __init__(self, models_dir="artifacts/models", backend="auto"):
+        self.iforest_path = os.path.join(models_dir, "iforest.pkl")
+        self.iforest_mtime = os.stat(self.iforest_path).st_mtime_ns
+        self.iforest = joblib.load(self.iforest_path)
+        self.lstm_ae = load_lstm_model(backend, os.path.join(models_dir, "lstm_ae.keras"),
+                                       os.path.join(models_dir, "lstm_ae.npz"))
+        with open(os.path.join(models_dir, "page_map.json")) as f:
+            self.page_map = json.load(f)
+        self.unknown_code = self.page_map.get(UNKNOWN_PAGE, len(self.page_map))
+        self.calibration = load_calibration()
+
+    def fit_bounds(self, features_path="data/features.csv"):
+        """
+        Fills in calibration missing from artifacts/models/calibration.json by
+        scoring the reference dataset once, so a session's scores never depend
+        on what else is in its batch.
+        """
+        if "iforest" not in self.calibration:
+            df = pd.read_csv(features_path)
+            self.calibration["iforest"] = fit_range(iforest_raw_scores(self.iforest, df[FEATURE_COLS]))
+        if "lstm" not in self.calibration:
+            sequences, _ = load_sequences()
+            self.calibration["lstm"] = fit_range(lstm_raw_scores(self.lstm_ae, sequences))
+
+    def reload_if_changed(self):
+        """
+        Picks up an Isolation Forest republished in place (see
+        incremental_iforest.py) together with its calibration. Artifacts are
+        swapped with os.replace, so a changed mtime means a complete file.
+        """
+        mtime = os.stat(self.iforest_path).st_mtime_ns
+        if mtime == self.iforest_mtime:
+            return False
+        self.iforest = joblib.load(self.iforest_path)
+        self.iforest_mtime = mtime
+        calibration = load_calibration()
+        if "iforest" in calibration:
+            self.calibration["iforest"] = calibration["iforest"]
+        else:
+            del self.calibration["iforest"]
+            self.fit_bounds()
+        print(f"Reloaded {self.iforest_path}")
+        return True
+
+    def warmup(self, max_batch_size):
+        """Runs a few dummy batches so graph tracing happens before the first request."""
+        for batch_size in sorted({1, 2, 3, max_batch_size}):
+            lstm_raw_scores(self.lstm_ae, [[0]] * batch_size, on_batch=True)
+
+    def score(self, sessions):
+        session_ids, timestamps, page_codes, offsets = flatten_sessions(sessions, self.page_map, self.unknown_code)
+        features = compute_features_batch(timestamps, page_codes, offsets, n_pages=self.unknown_code + 1)
+        tabular_X = pd.DataFrame(features, columns=FEATURE_COLS)
+        sequences = np.split(page_codes, offsets[1:-1])
+
+        if_raw = iforest_raw_scores(self.iforest, tabular_X)
+        lstm_raw = lstm_raw_scores(self.lstm_ae, sequences, on_batch=True)
+        if_score = apply_range(if_raw, self.calibration["iforest"])
+        lstm_score = apply_range(lstm_raw, self.calibration["lstm"])
+        hybrid = hybrid_score(if_score, lstm_score)
+        return [
+            {"session_id": sid, "iforest_score": float(a), "lstm_score": float(b), "hybrid_score": float(c)}
+            for sid, a, b, c in zip(session_ids, if_score, lstm_score, hybrid)
+        ]
+
+
+class MicroBatcher:
+    """
+    Collects concurrent scoring requests into micro-batches.
+
+    A batch is dispatched as soon as it holds max_batch_size sessions or
+    max_wait_ms has passed since its first request arrived, whichever comes
+    first. One worker thread owns the models, so the forward passes never
+    interleave.
+    """
+
+    def __init__(self, scorer, max_batch_size=64, max_wait_ms=5.0, stats=None):
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats or LatencyStats()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, sessions):
+        future = Future()
+        self._queue.put((sessions, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        n_sessions = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_sessions < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            n_sessions += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            sessions = [s for item in pending for s in item[0]]
+            try:
+                self.scorer.reload_if_changed()
+                results = self.scorer.score(sessions) if sessions else []
+            except Exception:
+                # Score the requests one by one so only the one that fails gets the error
+                self._run_separately(pending)
+                continue
+            self.stats.record_batch(len(sessions))
+
+            start = 0
+            done = time.perf_counter()
+            for request_sessions, future, enqueued in pending:
+                future.set_result(results[start:start + len(request_sessions)])
+                start += len(request_sessions)
+                self.stats.record_request((done - enqueued) * 1000)
+
+    def _run_separately(self, pending):
+        for request_sessions, future, enqueued in pending:
+            try:
+                results = self.scorer.score(request_sessions) if request_sessions else []
+            except Exception as exc:
+                future.set_exception(exc)
+                continue
+            self.stats.record_batch(len(request_sessions))
+            future.set_result(results)
+            self.stats.record_request((time.perf_counter() - enqueued) * 1000)
+
+
+def validate_sessions(payload):
+    """
+    The session records of a /score payload, one record or a list of them
+    in the logs/sessions.jsonl shape. Raises ValueError on anything the
+    scorer could not handle, so a bad request is rejected before it joins a
+    batch.
+    """
+    sessions = payload if isinstance(payload, list) else [payload]
+    for i, s in enumerate(sessions):
+        if not isinstance(s, dict) or "session_id" not in s or "events" not in s:
+            raise ValueError(f"session {i}: needs 'session_id' and 'events'")
+        if not isinstance(s["session_id"], (str, int)) or isinstance(s["session_id"], bool):
+            raise ValueError(f"session {i}: 'session_id' must be a string or an integer")
+        if not isinstance(s["events"], list):
+            raise ValueError(f"session {i}: 'events' must be a list")
+        # An empty session has no click sequence to reconstruct, so it has no meaningful score
+        if not s["events"]:
+            raise ValueError(f"session {i}: 'events' is empty")
+        for j, event in enumerate(s["events"]):
+            if not isinstance(event, dict) or not isinstance(event.get("page"), str):
+                raise ValueError(f"session {i}, event {j}: needs a string 'page'")
+            # Timestamps are whole milliseconds, as in the logs; 1200.0 is accepted, 1200.5 is not
+            t = event.get("t_rel_ms")
+            if (not isinstance(t, (int, float)) or isinstance(t, bool) or not np.isfinite(t)
+                    or t != int(t) or abs(t) >= 2 ** 53):
+                raise ValueError(f"session {i}, event {j}: 't_rel_ms' must be a whole number of milliseconds")
+    return sessions
+
+
+def make_handler(batcher):
+    class ScoreHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send_json(200, batcher.stats.summary())
+            elif self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                sessions = validate_sessions(payload)
+            except (ValueError, TypeError) as exc:
+                self._send_json(400, {"error": str(exc)})
+                return
+            try:
+                results = batcher.submit(sessions).result()
+            except Exception as exc:
+                self._send_json(500, {"error": str(exc)})
+                return
+            self._send_json(200, results if isinstance(payload, list) else results[0])
+
+        def log_message(self, format, *args):
+            pass  # Keep the request path quiet; latency is reported on /stats
+
+    return ScoreHandler
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # The default backlog of 5 drops bursts of concurrent clients
+
+
+def main(host="127.0.0.1", port=8000, max_batch_size=64, max_wait_ms=5.0, backend="auto"):
+    scorer = Scorer(backend=backend)
+    scorer.fit_bounds()
+    scorer.warmup(max_batch_size)
+    batcher = MicroBatcher(scorer, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = ScoringServer((host, port), make_handler(batcher))
+    print(f"Scoring service listening on http://{host}:{port} "
+          f"(max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+    print("POST /score with a session record or a list of them; GET /stats for p50/p99 latency")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(batcher.stats.summary()))
+
+
+def check(backend="auto"):
+    """
+    Sends a malformed and a valid request into the same batch and checks
+    that the validation rejects the malformed one and that, with the
+    validation skipped, only the malformed one gets an error.
+    """
+    scorer = Scorer(backend=backend)
+    scorer.fit_bounds()
+    with open("logs/sessions.jsonl") as f:
+        valid = json.loads(f.readline())
+    malformed = {"session_id": "malformed", "events": [{"t_rel_ms": "soon"}]}
+    try:
+        validate_sessions([malformed])
+        print("❌ Validation accepted a session whose event has no page")
+        return False
+    except ValueError as exc:
+        print(f"✅ Validation rejects the malformed session ({exc})")
+
+    # A long wait and no size limit put both requests into one batch
+    batcher = MicroBatcher(scorer, max_batch_size=1000, max_wait_ms=500)
+    bad, good = batcher.submit([malformed]), batcher.submit([valid])
+    ok = bad.exception() is not None and good.exception() is None
+    if ok:
+        result = good.result()[0]
+        print(f"✅ Only the malformed request failed ({type(bad.exception()).__name__}); "
+              f"session {result['session_id']} scored {result['hybrid_score']:.4f}")
+    else:
+        print(f"❌ Malformed request: {bad.exception()!r}, valid request: {good.exception()!r}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident scoring service with micro-batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=64,
+                        help="dispatch a batch once it holds this many sessions")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="longest time a request waits for others to join its batch")
+    parser.add_argument("--backend", choices=["auto", "numpy", "keras"], default="auto",
+                        help="LSTM inference backend; numpy keeps TensorFlow out of the process")
+    parser.add_argument("--check", action="store_true",
+                        help="check that a malformed request does not fail the others in its batch and exit")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check(args.backend) else 1)
+    main(host=args.host, port=args.port, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+         backend=args.backend)
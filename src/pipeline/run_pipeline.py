@@ -0,0 +1,243 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Runs the pipeline scripts as a dependency graph and skips every stage that
+# is up to date. A stage's fingerprint is the content hash of its inputs, of
+# its script and the local modules the script imports, and of its arguments;
+# a stage runs again only when that fingerprint changed or one of its
+# outputs is missing or no longer what the stage wrote. Because outputs are
+# compared by content, a stage that reruns but writes identical files does
+# not invalidate the stages after it. Stages whose inputs are ready run
+# concurrently, each as its own process.
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+STATE_PATH = "artifacts/pipeline/state.json"
+RUNS_PATH = "artifacts/pipeline/runs.jsonl"
+LOG_DIR = "artifacts/pipeline/logs"
+
+# (stage, script under src/, arguments, inputs, outputs). A stage depends on
+# the stages that write its inputs. calibration.json is shared by the
+# training stages and not declared; fuse.py checks it against the models.
+STAGES = [
+    ("build_sessions", "ingest/build_sessions.py", [], ["logs/sessions.jsonl"], ["data/raw_sessions.csv"]),
+    ("make_features", "features/make_features.py", [], ["logs/sessions.jsonl"],
+     ["data/features.csv", "data/sequences.jsonl", "artifacts/models/page_map.json"]),
+    ("create_labels", "ingest/create_labels.py", [], ["data/features.csv"], ["labels.csv"]),
+    ("isolation_forest", "models/isolation_forest.py", [], ["data/features.csv"], ["artifacts/models/iforest.pkl"]),
+    ("lstm_autoencoder", "models/lstm_autoencoder.py", [], ["data/sequences.jsonl"],
+     ["artifacts/models/lstm_ae.keras", "artifacts/models/lstm_ae.npz", "artifacts/models/lstm_ae.json"]),
+    ("markov_prefilter", "models/markov_prefilter.py", [], ["data/sequences.jsonl"], ["artifacts/models/markov.npz"]),
+    ("fuse", "models/fuse.py", [],
+     ["data/features.csv", "data/sequences.jsonl", "artifacts/models/iforest.pkl", "artifacts/models/lstm_ae.keras",
+      "artifacts/models/lstm_ae.npz", "artifacts/models/lstm_ae.json"],
+     ["artifacts/scores.csv"]),
+    ("evaluate", "eval/evaluate.py", [], ["artifacts/scores.csv"],
+     ["artifacts/reports/ranked_anomalies.csv", "artifacts/reports/score_distribution.png"]),
+    ("evaluate_threshold", "eval/evaluate_threshold.py", [], ["artifacts/scores.csv"],
+     ["artifacts/reports/roc_curve.png", "artifacts/reports/pr_curve.png"]),
+]
+
+
+class Fingerprints:
+    """
+    sha256 of file contents, remembered with the file's size and mtime so
+    an unchanged file is not read again on the next run.
+    """
+
+    def __init__(self, known=None):
+        self.known = known or {}
+
+    def digest(self, path):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        entry = self.known.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["digest"]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        self.known[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": h.hexdigest()}
+        return h.hexdigest()
+
+
+def local_imports(script_path):
+    """The script and every module under src/ it imports, directly or indirectly."""
+    seen = set()
+    todo = [os.path.normpath(script_path)]
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        names = [alias.name for node in ast.walk(tree) if isinstance(node, ast.Import) for alias in node.names]
+        names += [node.module for node in ast.walk(tree)
+                  if isinstance(node, ast.ImportFrom) and node.module and not node.level]
+        for name in names:
+            # Scripts import their neighbours directly and other src/ packages as "package.module"
+            for base in (os.path.dirname(path), SRC_DIR):
+                candidate = os.path.normpath(os.path.join(base, *name.split(".")) + ".py")
+                if os.path.exists(candidate):
+                    todo.append(candidate)
+                    break
+    return sorted(seen)
+
+
+def stage_key(stage, fingerprints):
+    """Fingerprint of everything a stage's result depends on."""
+    _, script, args, inputs, _ = stage
+    h = hashlib.sha256(json.dumps(args).encode())
+    for path in local_imports(os.path.join(SRC_DIR, script)):
+        h.update(os.path.relpath(path, SRC_DIR).encode() + b"\0" + fingerprints.digest(path).encode())
+    for path in inputs:
+        h.update(path.encode() + b"\0" + (fingerprints.digest(path) or "missing").encode())
+    return h.hexdigest()
+
+
+def _load_state():
+    if not os.path.exists(STATE_PATH):
+        return {"files": {}, "stages": {}}
+    with open(STATE_PATH) as f:
+        return json.load(f)
+
+
+def _save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, STATE_PATH)
+
+
+def _run_script(stage):
+    name, script, args, _, _ = stage
+    os.makedirs(LOG_DIR, exist_ok=True)
+    with open(os.path.join(LOG_DIR, f"{name}.log"), "w") as log:
+        start = time.perf_counter()
+        returncode = subprocess.call([sys.executable, os.path.join(SRC_DIR, script), *args], stdout=log,
+                                     stderr=subprocess.STDOUT, env=dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3"))
+    return returncode, time.perf_counter() - start
+
+
+def upstream(targets):
+    """targets and every stage they depend on, in pipeline order."""
+    writers = {path: stage[0] for stage in STAGES for path in stage[4]}
+    needed = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            stage = next(s for s in STAGES if s[0] == name)
+            todo.extend(writers[path] for path in stage[3] if path in writers)
+    return [stage for stage in STAGES if stage[0] in needed]
+
+
+def run(targets=None, force=(), n_jobs=2, dry_run=False):
+    """
+    Brings targets (default: every stage) up to date and returns the
+    number of failed stages. force names stages to rerun regardless of
+    their fingerprint ("all" for every stage). Stages after a failed one
+    are not run.
+    """
+    stages = upstream(targets) if targets else list(STAGES)
+    state = _load_state()
+    fingerprints = Fingerprints(state["files"])
+    writers = {path: stage[0] for stage in stages for path in stage[4]}
+    deps = {stage[0]: {writers[p] for p in stage[3] if p in writers} for stage in stages}
+    pending = {stage[0]: stage for stage in stages}
+    status = {}
+    record = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": []}
+    run_start = time.perf_counter()
+
+    n_jobs = max(1, n_jobs)
+    with ThreadPoolExecutor(n_jobs) as pool:
+        running = {}
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if len(running) >= n_jobs:
+                    break
+                if any(status.get(dep) not in ("ran", "skipped", "would run") for dep in deps[name]):
+                    if any(status.get(dep) in ("failed", "blocked") for dep in deps[name]):
+                        del pending[name]
+                        status[name] = "blocked"
+                        record["stages"].append({"stage": name, "status": "blocked"})
+                        print(f"{name:<19} blocked by a failed stage")
+                    continue
+                del pending[name]
+                # Inputs are final once the stages writing them are done, so the key is computed now
+                key = stage_key(stage, fingerprints)
+                done = state["stages"].get(name, {})
+                recorded = done.get("outputs")
+                outputs_ok = bool(recorded) and all(fingerprints.digest(p) == d for p, d in recorded.items())
+                upstream_changes = any(status[dep] == "would run" for dep in deps[name])
+                if (done.get("key") == key and outputs_ok and not upstream_changes
+                        and name not in force and "all" not in force):
+                    status[name] = "skipped"
+                    record["stages"].append({"stage": name, "status": "skipped"})
+                    print(f"{name:<19} up to date")
+                elif dry_run:
+                    status[name] = "would run"
+                    print(f"{name:<19} would run")
+                else:
+                    print(f"{name:<19} running ...")
+                    running[pool.submit(_run_script, stage)] = (stage, key)
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                name = stage[0]
+                returncode, seconds = future.result()
+                missing = [path for path in stage[4] if not os.path.exists(path)]
+                if returncode != 0 or missing:
+                    status[name] = "failed"
+                    reason = f"exit code {returncode}" if returncode else f"did not write {', '.join(missing)}"
+                    print(f"{name:<19} FAILED after {seconds:.1f}s ({reason}), see {LOG_DIR}/{name}.log")
+                    state["stages"].pop(name, None)
+                else:
+                    status[name] = "ran"
+                    state["stages"][name] = {"key": key, "seconds": round(seconds, 3),
+                                             "outputs": {path: fingerprints.digest(path) for path in stage[4]},
+                                             "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                    print(f"{name:<19} done in {seconds:.1f}s")
+                record["stages"].append({"stage": name, "status": status[name], "seconds": round(seconds, 3)})
+                _save_state(state)
+
+    if dry_run:
+        return 0
+    _save_state(state)
+    record["seconds"] = round(time.perf_counter() - run_start, 3)
+    with open(RUNS_PATH, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    n_ran = sum(1 for s in status.values() if s == "ran")
+    n_failed = sum(1 for s in status.values() if s in ("failed", "blocked"))
+    print(f"{n_ran} stage(s) ran, {len(status) - n_ran - n_failed} up to date, {n_failed} failed or blocked "
+          f"in {record['seconds']:.1f}s")
+    print(f"Saved -> {RUNS_PATH}")
+    return n_failed
+
+
+if __name__ == "__main__":
+    names = [stage[0] for stage in STAGES]
+    parser = argparse.ArgumentParser(description="Run the pipeline stages that are out of date")
+    parser.add_argument("stages", nargs="*",
+                        help="stages to bring up to date, with the stages they depend on (default: all)")
+    parser.add_argument("--force", nargs="+", default=[], choices=names + ["all"], help="rerun these stages anyway")
+    parser.add_argument("--jobs", type=int, default=2, help="stages run at the same time")
+    parser.add_argument("--dry-run", action="store_true", help="only show which stages would run")
+    args = parser.parse_args()
+    unknown = sorted(set(args.stages) - set(names))
+    if unknown:
+        parser.error(f"unknown stage(s) {', '.join(unknown)}; choose from {', '.join(names)}")
+    sys.exit(1 if run(args.stages, args.force, args.jobs, args.dry_run) else 0)
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ingest.session_store import write_store_arrays, concat_stores
+
+# Vectorized version of the behaviour model in run_selenium.py, for load
+# tests with millions of sessions. Sessions are generated shard by shard as
+# flat arrays (the session store layout); every shard has its own random
+# stream derived from (seed, shard index), so the output only depends on the
+# seed and the shard size, never on the number of workers.
+PAGES = ["home", "products", "cart", "checkout"]
+DEFAULT_BOT_RATIO = 150 / 1150  # The mix run_selenium.py produces
+
+# Behaviour model: events per session and dwell times (ms, inclusive ranges)
+DEFAULT_MODEL = {
+    "human_events": (4, 8),
+    "bot_events": (2, 4),
+    "human_dwell_ms": (1500, 5000),
+    "bot_dwell_ms": (200, 1000),
+    "length_dist": "uniform",
+}
+
+
+def _session_lengths(rng, n, lo, hi, length_dist):
+    if length_dist == "uniform":
+        return rng.integers(lo, hi + 1, size=n)
+    # Geometric: at least lo events with a long tail whose mean is the midpoint of [lo, hi]
+    return lo + rng.geometric(1 / ((hi - lo) / 2 + 1), size=n) - 1
+
+
+def generate_shard(n_sessions, first_id, seed, shard_index, bot_ratio=DEFAULT_BOT_RATIO, model=DEFAULT_MODEL):
+    """
+    Generates one shard as (session_ids, timestamps, page_codes, offsets).
+
+    Humans click 4-8 uniformly random pages 1.5-5 s apart; bots visit 2-4
+    distinct pages in random order 0.2-1 s apart. Bots get "bot_<n>" ids
+    and humans integer ids; ids are numbered from first_id.
+    """
+    rng = np.random.default_rng([seed, shard_index])
+    is_bot = rng.random(n_sessions) < bot_ratio
+    n_bots = int(is_bot.sum())
+
+    lengths = np.empty(n_sessions, dtype=np.int64)
+    lengths[~is_bot] = _session_lengths(rng, n_sessions - n_bots, *model["human_events"], model["length_dist"])
+    # A bot never visits a page twice, so its sessions are capped at the number of pages
+    bot_lengths = _session_lengths(rng, n_bots, *model["bot_events"], model["length_dist"])
+    lengths[is_bot] = np.minimum(bot_lengths, len(PAGES))
+
+    offsets = np.zeros(n_sessions + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    n_events = int(offsets[-1])
+    seg = np.repeat(np.arange(n_sessions), lengths)
+    event_is_bot = is_bot[seg]
+
+    # Dwell times, accumulated per session into t_rel_ms
+    dwell = np.where(event_is_bot,
+                     rng.integers(model["bot_dwell_ms"][0], model["bot_dwell_ms"][1] + 1, size=n_events),
+                     rng.integers(model["human_dwell_ms"][0], model["human_dwell_ms"][1] + 1, size=n_events))
+    elapsed = np.cumsum(dwell)
+    before = np.concatenate([[0], elapsed])[offsets[:-1]]
+    timestamps = elapsed - np.repeat(before, lengths)
+
+    # Humans pick pages with replacement; bots walk a random permutation of the pages
+    page_codes = rng.integers(0, len(PAGES), size=n_events)
+    permutations = np.argsort(rng.random((n_bots, len(PAGES))), axis=1)
+    bot_number = np.cumsum(is_bot) - 1
+    position = np.arange(n_events) - np.repeat(offsets[:-1], lengths)
+    page_codes[event_is_bot] = permutations[bot_number[seg[event_is_bot]], position[event_is_bot]]
+
+    ids = np.arange(first_id, first_id + n_sessions)
+    session_ids = [f"bot_{i}" if bot else i for i, bot in zip(ids.tolist(), is_bot.tolist())]
+    return session_ids, timestamps, page_codes, offsets
+
+
+def write_jsonl_shard(path, session_ids, timestamps, page_codes, offsets):
+    """Writes a shard in the logs/sessions.jsonl format."""
+    # Every event's JSON text is assembled from a per-page prefix and its timestamp
+    prefixes = [f'{{"page": {json.dumps(page)}, "t_rel_ms": ' for page in PAGES]
+    events = [prefixes[p] + str(t) + "}" for p, t in zip(page_codes.tolist(), timestamps.tolist())]
+    bounds = offsets.tolist()
+    with open(path, "w") as f:
+        for i, session_id in enumerate(session_ids):
+            f.write(f'{{"session_id": {json.dumps(session_id)}, "events": ['
+                    f'{", ".join(events[bounds[i]:bounds[i + 1]])}]}}\n')
+
+
+def _write_shard(task):
+    path, fmt, n_sessions, first_id, seed, shard_index, bot_ratio, model = task
+    session_ids, timestamps, page_codes, offsets = generate_shard(n_sessions, first_id, seed, shard_index,
+                                                                  bot_ratio, model)
+    if fmt == "store":
+        # Stores use the sorted page codes make_features.py assigns
+        page_names = sorted(PAGES)
+        recode = np.asarray([page_names.index(page) for page in PAGES])
+        write_store_arrays(path, session_ids, timestamps, recode[page_codes], offsets, page_names)
+    else:
+        write_jsonl_shard(path, session_ids, timestamps, page_codes, offsets)
+    n_bots = sum(1 for session_id in session_ids if isinstance(session_id, str))
+    return path, n_bots, int(offsets[-1])
+
+
+def main(n_sessions, output="logs/sessions.jsonl", fmt="jsonl", n_workers=None, shard_size=1000000, seed=0,
+         bot_ratio=DEFAULT_BOT_RATIO, model=DEFAULT_MODEL, keep_shards=False):
+    """
+    Generates n_sessions into output, shard_size sessions per shard, using
+    n_workers processes. Shards are written in parallel as separate files
+    (or stores) next to the output and concatenated in shard order, unless
+    keep_shards is set.
+    """
+    n_workers = n_workers or os.cpu_count()
+    shards_dir = output + ".shards"
+    os.makedirs(shards_dir, exist_ok=True)
+    suffix = "" if fmt == "store" else ".jsonl"
+    tasks = []
+    for shard_index, first_id in enumerate(range(0, n_sessions, shard_size)):
+        path = os.path.join(shards_dir, f"part-{shard_index:05d}{suffix}")
+        tasks.append((path, fmt, min(shard_size, n_sessions - first_id), first_id, seed, shard_index,
+                      bot_ratio, model))
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(n_workers) as pool:
+        results = list(pool.map(_write_shard, tasks))
+    n_bots = sum(r[1] for r in results)
+    n_events = sum(r[2] for r in results)
+
+    if keep_shards:
+        output = shards_dir
+    else:
+        if fmt == "store":
+            if os.path.exists(output):
+                shutil.rmtree(output)
+            concat_stores([r[0] for r in results], output)
+        else:
+            with open(output, "w") as out:
+                for path, _, _ in results:
+                    with open(path) as part:
+                        shutil.copyfileobj(part, out, 1 << 20)
+        shutil.rmtree(shards_dir)
+    seconds = time.perf_counter() - start
+
+    print(f"Generated {n_sessions} total sessions ({n_sessions - n_bots} human, {n_bots} bot), "
+          f"{n_events} events in {seconds:.1f}s ({n_sessions / seconds:,.0f} sessions/s)")
+    print(f"Saved -> {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate large synthetic session logs with the human/bot model")
+    parser.add_argument("--sessions", type=int, default=1150)
+    parser.add_argument("--output", help="default: logs/sessions.jsonl, or logs/sessions.store with --format store")
+    parser.add_argument("--format", choices=["jsonl", "store"], default="jsonl")
+    parser.add_argument("--workers", type=int, help="generator processes (default: all cores)")
+    parser.add_argument("--shard-size", type=int, default=1000000, help="sessions per shard")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bot-ratio", type=float, default=DEFAULT_BOT_RATIO, help="share of bot sessions")
+    parser.add_argument("--human-events", type=int, nargs=2, default=DEFAULT_MODEL["human_events"],
+                        metavar=("MIN", "MAX"), help="events per human session")
+    parser.add_argument("--bot-events", type=int, nargs=2, default=DEFAULT_MODEL["bot_events"],
+                        metavar=("MIN", "MAX"), help=f"events per bot session (at most {len(PAGES)})")
+    parser.add_argument("--length-dist", choices=["uniform", "geometric"], default="uniform",
+                        help="uniform over [MIN, MAX], or geometric from MIN with mean (MIN + MAX) / 2")
+    parser.add_argument("--keep-shards", action="store_true",
+                        help="leave the shards in <output>.shards instead of concatenating them")
+    args = parser.parse_args()
+    model = dict(DEFAULT_MODEL, human_events=tuple(args.human_events), bot_events=tuple(args.bot_events),
+                 length_dist=args.length_dist)
+    output = args.output or ("logs/sessions.store" if args.format == "store" else "logs/sessions.jsonl")
+    main(args.sessions, output, args.format, args.workers, args.shard_size, args.seed, args.bot_ratio, model,
+         args.keep_shards)
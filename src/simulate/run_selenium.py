@@ -1,10 +1,7 @@
-from faker import Faker
 import random
 import time
 import json
 
-fake = Faker()
-
 def generate_session(session_id, is_bot=False):
     """Generates a session with events. Bots have more predictable, rapid behavior."""
     pages = ["home", "products", "cart", "checkout"]
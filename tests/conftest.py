@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The scripts under src/ import their neighbours directly, so each directory
+# goes on the path the way running the script would put it there
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+for name in ("features", "ingest", "models", "eval", "simulate"):
+    sys.path.insert(0, os.path.join(SRC_DIR, name))
+sys.path.insert(0, SRC_DIR)
+
+from generate_traffic import DEFAULT_MODEL, generate_shard, write_jsonl_shard
+
+
+def write_log(path, n_sessions, seed=0, **model):
+    """Writes a synthetic logs/sessions.jsonl and returns its sessions."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_jsonl_shard(path, *generate_shard(n_sessions, 0, seed, 0, model=dict(DEFAULT_MODEL, **model)))
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """An empty directory with the logs/ data/ artifacts/ layout the scripts expect, as the cwd."""
+    for sub in ("logs", "data", "artifacts/models", "artifacts/reports"):
+        os.makedirs(tmp_path / sub)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def long_sessions(workdir):
+    """Sessions of up to ~100 events with a long tail, written to logs/sessions.jsonl."""
+    return write_log("logs/sessions.jsonl", 2000, human_events=(4, 40), length_dist="geometric")
@@ -0,0 +1,66 @@
+import filecmp
+import json
+
+import pytest
+
+import make_features
+from batch_features import FEATURE_COLS, compute_features_batch, flatten_sessions
+from make_features import calculate_features, check_batch_engine
+from session_store import jsonl_to_store
+
+
+def test_batch_engine_matches_calculate_features_exactly(long_sessions):
+    page_map = {page: i for i, page in enumerate(sorted({e["page"] for s in long_sessions for e in s["events"]}))}
+    deviations = check_batch_engine(long_sessions, page_map, rtol=0)
+    assert all(dev == 0.0 for dev in deviations.values())
+
+
+@pytest.mark.parametrize("events", [
+    [],
+    [{"page": "home", "t_rel_ms": 0}],
+    [{"page": "home", "t_rel_ms": 1200}, {"page": "home", "t_rel_ms": 1200}],
+])
+def test_batch_engine_edge_cases(events):
+    page_map = {"home": 0}
+    _, timestamps, page_codes, offsets = flatten_sessions([{"session_id": 1, "events": events}], page_map)
+    batch = compute_features_batch(timestamps, page_codes, offsets, n_pages=1)
+    expected = calculate_features(events, page_map)
+    for col in FEATURE_COLS:
+        assert float(batch[col][0]) == float(expected[col]), col
+
+
+def test_batch_and_reference_engines_write_the_same_files(long_sessions, workdir):
+    make_features.main(engine="reference")
+    for name in ("features.csv", "sequences.jsonl"):
+        (workdir / "data" / name).rename(workdir / name)
+    make_features.main(engine="batch")
+    for name in ("features.csv", "sequences.jsonl"):
+        assert filecmp.cmp(workdir / name, workdir / "data" / name, shallow=False), name
+
+
+@pytest.mark.parametrize("existing_page_map", [True, False])
+def test_store_path_writes_the_same_files_as_the_default_path(long_sessions, workdir, existing_page_map):
+    make_features.main()
+    expected = {name: (workdir / "data" / name).read_text() for name in ("features.csv", "sequences.jsonl")}
+    page_map = (workdir / "artifacts/models/page_map.json").read_text()
+    if not existing_page_map:
+        (workdir / "artifacts/models/page_map.json").unlink()
+
+    jsonl_to_store("logs/sessions.jsonl", "logs/sessions.store")
+    make_features.main_store("logs/sessions.store")
+    for name, text in expected.items():
+        assert (workdir / "data" / name).read_text() == text, name
+    assert (workdir / "artifacts/models/page_map.json").read_text() == page_map
+
+
+def test_store_path_keeps_an_existing_page_map(long_sessions, workdir):
+    make_features.main()
+    expected = (workdir / "data/sequences.jsonl").read_text()
+    page_map = (workdir / "artifacts/models/page_map.json").read_text()
+
+    # A store whose own codes are in another order is translated to the page map
+    reversed_map = {page: i for i, page in enumerate(sorted(json.loads(page_map), reverse=True))}
+    jsonl_to_store("logs/sessions.jsonl", "logs/sessions.store", reversed_map)
+    make_features.main_store("logs/sessions.store")
+    assert (workdir / "data/sequences.jsonl").read_text() == expected
+    assert (workdir / "artifacts/models/page_map.json").read_text() == page_map
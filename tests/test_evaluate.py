@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import evaluate
+
+
+@pytest.fixture
+def scores(workdir):
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame({"session_id": [f"s{i}" for i in range(n)],
+                       "iforest_score": rng.random(n), "lstm_score": rng.random(n),
+                       # Repeated values check that ties keep file order
+                       "hybrid_score": rng.integers(0, 200, n) / 200})
+    df.loc[rng.choice(n, 60, replace=False), "hybrid_score"] = np.nan
+    df.loc[45:90, "lstm_score"] = np.nan  # A whole chunk of the column without values
+    df.to_csv("artifacts/scores.csv", index=False)
+    return df
+
+
+@pytest.mark.parametrize("top_n,chunk_size", [(10, 40), (1000, 40), (25, 7)])
+def test_stream_ranks_like_a_full_sort_with_unscored_rows(scores, top_n, chunk_size):
+    evaluate.main_stream(top_n=top_n, chunk_size=chunk_size)
+    ranked = pd.read_csv("artifacts/reports/ranked_anomalies.csv")
+    expected = scores.dropna(subset=["hybrid_score"]).sort_values("hybrid_score", ascending=False, kind="stable")
+    assert ranked["session_id"].tolist() == expected["session_id"].head(top_n).tolist()
+
+
+def test_stream_summary_matches_describe(scores):
+    stats = evaluate.RunningStats()
+    numeric = scores.select_dtypes("number")
+    for start in range(0, len(scores), 40):
+        stats.update(numeric.iloc[start:start + 40])
+    expected = numeric.describe().loc[["count", "mean", "std", "min", "max"]]
+    pd.testing.assert_frame_equal(stats.summary(), expected, check_exact=False, rtol=1e-9)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+import make_features
+from feature_accumulator import ACCUMULATOR_RTOL, SessionFeatureAccumulator
+from make_features import calculate_features, check_accumulator
+
+
+def test_accumulator_matches_calculate_features_within_tolerance(long_sessions):
+    page_map = {page: i for i, page in enumerate(sorted({e["page"] for s in long_sessions for e in s["events"]}))}
+    deviations = check_accumulator(long_sessions, page_map)
+    assert max(deviations.values()) <= ACCUMULATOR_RTOL
+    assert deviations["session_duration"] == deviations["n_events"] == 0.0
+
+
+def test_partial_sessions_score_like_their_prefix(long_sessions):
+    session = max(long_sessions, key=lambda s: len(s["events"]))
+    page_map = {page: i for i, page in enumerate(sorted({e["page"] for e in session["events"]}))}
+    accumulator = SessionFeatureAccumulator(page_map)
+    for n, event in enumerate(session["events"], start=1):
+        accumulator.add(event["page"], event["t_rel_ms"])
+        expected = calculate_features(session["events"][:n], page_map)
+        actual = accumulator.features()
+        assert actual.pop("click_sequence") == expected.pop("click_sequence")
+        for col, value in actual.items():
+            assert np.isclose(value, expected[col], rtol=ACCUMULATOR_RTOL, atol=0), (n, col)
+
+
+def test_incremental_engine_writes_features_within_tolerance(long_sessions, workdir):
+    make_features.main(engine="batch")
+    expected = pd.read_csv("data/features.csv")
+    expected_sequences = (workdir / "data/sequences.jsonl").read_text()
+    make_features.main(engine="incremental")
+    actual = pd.read_csv("data/features.csv")
+    pd.testing.assert_frame_equal(actual[["session_id", "session_duration", "n_events"]],
+                                  expected[["session_id", "session_duration", "n_events"]])
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=ACCUMULATOR_RTOL, atol=0)
+    assert (workdir / "data/sequences.jsonl").read_text() == expected_sequences
@@ -0,0 +1,40 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+import isolation_forest
+from calibration import MODEL_PATHS, load_calibration
+from conftest import write_log
+from iforest_parallel import parallel_raw_scores
+from make_features import main as make_features
+
+
+@pytest.fixture
+def features(workdir):
+    write_log("logs/sessions.jsonl", 3000)
+    make_features()
+    return pd.read_csv("data/features.csv")[isolation_forest.feature_cols]
+
+
+def _train(n_jobs):
+    isolation_forest.main(n_jobs=n_jobs)
+    return joblib.load(MODEL_PATHS["iforest"]), load_calibration(check_versions=False)["iforest"]
+
+
+def test_parallel_training_matches_serial(features):
+    serial_model, serial_calibration = _train(1)
+    parallel_model, parallel_calibration = _train(2)
+
+    assert parallel_model.n_jobs is None
+    assert np.array_equal(parallel_model.decision_function(features), serial_model.decision_function(features))
+    # The pickles (and so the model digests) differ, the score range does not
+    for key in ("lo", "hi"):
+        assert parallel_calibration[key] == serial_calibration[key]
+
+
+@pytest.mark.parametrize("n_workers", [1, 3])
+def test_parallel_scoring_matches_serial(features, n_workers):
+    model, _ = _train(1)
+    scores = parallel_raw_scores(features.to_numpy(dtype=np.float64), n_workers=n_workers, chunk_size=700)
+    assert np.array_equal(scores, -model.decision_function(features))
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+keras = pytest.importorskip("tensorflow").keras
+
+from lstm_autoencoder import MAX_SEQ_LENGTH, build_masked_model, build_model
+from lstm_numpy import NumpyLSTMAutoencoder, export_weights
+from sequence_batching import PAD_VALUE
+
+
+def _exported(model, tmp_path):
+    keras_path, npz_path = str(tmp_path / "lstm_ae.keras"), str(tmp_path / "lstm_ae.npz")
+    model.save(keras_path)
+    export_weights(keras_path, npz_path)
+    return keras.models.load_model(keras_path, compile=False), NumpyLSTMAutoencoder.load(npz_path)
+
+
+def _batch(rng, n, timesteps, pad_from=None):
+    X = rng.integers(1, 7, size=(n, timesteps, 1)).astype(np.float32)
+    if pad_from is not None:
+        for row, length in enumerate(pad_from):
+            X[row, length:] = PAD_VALUE
+    return X
+
+
+def test_fixed_model_forward_pass_matches_keras(tmp_path):
+    keras.utils.set_random_seed(0)
+    keras_model, numpy_model = _exported(build_model(), tmp_path)
+    X = _batch(np.random.default_rng(0), 64, MAX_SEQ_LENGTH)
+    np.testing.assert_allclose(numpy_model.predict_on_batch(X), keras_model.predict_on_batch(X), rtol=0, atol=1e-5)
+
+
+def test_masked_model_forward_pass_matches_keras(tmp_path):
+    keras.utils.set_random_seed(0)
+    keras_model, numpy_model = _exported(build_masked_model(), tmp_path)
+    rng = np.random.default_rng(1)
+    X = _batch(rng, 64, 12, pad_from=rng.integers(1, 13, 64))
+    expected = keras_model.predict_on_batch(X)
+    actual = numpy_model.predict_on_batch(X)
+    # Only real steps enter the reconstruction error
+    mask = X[..., 0] != PAD_VALUE
+    np.testing.assert_allclose(actual[mask], expected[mask], rtol=0, atol=1e-5)
@@ -0,0 +1,29 @@
+import pytest
+
+from serve import validate_sessions
+
+
+def _session(*events):
+    return {"session_id": 1, "events": [{"page": page, "t_rel_ms": t} for page, t in events]}
+
+
+def test_valid_sessions_pass():
+    sessions = [_session(("home", 0), ("cart", 1200)), _session(("home", 1500.0))]
+    assert validate_sessions(sessions) == sessions
+    assert validate_sessions(sessions[0]) == [sessions[0]]
+
+
+@pytest.mark.parametrize("payload,message", [
+    ({"events": []}, "needs 'session_id'"),
+    ({"session_id": True, "events": [{"page": "home", "t_rel_ms": 0}]}, "'session_id'"),
+    ({"session_id": 1, "events": {"page": "home"}}, "must be a list"),
+    ({"session_id": 1, "events": []}, "is empty"),
+    ({"session_id": 1, "events": [{"t_rel_ms": 0}]}, "string 'page'"),
+    (_session(("home", "soon")), "'t_rel_ms'"),
+    (_session(("home", True)), "'t_rel_ms'"),
+    (_session(("home", 1200.5)), "whole number"),
+    (_session(("home", float("nan"))), "whole number"),
+])
+def test_malformed_sessions_are_rejected(payload, message):
+    with pytest.raises(ValueError, match=message):
+        validate_sessions([_session(("home", 0)), payload])